@@ -0,0 +1,69 @@
+"""
+Shows what a burst of logins does to the latency of unrelated requests in a
+gevent worker, with password hashing done inline and in the hashing pool.
+
+A probe greenlet stands in for the unrelated pages: it repeatedly sleeps for
+10ms, and anything past 10ms before it wakes up is time it spent waiting for the
+event loop while the logins were hashing.
+
+Run from the repository root:
+    PYTHONPATH=netsocadmin python benchmarks/hashing_load.py
+"""
+from gevent import monkey
+monkey.patch_all()
+
+# stdlib
+import statistics  # noqa: E402
+import time  # noqa: E402
+
+# lib
+import gevent  # noqa: E402
+
+# local
+import config  # noqa: E402
+import hashing  # noqa: E402
+
+LOGINS = 200
+PROBE_INTERVAL = 0.01
+
+
+def probe(delays: list, done: gevent.event.Event):
+    while not done.is_set():
+        start = time.perf_counter()
+        gevent.sleep(PROBE_INTERVAL)
+        delays.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+def run(workers: int, stored_hash: str):
+    config.HASHING_WORKERS = workers
+    hashing._reset_executor()
+    # make sure the pool's processes are running before measuring
+    hashing.verify_password("hunter2", stored_hash)
+
+    delays, done = [], gevent.event.Event()
+    prober = gevent.spawn(probe, delays, done)
+    gevent.sleep(PROBE_INTERVAL * 5)
+    start = time.perf_counter()
+    gevent.joinall([gevent.spawn(hashing.verify_password, "hunter2", stored_hash) for _ in range(LOGINS)])
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+
+    delays.sort()
+    print(
+        f"{'inline' if workers == 0 else f'{workers} workers':<12} "
+        f"{elapsed:8.2f} {statistics.median(delays) * 1000:10.2f} {delays[int(len(delays) * 0.99)] * 1000:10.2f}"
+    )
+
+
+def main():
+    stored_hash = hashing.hash_password("hunter2")
+    print(f"{LOGINS} logins, probe sleeping {PROBE_INTERVAL * 1000:.0f}ms at a time")
+    print(f"{'hashing':<12} {'burst s':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    for workers in [0, 1, 2, 4]:
+        run(workers, stored_hash)
+    hashing._reset_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Measures how long it takes to open and bind an LDAP connection with each server
+info mode, against a small stand-in LDAP server running on localhost.
+
+The stand-in answers binds, unbinds and searches. Searches for the root DSE and
+the subschema entry get the OpenLDAP 2.4 definitions which ship with ldap3, so
+the schema download is the same size as a real slapd's.
+
+Run from the repository root:
+    PYTHONPATH=netsocadmin python benchmarks/ldap_bind.py
+"""
+# stdlib
+import json
+import socketserver
+import statistics
+import threading
+import time
+
+# lib
+import ldap3
+from ldap3.protocol import rfc4511
+from ldap3.protocol.schemas.slapd24 import slapd_2_4_dsa_info, slapd_2_4_schema
+from pyasn1.codec.ber import decoder, encoder
+
+# local
+import ldap_tools
+
+ITERATIONS = 200
+
+ENTRIES = {
+    "": json.loads(slapd_2_4_dsa_info)["raw"],
+    "cn=subschema": json.loads(slapd_2_4_schema)["raw"],
+}
+
+
+def _result(cls, code: int = 0):
+    result = cls()
+    result["resultCode"] = rfc4511.ResultCode(code)
+    result["matchedDN"] = rfc4511.LDAPDN("")
+    result["diagnosticMessage"] = rfc4511.LDAPString("")
+    return result
+
+
+def _entry(dn: str, attributes: dict):
+    entry = rfc4511.SearchResultEntry()
+    entry["object"] = rfc4511.LDAPDN(dn)
+    attribute_list = rfc4511.PartialAttributeList()
+    for i, (name, values) in enumerate(attributes.items()):
+        attribute = rfc4511.PartialAttribute()
+        attribute["type"] = rfc4511.AttributeDescription(name)
+        vals = rfc4511.Vals()
+        for j, value in enumerate(values):
+            vals.setComponentByPosition(j, rfc4511.AttributeValue(str(value)))
+        attribute["vals"] = vals
+        attribute_list.setComponentByPosition(i, attribute)
+    entry["attributes"] = attribute_list
+    return entry
+
+
+def _message(message_id: int, name: str, op) -> bytes:
+    message = rfc4511.LDAPMessage()
+    message["messageID"] = rfc4511.MessageID(message_id)
+    protocol_op = rfc4511.ProtocolOp()
+    protocol_op.setComponentByName(name, op)
+    message["protocolOp"] = protocol_op
+    return encoder.encode(message)
+
+
+def _read_message(sock_file) -> bytes:
+    header = sock_file.read(2)
+    if len(header) < 2:
+        return b""
+    length = header[1]
+    extra = b""
+    if length & 0x80:
+        extra = sock_file.read(length & 0x7f)
+        length = int.from_bytes(extra, "big")
+    return header + extra + sock_file.read(length)
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            data = _read_message(self.rfile)
+            if not data:
+                return
+            request, _ = decoder.decode(data, asn1Spec=rfc4511.LDAPMessage())
+            message_id = int(request["messageID"])
+            op = request["protocolOp"]
+            name = op.getName()
+            if name == "bindRequest":
+                self.wfile.write(_message(message_id, "bindResponse", _result(rfc4511.BindResponse)))
+            elif name == "searchRequest":
+                base = str(op[name]["baseObject"]).lower()
+                if base in ENTRIES:
+                    self.wfile.write(_message(message_id, "searchResEntry", _entry(base, ENTRIES[base])))
+                self.wfile.write(_message(message_id, "searchResDone", _result(rfc4511.SearchResultDone)))
+            elif name == "unbindRequest":
+                return
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def time_binds(make_server) -> list:
+    """
+    Opens and binds ITERATIONS connections, returning how long each one took.
+    make_server is called before every connection so that a mode which builds a
+    new server each time (like the old per-request code) is measured fairly.
+    """
+    timings = []
+    for _ in range(ITERATIONS):
+        server = make_server()
+        start = time.perf_counter()
+        conn = ldap_tools.make_connection(server)
+        timings.append(time.perf_counter() - start)
+        conn.unbind()
+    return timings
+
+
+def main():
+    server = StandInServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"127.0.0.1:{server.server_address[1]}"
+
+    cached = ldap_tools.make_server("cached", host)
+    offline = ldap_tools.make_server("offline", host)
+    modes = {
+        # what every request used to do: a new server object reading everything
+        "per-request ALL": lambda: ldap3.Server(host, get_info=ldap3.ALL),
+        "cached": lambda: cached,
+        "offline": lambda: offline,
+    }
+    print(f"{'mode':<16} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, make_server in modes.items():
+        timings = sorted(time_binds(make_server))
+        print(
+            f"{name:<16} {statistics.mean(timings) * 1000:8.3f} "
+            f"{timings[len(timings) // 2] * 1000:8.3f} {timings[int(len(timings) * 0.99)] * 1000:8.3f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares how long it takes to put WordPress into a user's public_html the old
+way, by running tar -xzf and then chown -R over the result, with the streaming
+extractor, which sets ownership as it writes each file.
+
+A stand-in release is generated with the same shape as WordPress (about 2000
+files in a few hundred directories, mostly small PHP files). Ownership is set to
+the current user so the benchmark doesn't need root, which still makes chown -R
+walk and chown every file.
+
+Run from the repository root:
+    PYTHONPATH=netsocadmin python benchmarks/wordpress_extract.py
+"""
+# stdlib
+import io
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tarfile
+import tempfile
+import time
+
+# local
+import wordpress_install
+
+ITERATIONS = 10
+DIRECTORIES = 250
+FILES = 2000
+
+
+def build_release(path: str):
+    rand = random.Random(0)
+    directories = ["wordpress"]
+    with tarfile.open(path, "w:gz") as tar:
+        for i in range(DIRECTORIES):
+            name = f"{rand.choice(directories)}/dir{i}"
+            directories.append(name)
+        for name in directories:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            tar.addfile(info)
+        for i in range(FILES):
+            data = os.urandom(rand.choice([512, 2048, 8192, 32768]))
+            info = tarfile.TarInfo(f"{rand.choice(directories)}/file{i}.php")
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+
+
+def tar_and_chown(archive: str, target: str):
+    subprocess.check_call(["tar", "-xzf", archive, "-C", target])
+    subprocess.check_call(["chown", "-R", f"{os.getuid()}:{os.getgid()}", os.path.join(target, "wordpress")])
+
+
+def streaming(archive: str, target: str):
+    wordpress_install.extract_from_tar(archive, target, os.getuid(), os.getgid())
+
+
+def run(name, install, archive: str, tmp: str):
+    times = []
+    for _ in range(ITERATIONS):
+        target = tempfile.mkdtemp(dir=tmp)
+        start = time.perf_counter()
+        install(archive, target)
+        times.append(time.perf_counter() - start)
+        shutil.rmtree(target)
+    print(f"{name:<16} {statistics.median(times) * 1000:10.1f} {min(times) * 1000:10.1f}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = os.path.join(tmp, "wordpress.tar.gz")
+        build_release(archive)
+        print(f"{FILES} files in {DIRECTORIES} directories, {os.path.getsize(archive) / 1e6:.1f}MB compressed")
+        print(f"{'install':<16} {'p50 ms':>10} {'min ms':>10}")
+        run("tar + chown -R", tar_and_chown, archive, tmp)
+        run("streaming", streaming, archive, tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+This file lets users look inside their backups and get single files or
+directories back out of them, without downloading the whole archive.
+
+The first time a backup is browsed its members are read into an index in the
+local SQLite database config.BACKUP_INDEX_DB_NAME: the path, type, size, mode,
+mtime and where in the uncompressed tar stream each member's data starts. After
+that, listing a directory is an indexed query rather than a pass over the
+archive. An archive's index is thrown away and rebuilt if its size or mtime
+changes, and dropped once the archive itself is gone. Members are written to the
+index in batches as the archive is read, and the index is only used once the
+last batch is in.
+
+Restoring reads from the archive at the offsets in the index. Backups are
+gzipped, so reaching a member still means decompressing everything before it on
+the server, but only the member itself is sent to the user. Directories are sent
+as an uncompressed tar of just that subtree, built as it is streamed.
+
+Both decompress potentially gigabytes without doing any cooperative I/O, so
+under gevent they would hold up every other request on the worker. Indexing and
+every seek and read of an archive are done with native_thread.call instead.
+"""
+# stdlib
+import contextlib
+import gzip
+import itertools
+import os
+import posixpath
+import sqlite3
+import tarfile
+import time
+import typing
+
+# lib
+import structlog as logging
+
+# local
+import config
+import local_db
+import native_thread
+
+logger = logging.getLogger("netsocadmin.backup_browser")
+
+FILE = "f"
+DIRECTORY = "d"
+SYMLINK = "l"
+
+CHUNK_SIZE = 1 << 16
+
+
+def _create_index(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE archives(
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            indexed_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE members(
+            archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+            path TEXT NOT NULL,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mode INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            offset INTEGER,
+            linkname TEXT,
+            PRIMARY KEY (archive_id, path)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX members_parent ON members(archive_id, parent, name)")
+
+
+# never reorder or remove these, only add to the end
+MIGRATIONS = [
+    _create_index,
+]
+
+_ARCHIVE = "SELECT id, size, mtime_ns FROM archives WHERE path = ?"
+_DROP_ARCHIVE = "DELETE FROM archives WHERE path = ?"
+_DROP_MEMBERS = "DELETE FROM members WHERE archive_id IN (SELECT id FROM archives WHERE path = ?)"
+_ARCHIVES = "SELECT path FROM archives"
+_ADD_ARCHIVE = "INSERT INTO archives(path, size, mtime_ns, indexed_at) VALUES (?, ?, ?, ?)"
+# an archive's size is only filled in once every member is in its index, see build_index
+_COMPLETE_ARCHIVE = "UPDATE archives SET size = ?, indexed_at = ? WHERE id = ?"
+_INCOMPLETE = -1
+_ADD_MEMBER = (
+    "INSERT OR REPLACE INTO members(archive_id, path, parent, name, type, size, mode, mtime, offset, linkname) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_ADD_DIRECTORY = (
+    "INSERT OR IGNORE INTO members(archive_id, path, parent, name, type, size, mode, mtime, offset, linkname) "
+    "VALUES (?, ?, ?, ?, 'd', 0, 493, 0, NULL, NULL)"  # 493 is 0o755
+)
+_MEMBER = "SELECT path, name, type, size, mode, mtime, offset, linkname FROM members WHERE archive_id = ? AND path = ?"
+_CHILDREN = (
+    "SELECT path, name, type, size, mode, mtime, offset, linkname FROM members "
+    "WHERE archive_id = ? AND parent = ? ORDER BY name"
+)
+# everything under a directory, in archive order so it can be read in one pass
+_SUBTREE = (
+    "SELECT path, name, type, size, mode, mtime, offset, linkname FROM members "
+    "WHERE archive_id = ? AND (path = ? OR substr(path, 1, ?) = ?) ORDER BY offset IS NOT NULL, offset, path"
+)
+
+
+class BackupBrowserException(Exception):
+    pass
+
+
+class Member(typing.NamedTuple):
+    path: str
+    name: str
+    type: str
+    size: int
+    mode: int
+    mtime: int
+    # where the member's data starts in the uncompressed tar, None for directories the archive doesn't list itself
+    offset: typing.Optional[int]
+    linkname: typing.Optional[str]
+
+
+def _connection() -> sqlite3.Connection:
+    return local_db.connection(config.BACKUP_INDEX_DB_NAME, MIGRATIONS)
+
+
+def _normalise(name: str) -> str:
+    """
+    Turns a member name or a path from the user into the form used in the index:
+    relative, without "./" or a trailing slash, and "" for the top of the archive.
+    """
+    path = posixpath.normpath("/" + name).lstrip("/")
+    return "" if path == "." else path
+
+
+def _archive_id(archive: str) -> typing.Optional[int]:
+    """
+    Returns the id of the archive's index, or None if it hasn't been indexed
+    since it last changed.
+    """
+    st = os.stat(archive)
+    row = _connection().execute(_ARCHIVE, (archive,)).fetchone()
+    if row is None or row[1] != st.st_size or row[2] != st.st_mtime_ns:
+        return None
+    return row[0]
+
+
+def is_indexed(archive: str) -> bool:
+    return _archive_id(archive) is not None
+
+
+@contextlib.contextmanager
+def _transaction(conn: sqlite3.Connection) -> typing.Iterator[None]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _drop(conn: sqlite3.Connection, archive: str):
+    conn.execute(_DROP_MEMBERS, (archive,))
+    conn.execute(_DROP_ARCHIVE, (archive,))
+
+
+def _read_members(archive: str, parents: typing.Set[str]) -> typing.Iterator[tuple]:
+    """
+    Reads the archive from start to finish, yielding a row for each member
+    (without the archive id) and adding the path of every directory with
+    something in it to parents.
+    """
+    with tarfile.open(archive, "r|gz", bufsize=CHUNK_SIZE) as tar:
+        for info in tar:
+            path = _normalise(info.name)
+            if info.isfile():
+                kind = FILE
+            elif info.isdir():
+                kind = DIRECTORY
+            elif info.issym():
+                kind = SYMLINK
+            else:
+                continue
+            if not path:
+                continue
+            parent = ancestor = posixpath.dirname(path)
+            while ancestor and ancestor not in parents:
+                parents.add(ancestor)
+                ancestor = posixpath.dirname(ancestor)
+            yield (
+                path, parent, posixpath.basename(path), kind,
+                info.size if kind == FILE else 0, info.mode & 0o7777, int(info.mtime),
+                info.offset_data, info.linkname if kind == SYMLINK else None,
+            )
+
+
+def _build_index(archive: str):
+    st = os.stat(archive)
+    start = time.monotonic()
+    conn = _connection()
+    with _transaction(conn):
+        _drop(conn, archive)
+        archive_id = conn.execute(_ADD_ARCHIVE, (archive, _INCOMPLETE, st.st_mtime_ns, int(time.time()))).lastrowid
+    parents: typing.Set[str] = set()
+    count = 0
+    try:
+        with contextlib.closing(_read_members(archive, parents)) as rows:
+            while True:
+                batch = [(archive_id, *row) for row in itertools.islice(rows, config.BACKUP_INDEX_BATCH_SIZE)]
+                if not batch:
+                    break
+                with _transaction(conn):
+                    conn.executemany(_ADD_MEMBER, batch)
+                count += len(batch)
+        with _transaction(conn):
+            conn.executemany(_ADD_DIRECTORY, (
+                (archive_id, parent, posixpath.dirname(parent), posixpath.basename(parent)) for parent in parents
+            ))
+            conn.execute(_COMPLETE_ARCHIVE, (st.st_size, int(time.time()), archive_id))
+    except BaseException:
+        # don't leave the members read so far lying about until the archive is indexed again
+        with _transaction(conn):
+            _drop(conn, archive)
+        raise
+    logger.info(f"indexed {count} members of {archive} in {time.monotonic() - start:.1f}s")
+    prune()
+
+
+def build_index(archive: str):
+    """
+    build_index reads every member of archive into the index, replacing any
+    index it already had. Directories which only appear as the parents of other
+    members are added too, so every level can be browsed.
+
+    It runs on a native thread, and writes the members in batches of
+    config.BACKUP_INDEX_BATCH_SIZE as it reads them, so neither the archive's
+    whole listing nor the database's write lock is held while a large backup is
+    read. The index isn't used until the last batch is written.
+    """
+    native_thread.call(_build_index, archive)
+
+
+def prune() -> int:
+    """
+    prune drops the indexes of archives which no longer exist, e.g. backups
+    which have been rotated out, so the index doesn't grow forever. It is run
+    whenever an archive is indexed.
+
+    :returns how many archives' indexes were dropped
+    """
+    conn = _connection()
+    gone = [path for (path,) in conn.execute(_ARCHIVES).fetchall() if not os.path.exists(path)]
+    if not gone:
+        return 0
+    with _transaction(conn):
+        for path in gone:
+            _drop(conn, path)
+    logger.info(f"dropped the indexes of {len(gone)} backups which no longer exist")
+    return len(gone)
+
+
+def _require_index(archive: str) -> int:
+    archive_id = _archive_id(archive)
+    if archive_id is None:
+        raise BackupBrowserException(f"{archive} has not been indexed")
+    return archive_id
+
+
+def member(archive: str, path: str) -> typing.Optional[Member]:
+    """
+    member returns the member at path in an indexed archive, or None if there
+    isn't one. The top of the archive is a directory with the path "".
+    """
+    archive_id = _require_index(archive)
+    path = _normalise(path)
+    if not path:
+        return Member("", "", DIRECTORY, 0, 0o755, 0, None, None)
+    row = _connection().execute(_MEMBER, (archive_id, path)).fetchone()
+    return Member(*row) if row else None
+
+
+def list_directory(archive: str, path: str) -> typing.List[Member]:
+    """
+    list_directory returns the members directly inside the directory at path in
+    an indexed archive, sorted by name.
+    """
+    archive_id = _require_index(archive)
+    rows = _connection().execute(_CHILDREN, (archive_id, _normalise(path))).fetchall()
+    return [Member(*row) for row in rows]
+
+
+def _read_data(fh: typing.BinaryIO, archive: str, found: Member) -> typing.Iterator[bytes]:
+    # gzip only seeks forward by decompressing up to the offset, so callers read members in archive order
+    native_thread.call(fh.seek, found.offset)
+    remaining = found.size
+    while remaining > 0:
+        chunk = native_thread.call(fh.read, min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise BackupBrowserException(f"{archive} ended in the middle of {found.path}")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def read_file(archive: str, found: Member) -> typing.Iterator[bytes]:
+    """
+    read_file streams the contents of a file member out of the archive.
+    """
+    with gzip.open(archive, "rb") as fh:
+        yield from _read_data(fh, archive, found)
+
+
+def _tar_header(found: Member, base: str) -> bytes:
+    info = tarfile.TarInfo(posixpath.relpath(found.path, base) if base else found.path)
+    info.mode = found.mode
+    info.mtime = found.mtime
+    if found.type == DIRECTORY:
+        info.type = tarfile.DIRTYPE
+    elif found.type == SYMLINK:
+        info.type = tarfile.SYMTYPE
+        info.linkname = found.linkname
+    else:
+        info.size = found.size
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+
+def read_subtree(archive: str, directory: Member) -> typing.Iterator[bytes]:
+    """
+    read_subtree streams an uncompressed tar of everything under a directory
+    member, with paths relative to the directory's parent so it extracts as a
+    single directory. The archive is read once, from start to finish at most.
+    """
+    archive_id = _require_index(archive)
+    base = posixpath.dirname(directory.path)
+    prefix = directory.path + "/" if directory.path else ""
+    rows = _connection().execute(_SUBTREE, (archive_id, directory.path, len(prefix), prefix)).fetchall()
+    with gzip.open(archive, "rb") as fh:
+        for row in rows:
+            found = Member(*row)
+            if not found.path:
+                continue
+            yield _tar_header(found, base)
+            if found.type != FILE:
+                continue
+            yield from _read_data(fh, archive, found)
+            if found.size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - found.size % tarfile.BLOCKSIZE)
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
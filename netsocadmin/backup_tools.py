@@ -1,5 +1,13 @@
 """
 This file contains funtions which are used to manage a user's backups.
+
+/backups is a network volume, so listing it is slow. Each user's backups are
+kept in a catalogue in memory, along with the mtime of the directory they were
+listed from. A directory's mtime changes whenever a backup is added, removed or
+renamed in it, so as long as it hasn't changed the catalogue is used without
+listing the directory again, at the cost of a single stat. Catalogues are also
+dropped after config.BACKUP_CATALOGUE_TTL seconds in case a backup is rewritten
+in place.
 """
 # stdlib
 import os
@@ -7,19 +15,76 @@ import re
 import typing
 
 # local
+import cache
 import config
 
+TIMEFRAMES = ("weekly", "monthly")
 
-def list_backups(username: str, timeframe: str) -> typing.List[str]:
+_BACKUP_NAME = re.compile(r"^([0-9]{4}-[0-9]{2}-[0-9]{2})\.tgz$")
+
+
+class BackupEntry(typing.NamedTuple):
+    # YYYY-MM-DD
+    date: str
+    size: int
+    mtime: float
+
+
+class Catalogue(typing.NamedTuple):
+    # newest first
+    weekly: typing.List[BackupEntry]
+    monthly: typing.List[BackupEntry]
+
+
+# (username, timeframe) -> (directory mtime_ns, entries)
+_listings = cache.TTLCache(config.BACKUP_CATALOGUE_TTL, maxsize=config.BACKUP_CATALOGUE_SIZE)
+
+
+def _scan(backups_base_dir: str) -> typing.List[BackupEntry]:
+    entries = []
+    with os.scandir(backups_base_dir) as it:
+        for entry in it:
+            match = _BACKUP_NAME.match(entry.name)
+            if match and entry.is_file():
+                st = entry.stat()
+                entries.append(BackupEntry(match.group(1), st.st_size, st.st_mtime))
+    entries.sort(reverse=True)
+    return entries
+
+
+def _listing(username: str, timeframe: str) -> typing.List[BackupEntry]:
     backups_base_dir = os.path.join(config.BACKUPS_DIR, username, timeframe)
-    if not os.path.exists(backups_base_dir):
+    try:
+        mtime = os.stat(backups_base_dir).st_mtime_ns
+    except FileNotFoundError:
         os.makedirs(backups_base_dir)
-    all_backups = sorted(
-        [
-            b.strip(".tgz")
-            for b in os.listdir(backups_base_dir)
-            if re.match(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}\.tgz", b)
-        ],
-        reverse=True,
-    )
-    return all_backups
+        mtime = os.stat(backups_base_dir).st_mtime_ns
+    cached = _listings.get((username, timeframe))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    entries = _scan(backups_base_dir)
+    _listings.set((username, timeframe), (mtime, entries))
+    return entries
+
+
+def catalogue(username: str) -> Catalogue:
+    """
+    catalogue returns every weekly and monthly backup a user has, newest first,
+    only listing directories which have changed since they were last listed.
+    """
+    return Catalogue(_listing(username, "weekly"), _listing(username, "monthly"))
+
+
+def list_backups(username: str, timeframe: str) -> typing.List[str]:
+    """
+    list_backups returns the dates of a user's weekly or monthly backups, newest first.
+    """
+    return [entry.date for entry in _listing(username, timeframe)]
+
+
+def invalidate(username: str):
+    """
+    invalidate drops a user's catalogue, so their backups are listed again next time.
+    """
+    for timeframe in TIMEFRAMES:
+        _listings.invalidate((username, timeframe))
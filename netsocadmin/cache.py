@@ -0,0 +1,63 @@
+"""
+This file contains a small in-memory cache for lookups which rarely change, so
+they don't have to be repeated on every request.
+"""
+# stdlib
+import collections
+import threading
+import time
+import typing
+
+
+class TTLCache:
+    """
+    TTLCache is a thread-safe mapping whose entries expire `ttl` seconds after
+    they were set. If maxsize is given, the least recently used entry is evicted
+    whenever the cache would grow past it. It is per-process, so each gunicorn
+    worker has its own.
+
+    :param ttl how many seconds an entry is kept for
+    :param maxsize the most entries to keep, or None for no limit
+    """
+
+    def __init__(self, ttl: float, maxsize: typing.Optional[int] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # key -> (value, expiry time), least recently used first
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: typing.Hashable, default: object = None) -> object:
+        """
+        Returns the value cached under key, or default if there isn't one or it
+        has expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: typing.Hashable, value: object):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def invalidate(self, key: typing.Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -35,15 +35,87 @@ LDAP_AUTH = {
 
 LDAP_HOST = "auth:389"
 LDAP_USER_GROUP_ID = 422
+# how much the ldap client reads from the server, either "offline" (nothing, use
+# the bundled OpenLDAP schema) or "cached" (read once per process)
+LDAP_SERVER_INFO = "cached"
+# entry holding the next free uidNumber, created automatically on first signup
+LDAP_UID_COUNTER_DN = "cn=uidNext,dc=netsoc,dc=co"
+
+# ldap connection pool shared by the whole process
+LDAP_POOL_SIZE = 10
+# seconds to wait for a free connection before giving up
+LDAP_POOL_TIMEOUT = 5
+# connections left idle for longer than this many seconds are checked before reuse
+LDAP_POOL_MAX_IDLE = 60
+# seconds a user's DN is cached for before being looked up again
+LDAP_DN_CACHE_TTL = 300
+# seconds a user's uidNumber, gidNumber, shell etc. are cached for, and how many users to cache
+LDAP_PROFILE_CACHE_TTL = 300
+LDAP_PROFILE_CACHE_SIZE = 1000
+
+# number of processes which hash passwords off the request thread, 0 hashes inline
+HASHING_WORKERS = 2
+# seconds to wait for a password hash before giving up
+HASHING_TIMEOUT = 10
 
 # location of the markdown tutorials
 TUTORIAL_FOLDER = "./tutorials"
+# seconds between checking TUTORIAL_FOLDER for changed tutorials, it is checked on every request in debug mode
+TUTORIAL_RELOAD_INTERVAL = 60
+
+# the static files, and where fingerprinted and precompressed copies of them are built to be served from /assets
+STATIC_FOLDER = "./static"
+STATIC_BUILD_DIR = "./static-build"
+# seconds browsers may cache static files which can't be fingerprinted, e.g. robots.txt
+STATIC_UNVERSIONED_MAX_AGE = 24 * 60 * 60
+
+# local db which background jobs, e.g. WordPress installs, are recorded in
+JOBS_DB_NAME = ".jobs.db"  # should end with .db for .gitignore
+# background jobs run at once in each process
+JOB_WORKERS = 4
+
+# where the WordPress release that installs are extracted from is cached
+WORDPRESS_CACHE_DIR = "/var/cache/netsocadmin/wordpress"
+WORDPRESS_RELEASE_URL = "https://wordpress.org/latest.tar.gz"
+# seconds between checking wordpress.org for a new release
+WORDPRESS_CACHE_REFRESH = 6 * 60 * 60
+# where wp-config.php keys and salts come from, "local" to generate them or "api" for api.wordpress.org
+WORDPRESS_SALT_SOURCE = "local"
+# never download WordPress, only install from a tarball already in WORDPRESS_CACHE_DIR
+WORDPRESS_OFFLINE = False
 
 # the root directory with all of the backups in it
 BACKUPS_DIR = "/backups"
-
+# seconds a user's list of backups is trusted for while its directory's mtime is unchanged,
+# and how many users' lists to keep
+BACKUP_CATALOGUE_TTL = 5 * 60
+BACKUP_CATALOGUE_SIZE = 1000
+# how backup downloads are sent: None to send them from the app, "x-accel-redirect" to have nginx send them from
+# the internal location BACKUP_ACCEL_PREFIX (an alias of BACKUPS_DIR), or "x-sendfile" for apache/lighttpd
+BACKUP_SENDFILE = None
+BACKUP_ACCEL_PREFIX = "/protected-backups"
+# local db which the index of the files in each browsed backup is kept in
+BACKUP_INDEX_DB_NAME = ".backup-index.db"  # should end with .db for .gitignore
+# how many of a backup's members are written to its index per transaction while it is read
+BACKUP_INDEX_BATCH_SIZE = 5000
+
+# where signup and password reset tokens are kept, "sqlite" for the local db below
+# or "mysql" for a table in MYSQL_DETAILS' database shared by every app replica
+TOKEN_BACKEND = "sqlite"
 # local uri db name
 TOKEN_DB_NAME = ".uri.db"  # should end with .db for .gitignore
+# seconds a signup or password reset token is valid for after being sent
+TOKEN_TTL = 48 * 60 * 60
+# seconds between sweeps of expired tokens
+TOKEN_SWEEP_INTERVAL = 60 * 60
+# expired tokens deleted per transaction while sweeping
+TOKEN_SWEEP_BATCH = 500
+# maximum unused pages handed back to the filesystem after each sweep
+TOKEN_VACUUM_PAGES = 1000
+# seconds to wait for another process to finish writing to a local SQLite db
+LOCAL_DB_TIMEOUT = 5
+# compiled statements kept per local SQLite connection
+LOCAL_DB_CACHED_STATEMENTS = 64
 
 # mysql db details
 MYSQL_DETAILS = {
@@ -52,20 +124,73 @@ MYSQL_DETAILS = {
     "password": "netsoc",
     "db": "netsoc_admin",
 }
+# connections kept open in each MySQL pool even when idle
+MYSQL_POOL_MIN_SIZE = 1
+# maximum number of connections open at once in each MySQL pool
+MYSQL_POOL_MAX_SIZE = 10
+# seconds to wait for a free MySQL connection before giving up
+MYSQL_POOL_TIMEOUT = 5
+# idle MySQL connections beyond the minimum are closed after this many seconds
+MYSQL_POOL_IDLE_TIMEOUT = 300
+# a warning is logged for MySQL connections borrowed for longer than this many seconds
+MYSQL_POOL_LEAK_TIMEOUT = 30
+
+# connections kept open to each host by the shared HTTP client, which is also the
+# most requests made to one host at once, and how many hosts to keep them for
+HTTP_MAX_PER_HOST = 10
+HTTP_MAX_HOSTS = 10
+# seconds to wait to connect to a host and for each read from it
+HTTP_CONNECT_TIMEOUT = 3
+HTTP_READ_TIMEOUT = 10
+# seconds to wait for a request to a host to finish when HTTP_MAX_PER_HOST are in progress
+HTTP_LIMIT_TIMEOUT = 5
 
 # sendgrid api key
 SENDGRID_KEY = "sample_text"
+SENDGRID_HOST = "https://api.sendgrid.com"
 NETSOC_EMAIL_ADDRESS = "netsoc@uccsocieties.com"
 NETSOC_ADMIN_EMAIL_ADDRESS = "netsocadmin@netsoc.co"
 
+# local db which outbound emails are queued in until the worker sends them
+MAIL_DB_NAME = ".mail.db"  # should end with .db for .gitignore
+# threads sending queued emails at once
+MAIL_WORKERS = 4
+# queued emails claimed by the worker at a time
+MAIL_BATCH_SIZE = 20
+# seconds the worker waits between checking for emails which are due to be retried
+MAIL_POLL_INTERVAL = 5
+# times an email is tried before giving up on it
+MAIL_MAX_ATTEMPTS = 8
+# seconds before the first retry of an email, doubling on each retry up to the maximum
+MAIL_RETRY_BACKOFF = 10
+MAIL_RETRY_MAX_BACKOFF = 60 * 60
+# seconds after which an email being sent by a worker which has died is queued again
+MAIL_CLAIM_TIMEOUT = 5 * 60
+# seconds after an identical email was queued during which queueing it again does nothing
+MAIL_DEDUPE_WINDOW = 60
+# seconds a sent or failed email's status is kept for after the dedupe window, its content is deleted straight away
+MAIL_RETENTION = 7 * 24 * 60 * 60
+
 # blacklisted usernames
 USERNAME_BLACKLIST = [
     "test"
 ]
 
+# seconds between fetching newly created accounts into the username index
+USERNAME_INDEX_REFRESH = 30
+# seconds between reloading the whole username index, to drop deleted accounts
+USERNAME_INDEX_FULL_REFRESH = 60 * 60
+
 # the URL which the netsoc discord bot can be reached at
 DISCORD_WEBHOOK_ADDRESS = "https://apitester.com"
 
+# channels help and sudo requests are sent over, see notifications.CHANNELS
+NOTIFICATION_CHANNELS = ["email", "discord"]
+# seconds to wait for every channel to deliver a notification before giving up on it
+NOTIFICATION_DEADLINE = 10
+# threads sending notifications at once
+NOTIFICATION_WORKERS = 8
+
 SYSADMIN_EMAILS = [
     "john@netsoc.co"
 ]
@@ -0,0 +1,92 @@
+"""
+This file contains the password hashing used by login, signup and password
+changes.
+
+SHA-512 crypt is deliberately slow and CPython's crypt holds the GIL while it
+runs, so hashing on the request thread stalls every other request in the worker
+(under gevent, the whole event loop). Instead the hashing is handed to a small
+pool of separate processes and the request just waits on the result, which is
+a cooperative wait once gevent has monkey-patched threading.
+"""
+# stdlib
+import concurrent.futures
+import crypt
+import hmac
+import multiprocessing
+import threading
+import typing
+
+# lib
+import structlog as logging
+
+# local
+import config
+
+logger = logging.getLogger("netsocadmin.hashing")
+
+_executor: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawned rather than forked so the workers don't inherit the gevent hub
+            # or any open sockets from the web worker
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=config.HASHING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _crypt(password: str, salt: str) -> str:
+    """
+    Runs crypt.crypt in the hashing pool. If the pool has died, or doesn't give
+    an answer within config.HASHING_TIMEOUT seconds, it is restarted and the
+    hash is done inline this once rather than failing the request.
+    """
+    if config.HASHING_WORKERS <= 0:
+        return crypt.crypt(password, salt)
+    future = None
+    try:
+        future = _get_executor().submit(crypt.crypt, password, salt)
+        return future.result(timeout=config.HASHING_TIMEOUT)
+    except concurrent.futures.process.BrokenProcessPool as e:
+        logger.error(f"password hashing pool broke, hashing inline: {e}")
+    except concurrent.futures.TimeoutError:
+        logger.error(f"password hashing pool took over {config.HASHING_TIMEOUT}s, hashing inline")
+        future.cancel()
+    _reset_executor()
+    return crypt.crypt(password, salt)
+
+
+def hash_password(password: str) -> str:
+    """
+    hash_password returns a SHA-512 crypt hash of password in the form stored in
+    LDAP's userPassword, i.e. prefixed with "{crypt}".
+    """
+    return "{crypt}" + _crypt(password, crypt.mksalt(crypt.METHOD_SHA512))
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """
+    verify_password tells you whether password matches a hash stored in LDAP's
+    userPassword.
+
+    :param password the plaintext password to check
+    :param hashed the stored hash, optionally prefixed with "{crypt}"
+    """
+    if hashed[:len("{crypt}")].lower() == "{crypt}":
+        # strips off the "{crypt}" prefix
+        hashed = hashed[len("{crypt}"):]
+    return hmac.compare_digest(_crypt(password, hashed), hashed)
@@ -2,12 +2,10 @@
 This file takes care of sending off the data from the help section to multiple areas
 currently Discord and email of SysAdmins and the main Netsoc email
 '''
-# lib
-import requests
-
 # local
 import config
-import mail_helper
+import http_client
+import mail_queue
 
 sysadmin_tag = '<@&547450539726864384>'
 
@@ -32,7 +30,7 @@ Email: {user_email}
 
 PS: Please "Reply All" to the emails so that you get a quicker response."""
     if not config.FLASK_CONFIG['debug']:
-        response = mail_helper.send_mail(
+        response = mail_queue.enqueue(
             config.NETSOC_ADMIN_EMAIL_ADDRESS,
             config.NETSOC_EMAIL_ADDRESS,
             "[Netsoc Help] " + subject,
@@ -66,7 +64,7 @@ The UCC Netsoc SysAdmin Team.
 PS: Please "Reply All" to the emails so that you get a quicker response.
 
 """
-    return mail_helper.send_mail(
+    return mail_queue.enqueue(
         config.NETSOC_ADMIN_EMAIL_ADDRESS,
         config.NETSOC_EMAIL_ADDRESS,
         "[Netsoc Help] Sudo request on Feynman for " + username,
@@ -86,7 +84,7 @@ def send_help_webhook(username: str, email: str, subject: str, message: str) ->
     headers = {'Content-Type': 'application/json'}
 
     if not config.FLASK_CONFIG['debug']:
-        response = requests.post(config.DISCORD_WEBHOOK_ADDRESS, json=output, headers=headers)
+        response = http_client.post(config.DISCORD_WEBHOOK_ADDRESS, json=output, headers=headers)
     else:
         response = type("Response", (object,), {"status_code": 200})
     return response.status_code == 200
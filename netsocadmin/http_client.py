@@ -0,0 +1,99 @@
+"""
+This file contains the HTTP client shared by everything in netsoc admin which
+talks to other services, e.g. SendGrid, the Discord webhook and the WordPress
+API.
+
+Requests go through one requests.Session, which keeps connections open between
+requests, so once a connection to a host is warm sending to it costs a single
+request and response rather than a DNS lookup, TCP connect and TLS handshake
+every time. At most config.HTTP_MAX_PER_HOST requests are made to any one host
+at once, and every request has a connect and read timeout so a slow service
+can't tie up threads forever.
+"""
+# stdlib
+import threading
+import typing
+from urllib.parse import urlsplit
+
+# lib
+import requests
+import requests.adapters
+
+# local
+import config
+
+
+class HTTPLimitTimeoutException(Exception):
+    pass
+
+
+_session: typing.Optional[requests.Session] = None
+# host -> semaphore limiting concurrent requests to it
+_limits: typing.Dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """
+    session returns the shared session, creating it the first time.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=config.HTTP_MAX_HOSTS,
+                    pool_maxsize=config.HTTP_MAX_PER_HOST,
+                )
+                s = requests.Session()
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def _limit(host: str) -> threading.BoundedSemaphore:
+    with _lock:
+        if host not in _limits:
+            _limits[host] = threading.BoundedSemaphore(config.HTTP_MAX_PER_HOST)
+        return _limits[host]
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    request makes a request through the shared session, taking the same
+    arguments as requests.request. The timeout defaults to
+    (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT).
+
+    :raises HTTPLimitTimeoutException if there are already
+        config.HTTP_MAX_PER_HOST requests to the host for longer than
+        config.HTTP_LIMIT_TIMEOUT seconds
+    """
+    kwargs.setdefault("timeout", (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT))
+    host = urlsplit(url).netloc
+    limit = _limit(host)
+    if not limit.acquire(timeout=config.HTTP_LIMIT_TIMEOUT):
+        raise HTTPLimitTimeoutException(f"too many requests to {host} already in progress")
+    try:
+        return session().request(method, url, **kwargs)
+    finally:
+        limit.release()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def close():
+    """
+    close closes every connection held open by the shared session.
+    """
+    global _session
+    with _lock:
+        s, _session = _session, None
+    if s is not None:
+        s.close()
@@ -0,0 +1,239 @@
+"""
+This file contains the runner for jobs which take too long to do while the user
+waits on a request, e.g. installing WordPress.
+
+Jobs run on a pool of config.JOB_WORKERS threads, and are recorded in the local
+SQLite database config.JOBS_DB_NAME along with their state and how long each of
+their steps took, so a page can poll for progress. Only one job of each kind
+runs for a user at a time: submitting another while one is queued or running
+returns the one already going, so a double click can't start it twice.
+
+Under gevent the pool's threads are greenlets, so a job only runs alongside
+requests while it is waiting on I/O. Jobs which do CPU-bound work, e.g.
+decompressing an archive, do it with native_thread.call.
+"""
+# stdlib
+import concurrent.futures
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing
+import uuid
+
+# lib
+import structlog as logging
+
+# local
+import config
+import local_db
+
+logger = logging.getLogger("netsocadmin.jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def _create_jobs(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE jobs(
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            state TEXT NOT NULL,
+            step TEXT,
+            steps TEXT NOT NULL DEFAULT '[]',
+            error TEXT,
+            pid INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """)
+    # at most one unfinished job of each kind per user
+    conn.execute("CREATE UNIQUE INDEX jobs_active ON jobs(kind, owner) WHERE state IN ('queued', 'running')")
+    conn.execute("CREATE INDEX jobs_owner ON jobs(owner, created_at)")
+
+
+# never reorder or remove these, only add to the end
+MIGRATIONS = [
+    _create_jobs,
+]
+
+_ACTIVE = "SELECT id, pid FROM jobs WHERE kind = ? AND owner = ? AND state IN ('queued', 'running')"
+_SUBMIT = "INSERT INTO jobs(id, kind, owner, state, pid, created_at) VALUES (?, ?, ?, 'queued', ?, ?)"
+_ABANDON = (
+    "UPDATE jobs SET state = 'failed', error = ?, finished_at = ? "
+    "WHERE id = ? AND state IN ('queued', 'running')"
+)
+_START = "UPDATE jobs SET state = 'running' WHERE id = ?"
+_STEP = "UPDATE jobs SET step = ?, steps = ? WHERE id = ?"
+_FINISH = "UPDATE jobs SET state = ?, step = NULL, steps = ?, error = ?, finished_at = ? WHERE id = ?"
+_GET = "SELECT id, kind, owner, state, step, steps, error, created_at, finished_at FROM jobs WHERE id = ?"
+_LATEST = (
+    "SELECT id, kind, owner, state, step, steps, error, created_at, finished_at FROM jobs "
+    "WHERE owner = ? AND kind = ? ORDER BY created_at DESC LIMIT 1"
+)
+
+
+class Job(typing.NamedTuple):
+    id: str
+    kind: str
+    owner: str
+    state: str
+    # the step being run, if any
+    step: typing.Optional[str]
+    # {"name": ..., "seconds": ...} for each step which has finished, in order
+    steps: typing.List[typing.Dict[str, typing.Union[str, float]]]
+    error: typing.Optional[str]
+    created_at: float
+    finished_at: typing.Optional[float]
+
+
+class Progress:
+    """
+    Progress is handed to a running job so it can record its steps, e.g.
+
+        with progress.step("download"):
+            ...
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.steps: typing.List[typing.Dict[str, typing.Union[str, float]]] = []
+
+    @contextlib.contextmanager
+    def step(self, name: str) -> typing.Iterator[None]:
+        _connection().execute(_STEP, (name, json.dumps(self.steps), self.job_id))
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.steps.append({"name": name, "seconds": round(time.monotonic() - start, 3)})
+
+
+JobFunction = typing.Callable[[Progress], None]
+
+_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# ids of the jobs submitted by this process which haven't finished yet
+_running: typing.Set[str] = set()
+_running_lock = threading.Lock()
+# times a job's final state is tried to be written before giving up on it
+_FINISH_ATTEMPTS = 3
+
+
+def _connection() -> sqlite3.Connection:
+    return local_db.connection(config.JOBS_DB_NAME, MIGRATIONS)
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(config.JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+
+def _alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _finish(job_id: str, state: str, error: typing.Optional[str], steps: list):
+    for attempt in range(1, _FINISH_ATTEMPTS + 1):
+        try:
+            _connection().execute(_FINISH, (state, json.dumps(steps), error, time.time(), job_id))
+            return
+        except Exception as e:
+            logger.error(f"failed to record job {job_id} as {state} (attempt {attempt}): {e}")
+            time.sleep(0.5 * attempt)
+
+
+def _run(job_id: str, kind: str, function: JobFunction):
+    progress = Progress(job_id)
+    state, error = FAILED, "the job was interrupted"
+    try:
+        _connection().execute(_START, (job_id,))
+        function(progress)
+        state, error = SUCCEEDED, None
+    except Exception as e:
+        logger.error(f"{kind} job {job_id} failed: {e}")
+        error = str(e)
+    finally:
+        try:
+            _finish(job_id, state, error, progress.steps)
+        finally:
+            with _running_lock:
+                _running.discard(job_id)
+
+
+def submit(kind: str, owner: str, function: JobFunction) -> Job:
+    """
+    submit queues function to be run as a job of the given kind for owner. If
+    owner already has a job of that kind queued or running, it is returned and
+    function is not run.
+
+    :param kind what sort of job this is, e.g. "wordpress"
+    :param owner who or what the job is for, usually a username, though e.g.
+        backup indexing uses the backup's path so each backup is indexed once
+    :param function called with a Progress to record its steps with. The job
+        fails if it raises.
+    """
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        active = conn.execute(_ACTIVE, (kind, owner)).fetchone()
+        if active and not _alive(active[1]):
+            # the process running it has gone away, so it will never finish
+            conn.execute(_ABANDON, ("interrupted by a restart", time.time(), active[0]))
+            active = None
+        elif active and active[1] == os.getpid() and active[0] not in _running:
+            # this process finished it but couldn't record that it had
+            conn.execute(_ABANDON, ("its result couldn't be recorded", time.time(), active[0]))
+            active = None
+        if active:
+            job_id, created = active[0], False
+        else:
+            job_id, created = uuid.uuid4().hex, True
+            conn.execute(_SUBMIT, (job_id, kind, owner, os.getpid(), time.time()))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if created:
+        with _running_lock:
+            _running.add(job_id)
+        _get_executor().submit(_run, job_id, kind, function)
+    return get(job_id)
+
+
+def _job(row: typing.Optional[tuple]) -> typing.Optional[Job]:
+    if row is None:
+        return None
+    return Job(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]), row[6], row[7], row[8])
+
+
+def get(job_id: str) -> typing.Optional[Job]:
+    """
+    get returns the job with the given id, or None if there isn't one.
+    """
+    return _job(_connection().execute(_GET, (job_id,)).fetchone())
+
+
+def latest(kind: str, owner: str) -> typing.Optional[Job]:
+    """
+    latest returns the most recently submitted job of the given kind for owner,
+    whatever state it is in, or None if there has never been one.
+    """
+    return _job(_connection().execute(_LATEST, (owner, kind)).fetchone())
@@ -0,0 +1,349 @@
+"""
+This file contains the shared LDAP connection pool. Anything in netsoc admin
+which needs to talk to LDAP borrows an admin-bound connection from here rather
+than opening and binding its own. It is also the only place which builds LDAP
+server objects and connections.
+"""
+# stdlib
+import contextlib
+import threading
+import time
+import typing
+
+# lib
+import ldap3
+import structlog as logging
+
+# local
+import cache
+import config
+
+logger = logging.getLogger("netsocadmin.ldap")
+
+# LDAP result code returned when the entry being operated on doesn't exist
+NO_SUCH_OBJECT = 32
+
+
+class LDAPPoolTimeoutException(Exception):
+    pass
+
+
+class UserNotFoundException(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    ConnectionPool hands out admin-bound LDAP connections, keeping at most `size`
+    of them open at any time. It only uses the threading module for locking so
+    it is safe to share between threads, or between greenlets once gevent has
+    monkey-patched threading.
+
+    :param server the ldap3.Server which connections are made to
+    :param size the maximum number of connections open at once
+    :param timeout how many seconds to wait for a free connection
+    :param max_idle connections idle for longer than this many seconds are
+        checked to still be alive before being handed out again
+    """
+
+    def __init__(self, server: ldap3.Server, size: int, timeout: float, max_idle: float):
+        self.server = server
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        # (connection, time last returned) pairs, most recently used last
+        self._idle: typing.List[typing.Tuple[ldap3.Connection, float]] = []
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _connect(self) -> ldap3.Connection:
+        return make_connection(self.server)
+
+    def _close(self, conn: ldap3.Connection):
+        try:
+            conn.unbind()
+        except ldap3.core.exceptions.LDAPException:
+            pass
+
+    def _is_healthy(self, conn: ldap3.Connection, last_used: float) -> bool:
+        if conn.closed or not conn.bound:
+            return False
+        if time.monotonic() - last_used < self.max_idle:
+            return True
+        # the server may have dropped a connection which sat idle for a while
+        try:
+            conn.extend.standard.who_am_i()
+        except ldap3.core.exceptions.LDAPException:
+            return False
+        return conn.result is not None and conn.result["result"] == 0
+
+    def _acquire(self) -> ldap3.Connection:
+        deadline = time.monotonic() + self.timeout
+        conn, last_used = None, 0.0
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LDAPPoolTimeoutException(f"no LDAP connection free after {self.timeout} seconds")
+                self._cond.wait(remaining)
+
+        # health checks and binds go over the network so are done outside the lock
+        try:
+            if conn is not None:
+                if self._is_healthy(conn, last_used):
+                    return conn
+                logger.info("discarding dead LDAP connection and rebinding")
+                self._close(conn)
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn: ldap3.Connection, broken: bool):
+        if broken or conn.closed:
+            self._close(conn)
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[ldap3.Connection]:
+        """
+        Borrows a bound connection for the duration of the with block. If the
+        connection fails part way through it is thrown away, so whoever borrows
+        next gets a freshly bound one.
+        """
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn
+        except ldap3.core.exceptions.LDAPCommunicationError:
+            broken = True
+            raise
+        finally:
+            self._release(conn, broken)
+
+    def close(self):
+        """
+        Unbinds every idle connection in the pool.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+
+# Server info modes:
+#   "offline" - never read anything from the server, attribute values are decoded
+#               using the OpenLDAP 2.4 schema which ships with ldap3
+#   "cached"  - read the root DSE and schema on the first bind in this process and
+#               reuse them for every bind after that
+_INFO_MODES = {
+    "offline": ldap3.OFFLINE_SLAPD_2_4,
+    "cached": ldap3.ALL,
+}
+
+
+def make_server(info_mode: str = None, host: str = None) -> ldap3.Server:
+    """
+    make_server is the one place LDAP server objects get built. Neither info mode
+    downloads the schema more than once per process, which ldap3 would otherwise
+    do on every single bind.
+
+    :param info_mode either "offline" or "cached", defaults to config.LDAP_SERVER_INFO
+    :param host the LDAP server address, defaults to config.LDAP_HOST
+    :returns ldap3.Server
+    """
+    if info_mode is None:
+        info_mode = config.LDAP_SERVER_INFO
+    if info_mode not in _INFO_MODES:
+        raise ValueError(f"unknown LDAP server info mode '{info_mode}'")
+    return ldap3.Server(host or config.LDAP_HOST, get_info=_INFO_MODES[info_mode])
+
+
+def make_connection(server: ldap3.Server) -> ldap3.Connection:
+    """
+    make_connection opens a new admin-bound connection to a server built by
+    make_server.
+    """
+    conn = ldap3.Connection(server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH)
+    if server.get_info == ldap3.ALL and server.schema is not None:
+        # the bind has just read the DSE and schema, so stop every later bind on
+        # this server from reading them all over again
+        server.get_info = ldap3.NONE
+    return conn
+
+
+_pool = ConnectionPool(
+    make_server(),
+    size=config.LDAP_POOL_SIZE,
+    timeout=config.LDAP_POOL_TIMEOUT,
+    max_idle=config.LDAP_POOL_MAX_IDLE,
+)
+
+
+def connection() -> typing.ContextManager[ldap3.Connection]:
+    """
+    connection borrows an admin-bound connection from the process-wide pool.
+
+    e.g:
+        with ldap_tools.connection() as conn:
+            conn.search(...)
+    """
+    return _pool.connection()
+
+
+# attributes which make up a UserProfile, search for these to pass entries to remember_profile
+PROFILE_ATTRIBUTES = ["uid", "uidNumber", "gidNumber", "loginShell", "mail"]
+
+
+class UserProfile(typing.NamedTuple):
+    uid: str
+    uid_number: int
+    gid_number: int
+    login_shell: str
+    mail: str
+    dn: str
+
+
+_dns = cache.TTLCache(config.LDAP_DN_CACHE_TTL)
+_profiles = cache.TTLCache(config.LDAP_PROFILE_CACHE_TTL, maxsize=config.LDAP_PROFILE_CACHE_SIZE)
+
+
+def _first_value(entry: ldap3.Entry, attribute: str) -> object:
+    values = entry.entry_attributes_as_dict.get(attribute)
+    return values[0] if values else None
+
+
+def remember_dn(uid: str, dn: str):
+    """
+    remember_dn caches a user's DN which was found some other way, e.g. as part of
+    a search which was happening anyway.
+    """
+    _dns.set(uid, dn)
+
+
+def remember_profile(entry: ldap3.Entry) -> UserProfile:
+    """
+    remember_profile caches the profile (and DN) of a user from an entry which was
+    searched for with at least PROFILE_ATTRIBUTES.
+
+    :returns the cached UserProfile
+    """
+    profile = UserProfile(
+        uid=_first_value(entry, "uid"),
+        uid_number=_first_value(entry, "uidNumber"),
+        gid_number=_first_value(entry, "gidNumber"),
+        login_shell=_first_value(entry, "loginShell"),
+        mail=_first_value(entry, "mail"),
+        dn=entry.entry_dn,
+    )
+    _profiles.set(profile.uid, profile)
+    _dns.set(profile.uid, profile.dn)
+    return profile
+
+
+def forget_profile(uid: str):
+    """
+    forget_profile drops a user's cached profile. It must be called whenever
+    something about the user is written to LDAP.
+    """
+    _profiles.invalidate(uid)
+
+
+def forget_dn(uid: str):
+    _dns.invalidate(uid)
+    _profiles.invalidate(uid)
+
+
+def get_profile(uid: str) -> typing.Optional[UserProfile]:
+    """
+    get_profile returns the uid, uidNumber, gidNumber, loginShell, mail and DN of
+    a user. Profiles are cached for config.LDAP_PROFILE_CACHE_TTL seconds, with the
+    least recently used evicted once there are more than
+    config.LDAP_PROFILE_CACHE_SIZE of them.
+
+    :param uid the user's username
+    :returns the user's UserProfile, or None if there's no such user
+    """
+    profile = _profiles.get(uid)
+    if profile is not None:
+        return profile
+    with connection() as conn:
+        conn.search(
+            search_base="dc=netsoc,dc=co",
+            search_filter=f"(&(objectClass=account)(uid={ldap3.utils.conv.escape_filter_chars(uid)}))",
+            attributes=PROFILE_ATTRIBUTES,
+        )
+        if len(conn.entries) != 1:
+            return None
+        return remember_profile(conn.entries[0])
+
+
+def resolve_dn(conn: ldap3.Connection, uid: str) -> typing.Optional[str]:
+    """
+    resolve_dn finds the real DN of a user, whichever OU they're in, with a single
+    search from dc=netsoc,dc=co. Results are cached for config.LDAP_DN_CACHE_TTL
+    seconds.
+
+    :param conn a bound admin LDAP connection
+    :param uid the user's username
+    :returns the user's DN, or None if there's no such user
+    """
+    dn = _dns.get(uid)
+    if dn is not None:
+        return dn
+    profile = _profiles.get(uid)
+    if profile is not None:
+        return profile.dn
+    conn.search(
+        search_base="dc=netsoc,dc=co",
+        search_filter=f"(&(objectClass=account)(uid={ldap3.utils.conv.escape_filter_chars(uid)}))",
+        attributes=ldap3.NO_ATTRIBUTES,
+    )
+    if len(conn.entries) != 1:
+        return None
+    dn = conn.entries[0].entry_dn
+    _dns.set(uid, dn)
+    return dn
+
+
+def modify_user(conn: ldap3.Connection, uid: str, changes: typing.Dict[str, object]) -> bool:
+    """
+    modify_user applies changes to a user's entry. With the DN already cached this
+    is a single round trip. If the cached DN turns out to be stale (the user was
+    moved or deleted) it is dropped and resolved again. The user's cached profile
+    is always dropped.
+
+    :param conn a bound admin LDAP connection
+    :param uid the user's username
+    :param changes the changes to make, as taken by ldap3.Connection.modify
+    :returns True if the entry was modified
+    :raises UserNotFoundException if there is no such user
+    """
+    for _ in range(2):
+        dn = resolve_dn(conn, uid)
+        if dn is None:
+            raise UserNotFoundException(f"username {uid} not found in LDAP")
+        success = conn.modify(dn, changes)
+        forget_profile(uid)
+        if success:
+            return True
+        forget_dn(uid)
+        if conn.result["result"] != NO_SUCH_OBJECT:
+            return False
+    return False
@@ -0,0 +1,110 @@
+"""
+This file contains the helpers shared by netsoc admin's local SQLite databases.
+
+Connections are opened once per thread and database file, then reused for every
+call on that thread, rather than connecting on every query. They use WAL
+journaling so readers never wait on a writer, and each database's schema is
+brought up to date by numbered migrations the first time it is opened in a
+process, using SQLite's user_version to remember which have been applied.
+
+A thread here means a real OS thread. Once gevent has monkey-patched threading,
+threading.local is per greenlet, which is to say per request, so connections are
+kept in the original unpatched threading.local and shared by every greenlet on
+the thread. Greenlets only switch on I/O, and none is done while a transaction
+is open, so they never end up inside each other's.
+"""
+# stdlib
+import sqlite3
+import threading
+import typing
+
+# local
+import config
+
+try:
+    from gevent import monkey
+except ImportError:
+    monkey = None
+
+Migration = typing.Callable[[sqlite3.Connection], None]
+
+# get_original gives back threading.local itself if gevent hasn't patched it
+_local = (threading.local if monkey is None else monkey.get_original("threading", "local"))()
+# paths of databases which have already been migrated in this process
+_migrated: typing.Set[str] = set()
+_migrate_lock = threading.Lock()
+
+
+def _migrate(conn: sqlite3.Connection, path: str, migrations: typing.Sequence[Migration]):
+    """
+    Applies every migration past the database's user_version, each in its own
+    transaction along with bumping user_version, so a migration which fails part
+    way through leaves nothing behind.
+    """
+    with _migrate_lock:
+        if path in _migrated:
+            return
+        for version, migration in enumerate(migrations, start=1):
+            # BEGIN IMMEDIATE takes the write lock, so other processes opening the
+            # database at the same time wait here rather than migrating twice
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        _migrated.add(path)
+
+
+def connection(path: str, migrations: typing.Sequence[Migration] = ()) -> sqlite3.Connection:
+    """
+    connection returns this thread's connection to the database at path,
+    opening it and applying migrations if need be.
+
+    Connections are in autocommit mode: each statement is committed on its own
+    unless it is run inside an explicit "BEGIN".
+
+    :param path the SQLite database file
+    :param migrations the functions which build the schema, in order. They must
+        never be reordered or removed once released, only added to.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(
+            path,
+            timeout=config.LOCAL_DB_TIMEOUT,
+            isolation_level=None,
+            cached_statements=config.LOCAL_DB_CACHED_STATEMENTS,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        # with WAL this only risks the last few commits on power loss, not corruption
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conns[path] = conn
+    if path not in _migrated:
+        _migrate(conn, path, migrations)
+    return conn
+
+
+def close(path: str):
+    """
+    close closes this thread's connection to the database at path, if it has one.
+    """
+    conns = getattr(_local, "conns", {})
+    conn = conns.pop(path, None)
+    if conn is not None:
+        conn.close()
+
+
+def forget_migrations(path: str):
+    """
+    forget_migrations makes the next connection to path check its migrations
+    again, e.g. after the database file has been replaced.
+    """
+    with _migrate_lock:
+        _migrated.discard(path)
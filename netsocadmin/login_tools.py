@@ -2,9 +2,7 @@
 Contains functions which are used during the login and logout process.
 """
 # stdlib
-import crypt
 import functools
-import hmac
 import typing
 
 # lib
@@ -14,9 +12,10 @@ import structlog as logging
 
 # local
 import config
+import hashing
+import ldap_tools
 
 logger = logging.getLogger("netsocadmin.login")
-ldap_server = ldap3.Server(config.LDAP_HOST, get_info=ldap3.ALL)
 
 
 class UserNotInLDAPException(Exception):
@@ -34,7 +33,7 @@ class LoginUser:
         success = conn.search(
             search_base="dc=netsoc,dc=co",
             search_filter=f"(&(objectClass=account)(uid={self.username}))",
-            attributes=["userPassword", "uid", "gidNumber"],
+            attributes=["userPassword"] + ldap_tools.PROFILE_ATTRIBUTES,
         )
         if len(conn.entries) == 0:
             raise UserNotInLDAPException(f"username {self.username} not found in LDAP")
@@ -42,13 +41,11 @@ class LoginUser:
             raise Exception(f"couldnt search from ldap: {conn.last_error}")
         entry = conn.entries[0]
         self.ldap_pass = entry["userPassword"].value.decode()
-        self.group = entry["gidNumber"].value
+        # everything but the password is kept for the tool pages to use
+        self.group = ldap_tools.remember_profile(entry).gid_number
 
     def is_pass_correct(self) -> bool:
-        if self.ldap_pass.startswith("{crypt}") or self.ldap_pass.startswith("{CRYPT}"):
-            # strips off the "{crypt}" prefix
-            ldap_pass = self.ldap_pass[len("{crypt}"):]
-        return hmac.compare_digest(crypt.crypt(self.password, ldap_pass), ldap_pass)
+        return hashing.verify_password(self.password, self.ldap_pass)
 
     def is_admin(self) -> bool:
         return self.group == 420
@@ -102,14 +99,16 @@ def is_correct_password(user: LoginUser) -> bool:
     is_correct_password tells you whether or not a given username + password
     combo are correct
     """
-    with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
+    with ldap_tools.connection() as conn:
         try:
             user.populate_data(conn)
         except UserNotInLDAPException:
             logger.info("incorect username supplied",
                         user=user.username)
             return False
-        if not user.is_pass_correct():
-            logger.info("incorect password supplied",
-                        user=user.username)
-        return user.is_pass_correct()
+    # the hash is checked outside the with block so the connection goes back to the pool sooner
+    if not user.is_pass_correct():
+        logger.info("incorect password supplied",
+                    user=user.username)
+        return False
+    return True
@@ -2,16 +2,20 @@
 from typing import List
 
 # lib
+import requests
 import sendgrid
 from sendgrid.helpers.mail import Content, Email, From, Mail, To, ReplyTo
 
 # local
 import config
+import http_client
 
 
-def send_mail(from_mail: str, to_mail: str, subject: str, content: str, cc: List[str] = None) -> object:
-    sg = sendgrid.SendGridAPIClient(config.SENDGRID_KEY)
-
+def send_mail(from_mail: str, to_mail: str, subject: str, content: str, cc: List[str] = None) -> requests.Response:
+    """
+    send_mail sends an email through SendGrid's API over the shared HTTP client,
+    returning SendGrid's response.
+    """
     mail = Mail()
     mail.from_email = From(from_mail, "UCC Netsoc")
     mail.subject = subject
@@ -26,4 +30,8 @@ def send_mail(from_mail: str, to_mail: str, subject: str, content: str, cc: List
         for email in cc:
             p.add_cc(Email(email))
     mail.add_personalization(p)
-    return sg.send(mail)
+    return http_client.post(
+        f"{config.SENDGRID_HOST}/v3/mail/send",
+        json=mail.get(),
+        headers={"Authorization": f"Bearer {config.SENDGRID_KEY}"},
+    )
@@ -0,0 +1,314 @@
+"""
+This file contains the outbound mail queue. Rather than talking to SendGrid
+while the user waits, routes queue their emails here and a background worker
+sends them, so a slow or failing mail provider never holds up a request.
+
+Queued emails live in the local SQLite database config.MAIL_DB_NAME, so they
+survive a restart. The worker claims up to config.MAIL_BATCH_SIZE due emails at
+a time and sends them from a pool of config.MAIL_WORKERS threads. An email which
+fails is retried with exponential backoff until it has been tried
+config.MAIL_MAX_ATTEMPTS times. Queueing the same email again while the first is
+still waiting, or within config.MAIL_DEDUPE_WINDOW seconds of sending it, returns
+the first one instead, so a double-clicked form only sends one email.
+
+Every email gets an id which can be passed to status() to see how it is getting on.
+Emails include passwords, so an email's content is deleted as soon as it has been
+sent or given up on, and the rest of it config.MAIL_RETENTION seconds after that.
+"""
+# stdlib
+import concurrent.futures
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import typing
+import uuid
+
+# lib
+import structlog as logging
+
+# local
+import config
+import local_db
+import mail_helper
+
+logger = logging.getLogger("netsocadmin.mail_queue")
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def _create_outbox(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE outbox(
+            id TEXT PRIMARY KEY,
+            dedupe_key TEXT NOT NULL,
+            from_mail TEXT NOT NULL,
+            to_mail TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            content TEXT NOT NULL,
+            cc TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            last_error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX outbox_due ON outbox(status, next_attempt_at)")
+    conn.execute("CREATE INDEX outbox_dedupe_key ON outbox(dedupe_key, created_at)")
+
+
+def _nullable_content(conn: sqlite3.Connection):
+    # emails carry passwords, so content is dropped once it has been sent or given up on,
+    # which needs NOT NULL taken off it and SQLite can only do that by rebuilding the table
+    conn.execute("""
+        CREATE TABLE outbox_new(
+            id TEXT PRIMARY KEY,
+            dedupe_key TEXT NOT NULL,
+            from_mail TEXT NOT NULL,
+            to_mail TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            content TEXT,
+            cc TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            last_error TEXT
+        )
+    """)
+    conn.execute("""
+        INSERT INTO outbox_new
+        SELECT id, dedupe_key, from_mail, to_mail, subject,
+            CASE WHEN status IN ('sent', 'failed') THEN NULL ELSE content END,
+            cc, status, attempts, next_attempt_at, created_at, updated_at, last_error
+        FROM outbox
+    """)
+    conn.execute("DROP TABLE outbox")
+    conn.execute("ALTER TABLE outbox_new RENAME TO outbox")
+    conn.execute("CREATE INDEX outbox_due ON outbox(status, next_attempt_at)")
+    conn.execute("CREATE INDEX outbox_dedupe_key ON outbox(dedupe_key, created_at)")
+
+
+# never reorder or remove these, only add to the end
+MIGRATIONS = [
+    _create_outbox,
+    _nullable_content,
+]
+
+_FIND_DUPLICATE = (
+    "SELECT id FROM outbox WHERE dedupe_key = ? AND status != 'failed' "
+    "AND (created_at > ? OR status != 'sent') LIMIT 1"
+)
+_ENQUEUE = (
+    "INSERT INTO outbox(id, dedupe_key, from_mail, to_mail, subject, content, cc, status, "
+    "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)"
+)
+_DUE = "SELECT id FROM outbox WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?"
+_CLAIM = "UPDATE outbox SET status = 'sending', updated_at = ? WHERE id = ?"
+_CLAIMED = "SELECT id, from_mail, to_mail, subject, content, cc, attempts FROM outbox WHERE id = ?"
+# emails left "sending" by a worker which died part way through are tried again
+_UNCLAIM = "UPDATE outbox SET status = 'queued' WHERE status = 'sending' AND updated_at <= ?"
+_SENT = (
+    "UPDATE outbox SET status = 'sent', content = NULL, attempts = attempts + 1, updated_at = ?, last_error = NULL "
+    "WHERE id = ?"
+)
+_GIVE_UP = (
+    "UPDATE outbox SET status = 'failed', content = NULL, attempts = attempts + 1, updated_at = ?, last_error = ? "
+    "WHERE id = ?"
+)
+_RETRY = (
+    "UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, updated_at = ?, last_error = ? "
+    "WHERE id = ?"
+)
+_STATUS = "SELECT status FROM outbox WHERE id = ?"
+_PURGE = "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated_at <= ?"
+
+
+class QueuedMail(typing.NamedTuple):
+    """
+    QueuedMail is returned in place of a SendGrid response when an email is
+    queued. Its status_code is always 202 Accepted.
+    """
+    id: str
+    status_code: int = 202
+    body: str = ""
+
+
+class Message(typing.NamedTuple):
+    id: str
+    from_mail: str
+    to_mail: str
+    subject: str
+    content: str
+    cc: typing.Optional[typing.List[str]]
+    attempts: int
+
+
+_wake = threading.Event()
+_worker: typing.Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _connection() -> sqlite3.Connection:
+    return local_db.connection(config.MAIL_DB_NAME, MIGRATIONS)
+
+
+def _dedupe_key(from_mail: str, to_mail: str, subject: str, content: str,
+                cc: typing.Optional[typing.List[str]]) -> str:
+    return hashlib.sha256(json.dumps([from_mail, to_mail, subject, content, cc]).encode()).hexdigest()
+
+
+def enqueue(from_mail: str, to_mail: str, subject: str, content: str, cc: typing.List[str] = None) -> QueuedMail:
+    """
+    enqueue queues an email to be sent by the worker, taking the same arguments
+    as mail_helper.send_mail. If the same email is already waiting to be sent,
+    or was queued in the last config.MAIL_DEDUPE_WINDOW seconds and sent, that
+    one is returned instead of queueing it twice.
+
+    :returns the queued email, whose id can be passed to status()
+    """
+    now = int(time.time())
+    key = _dedupe_key(from_mail, to_mail, subject, content, cc)
+    conn = _connection()
+    # BEGIN IMMEDIATE so two requests queueing the same email can't both miss the other
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(_FIND_DUPLICATE, (key, now - config.MAIL_DEDUPE_WINDOW)).fetchone()
+        if row:
+            mail_id = row[0]
+        else:
+            mail_id = uuid.uuid4().hex
+            conn.execute(_ENQUEUE, (
+                mail_id, key, from_mail, to_mail, subject, content,
+                json.dumps(cc) if cc is not None else None, now, now, now,
+            ))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if not row:
+        _wake.set()
+    return QueuedMail(mail_id)
+
+
+def status(mail_id: str) -> typing.Optional[str]:
+    """
+    status returns "queued", "sending", "sent" or "failed" for a queued email,
+    or None if there is no email with that id.
+    """
+    row = _connection().execute(_STATUS, (mail_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _claim(now: int) -> typing.List[Message]:
+    """
+    Marks up to config.MAIL_BATCH_SIZE due emails as being sent and returns them.
+    """
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(_UNCLAIM, (now - config.MAIL_CLAIM_TIMEOUT,))
+        messages = []
+        for (mail_id,) in conn.execute(_DUE, (now, config.MAIL_BATCH_SIZE)).fetchall():
+            conn.execute(_CLAIM, (now, mail_id))
+            row = conn.execute(_CLAIMED, (mail_id,)).fetchone()
+            cc = json.loads(row[5]) if row[5] is not None else None
+            messages.append(Message(row[0], row[1], row[2], row[3], row[4], cc, row[6]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return messages
+
+
+def _send(message: Message) -> typing.Optional[str]:
+    """
+    Sends one email, returning why it failed or None if it was sent.
+    """
+    try:
+        response = mail_helper.send_mail(
+            message.from_mail, message.to_mail, message.subject, message.content, message.cc,
+        )
+    except Exception as e:
+        return str(e)
+    if not str(response.status_code).startswith("20"):
+        return f"status code {response.status_code}: {response.text}"
+    return None
+
+
+def _record(message: Message, error: typing.Optional[str]):
+    now = int(time.time())
+    conn = _connection()
+    if error is None:
+        conn.execute(_SENT, (now, message.id))
+        return
+    attempts = message.attempts + 1
+    if attempts >= config.MAIL_MAX_ATTEMPTS:
+        logger.error(f"giving up on email {message.id} to {message.to_mail} after {attempts} attempts: {error}")
+        conn.execute(_GIVE_UP, (now, error, message.id))
+        return
+    delay = min(config.MAIL_RETRY_BACKOFF * 2 ** (attempts - 1), config.MAIL_RETRY_MAX_BACKOFF)
+    logger.warning(f"failed to send email {message.id} to {message.to_mail}, retrying in {delay}s: {error}")
+    conn.execute(_RETRY, (QUEUED, now + delay, now, error, message.id))
+
+
+def process(executor: concurrent.futures.Executor, now: int = None) -> int:
+    """
+    process claims one batch of due emails, sends them using executor and
+    records how each went.
+
+    :param now the time to treat as the present, defaults to the current time
+    :returns how many emails were claimed
+    """
+    messages = _claim(int(time.time()) if now is None else now)
+    for message, error in zip(messages, executor.map(_send, messages)):
+        _record(message, error)
+    return len(messages)
+
+
+def purge(now: int = None) -> int:
+    """
+    purge deletes emails which were sent or given up on more than
+    config.MAIL_DEDUPE_WINDOW + config.MAIL_RETENTION seconds ago. Their content
+    is already gone by then, this just stops the outbox growing forever.
+
+    :param now the time to treat as the present, defaults to the current time
+    :returns how many emails were deleted
+    """
+    now = int(time.time()) if now is None else now
+    cutoff = now - config.MAIL_DEDUPE_WINDOW - config.MAIL_RETENTION
+    return _connection().execute(_PURGE, (cutoff,)).rowcount
+
+
+def _work_forever():
+    with concurrent.futures.ThreadPoolExecutor(config.MAIL_WORKERS, thread_name_prefix="mail-sender") as executor:
+        while True:
+            _wake.clear()
+            try:
+                purge()
+                # a full batch means there's probably more waiting
+                if process(executor) == config.MAIL_BATCH_SIZE:
+                    continue
+            except Exception as e:
+                logger.error(f"failed to process mail queue: {e}")
+            _wake.wait(config.MAIL_POLL_INTERVAL)
+
+
+def start_worker():
+    """
+    start_worker starts sending queued emails from a background thread. It is
+    safe to call more than once.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            return
+        _worker = threading.Thread(target=_work_forever, name="mail-queue", daemon=True)
+        _worker.start()
@@ -9,11 +9,10 @@ import re
 import string
 from typing import List
 
-# lib
-import pymysql
-
 # local
 import config
+import mysql_pool
+import mysql_provision
 
 
 class DatabaseAccessError(Exception):
@@ -38,26 +37,33 @@ class UserError(Exception):
     pass
 
 
-def _mysql_connection(username: str = None, password: str = None) -> pymysql.connections.Connection:
+def _prefix_pattern(user: str) -> str:
+    """
+    _prefix_pattern returns a LIKE pattern matching every database name starting
+    with "<user>_". Wildcards in the username itself are escaped, so the "_" in
+    "my_user" only matches an underscore.
     """
-    _mysql_connection is a helper method which supplies a connection
-    to the MySQL DB logged in as passwords.SQL_USER.
+    escaped = user.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "\\_%"
+
 
-    :returns pymysql.connections.Connection
+def _database_exists(cur, dbname: str) -> bool:
     """
-    if username is None:
-        username = config.MYSQL_DETAILS["user"]
-    if password is None:
-        password = config.MYSQL_DETAILS["password"]
-    return pymysql.connect(
-        host=config.MYSQL_DETAILS["host"],
-        user=username,
-        password=password,
-        cursorclass=pymysql.cursors.DictCursor,
-        read_timeout=3,
-        write_timeout=3,
-        connect_timeout=3,
-    )
+    _database_exists tells you whether a single database exists, using the
+    cursor of a connection which is already open.
+    """
+    sql = "SELECT 1 FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = %s;"
+    cur.execute(sql, dbname)
+    return cur.fetchone() is not None
+
+
+def _hosts() -> List[str]:
+    """
+    _hosts returns the hosts which members' MySQL accounts are created for.
+    """
+    if config.FLASK_CONFIG["debug"]:
+        return ["%"]
+    return ["%", "localhost"]
 
 
 def list_dbs(user: str) -> List[str]:
@@ -69,23 +75,14 @@ def list_dbs(user: str) -> List[str]:
     :raises DatabaseAccessError if the operation fails.
     """
     databases = None
-    con = None
     try:
-        con = _mysql_connection()
-        with con.cursor() as cur:
-            sql = "SHOW DATABASES;"
-            cur.execute(sql)
-            databases = list(
-                filter(
-                    lambda dbname: dbname.startswith(f"{user}_"),
-                    map(lambda row: row["Database"], cur.fetchall())
-                )
-            )
+        with mysql_pool.connection("admin") as con, con.cursor() as cur:
+            # only reads the user's own databases rather than every database on the server
+            sql = "SELECT SCHEMA_NAME FROM information_schema.SCHEMATA WHERE SCHEMA_NAME LIKE %s ORDER BY SCHEMA_NAME;"
+            cur.execute(sql, _prefix_pattern(user))
+            databases = [row["SCHEMA_NAME"] for row in cur.fetchall()]
     except Exception as e:
         raise DatabaseAccessError(f"failed to list databases for user '{user}': {str(e)}") from e
-    finally:
-        if con:
-            con.close()
     return databases
 
 
@@ -101,50 +98,16 @@ def create_user(username: str) -> str:
     # make sure username is valid
     if not re.match(config.VALID_USERNAME, username):
         raise BadUsernameError(f"invalid username '{username}', must be alphanumeric, underscores and hyphens only")
+    # create new user
+    chars = string.ascii_letters + string.digits
+    password = "".join(random.choice(chars) for _ in range(random.randint(10, 15)))
     try:
-        con = _mysql_connection()
-        con.autocommit = False
-        with con.cursor() as cur:
-            # check is username already exists
-            sql = "SELECT User FROM mysql.user WHERE User=%s;"
-            cur.execute(sql, username)
-            if cur.rowcount:
-                raise Exception(f"username {username} already exists")
-
-            # create new user
-            chars = string.ascii_letters + string.digits
-            password = "".join(random.choice(chars) for _ in range(random.randint(10, 15)))
-            sql = """CREATE USER %s@'%%' IDENTIFIED BY %s;"""
-            cur.execute(sql, (username, password,))
-            if not config.FLASK_CONFIG["debug"]:
-                sql = """CREATE USER %s@'localhost' IDENTIFIED BY %s;"""
-                cur.execute(sql, (username, password,))
-
-            # grant the user permissions on all databases of the form
-            # "<username>_something".
-            # Note: the escaping must be done in two parts here becuase
-            # PyMySQL will insert quotation marks around the %s which
-            # makes the pattern `'username'_%`.
-            username_pattern = con.escape(f"{username}").strip("'")
-            database_pattern = username_pattern + "%%%%"
-            if not config.FLASK_CONFIG["debug"]:
-                sql = f"""
-                    GRANT SELECT, INSERT, UPDATE, DELETE, CREATE, DROP, REFERENCES,
-                    INDEX, ALTER, EXECUTE, CREATE ROUTINE, ALTER ROUTINE
-                        ON `{database_pattern}`.* TO %s@'localhost';"""
-                cur.execute(sql, username)
-            sql = f"""
-                GRANT SELECT, INSERT, UPDATE, DELETE, CREATE, DROP, REFERENCES,
-                INDEX, ALTER, EXECUTE, CREATE ROUTINE, ALTER ROUTINE
-                    ON `{database_pattern}`.* TO %s@'%%';"""
-            cur.execute(sql, username)
-            con.commit()
-            return password
+        # grant the user permissions on all databases of the form
+        # "<username>_something".
+        mysql_provision.create_user(username, password, _hosts(), _prefix_pattern(username))
+        return password
     except Exception as e:
-        con.rollback()
         raise UserError(f"failed to create the new user {username}: {str(e)}") from e
-    finally:
-        con.close()
 
 
 def update_password(username: str, password: str):
@@ -159,26 +122,9 @@ def update_password(username: str, password: str):
     if not re.match(config.VALID_USERNAME, username):
         raise BadUsernameError(f"invalid username '{username}', must be alphanumeric, underscores and hyphens only")
     try:
-        con = _mysql_connection()
-        con.autocommit = False
-        with con.cursor() as cur:
-            # check is username already exists
-            sql = "SELECT User FROM mysql.user WHERE User=%s;"
-            cur.execute(sql, username)
-            if not cur.rowcount:
-                raise Exception(f"username {username} doesn't exist")
-
-            sql = """ALTER USER %s@'%%' IDENTIFIED BY %s;"""
-            cur.execute(sql, (username, password,))
-            if not config.FLASK_CONFIG["debug"]:
-                sql = """ALTER USER %s@'localhost' IDENTIFIED BY %s;"""
-                cur.execute(sql, (username, password,))
-            con.commit()
+        mysql_provision.update_password(username, password, _hosts())
     except Exception as e:
-        con.rollback()
         raise UserError(f"failed to change password for user {username}: {str(e)}") from e
-    finally:
-        con.close()
 
 
 def delete_user(username: str):
@@ -193,23 +139,10 @@ def delete_user(username: str):
     if not re.match(config.VALID_USERNAME, username):
         raise BadUsernameError(f"invalid username '{username}', must be alphanumeric, underscores and hyphens only")
     try:
-        con = _mysql_connection()
-        with con.cursor() as cur:
-            # make sure user exists
-            sql = """SELECT * FROM mysql.user WHERE user=%s"""
-            cur.execute(sql, username)
-            if not cur.rowcount:
-                return
-
-            sql = """DROP USER %s@'localhost';"""
-            cur.execute(sql, username)
-            sql = """DROP USER %s@'%%';"""
-            cur.execute(sql, username)
-            con.commit()
+        # accounts are created for both hosts, except in debug mode, so try to drop both
+        mysql_provision.delete_user(username, ["localhost", "%"])
     except Exception as e:
         raise UserError(f"failed to delete username {username}: {str(e)}") from e
-    finally:
-        con.close()
 
 
 def create_database(username: str, dbname: str, delete: bool = False) -> str:
@@ -228,8 +161,7 @@ def create_database(username: str, dbname: str, delete: bool = False) -> str:
     :raises DatabaseAccessError if the operation fails
     """
     try:
-        con = _mysql_connection()
-        with con.cursor() as cur:
+        with mysql_pool.connection("admin") as con, con.cursor() as cur:
             # make sure name is legit
             user_dbname = dbname
             if not dbname.startswith(f"{username}_"):
@@ -242,10 +174,10 @@ def create_database(username: str, dbname: str, delete: bool = False) -> str:
                     must use digits, lower or upper letters, hypens or underscores")
 
             # make sure deleting or creating is a valid thing to do
-            userdbs = list_dbs(username)
-            if user_dbname in userdbs and not delete:
+            exists = _database_exists(cur, user_dbname)
+            if exists and not delete:
                 raise Exception(f"database name {user_dbname} already exists")
-            elif user_dbname not in userdbs and delete:
+            elif not exists and delete:
                 raise Exception(f"database name {user_dbname} doesn't exist")
 
             # execute the operation
@@ -255,8 +187,6 @@ def create_database(username: str, dbname: str, delete: bool = False) -> str:
             return user_dbname
     except Exception as e:
         raise DatabaseAccessError(f"failed to create new database '{username}': {str(e)}") from e
-    finally:
-        con.close()
 
 
 def main():
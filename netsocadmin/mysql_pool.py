@@ -0,0 +1,292 @@
+"""
+This file contains the shared MySQL connection pools. Rather than connecting and
+authenticating for every query, anything in netsoc admin which talks to MySQL
+borrows an already open connection from here and hands it back when it is done.
+
+There are three named pools:
+    "netsoc"    - connections to the netsoc admin database (config.MYSQL_DETAILS)
+    "admin"     - connections with no default database and dict cursors, used to
+                  manage users' MySQL accounts and databases
+    "provision" - like "admin" but allowing several statements per query, used
+                  by mysql_provision to batch account changes
+"""
+# stdlib
+import contextlib
+import threading
+import time
+import traceback
+import typing
+import weakref
+
+# lib
+import pymysql
+import structlog as logging
+from pymysql.constants import CLIENT, SERVER_STATUS
+
+# local
+import config
+
+logger = logging.getLogger("netsocadmin.mysql_pool")
+
+# errors after which a connection can't be trusted to be handed out again
+_CONNECTION_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+
+class MySQLPoolTimeoutException(Exception):
+    pass
+
+
+class PooledConnection:
+    """
+    PooledConnection wraps a connection borrowed from a ConnectionPool. It behaves
+    like the pymysql connection it wraps, except that close() hands the
+    connection back to the pool instead of closing it.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn: pymysql.connections.Connection):
+        self._pool = pool
+        self._conn = conn
+        self._checked_out = time.monotonic()
+        self._stack = "".join(traceback.format_stack(limit=6)[:-3])
+        self._reported = False
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise pymysql.err.InterfaceError("connection has already been returned to the pool")
+        return getattr(conn, name)
+
+    def close(self, broken: bool = False):
+        """
+        Hands the connection back to the pool. Anything not committed is rolled
+        back first. If broken is True the connection is closed for good.
+        """
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(self, conn, broken)
+
+    def __del__(self):
+        if self.__dict__.get("_conn") is not None:
+            logger.warning(f"MySQL connection was never returned to the pool, borrowed at:\n{self._stack}")
+            self.close()
+
+
+class ConnectionPool:
+    """
+    ConnectionPool hands out open MySQL connections, keeping at most max_size of
+    them open at any time. It only uses the threading module for locking so it is
+    safe to share between threads, or between greenlets once gevent has
+    monkey-patched threading.
+
+    :param connect a function returning a new pymysql connection
+    :param min_size how many idle connections to keep open however long they sit idle
+    :param max_size the maximum number of connections open at once
+    :param timeout how many seconds to wait for a free connection
+    :param idle_timeout idle connections beyond min_size are closed after this many seconds
+    :param leak_timeout a warning is logged for connections borrowed for longer than
+        this many seconds, along with where they were borrowed from
+    """
+
+    def __init__(self, connect: typing.Callable[[], pymysql.connections.Connection],
+                 min_size: int, max_size: int, timeout: float, idle_timeout: float, leak_timeout: float):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.leak_timeout = leak_timeout
+        # (connection, time last returned) pairs, most recently used last
+        self._idle: typing.List[typing.Tuple[pymysql.connections.Connection, float]] = []
+        # weak, so a connection its borrower drops without closing can still be garbage
+        # collected, and its __del__ hand the connection back
+        self._borrowed: typing.MutableSet[PooledConnection] = weakref.WeakSet()
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _close(self, conn: pymysql.connections.Connection):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _prune(self) -> typing.List[pymysql.connections.Connection]:
+        """
+        Takes connections which have been idle too long out of the pool and returns
+        them so they can be closed outside the lock. Must hold self._cond.
+        """
+        now, expired = time.monotonic(), []
+        # the least recently used connections are at the front
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.pop(0)[0])
+        self._open -= len(expired)
+        return expired
+
+    def _report_leaks(self):
+        """
+        Logs a warning, once each, for connections which have been borrowed for
+        longer than leak_timeout. Must hold self._cond.
+        """
+        now = time.monotonic()
+        for borrowed in list(self._borrowed):
+            if not borrowed._reported and now - borrowed._checked_out > self.leak_timeout:
+                borrowed._reported = True
+                logger.warning(
+                    f"MySQL connection borrowed {now - borrowed._checked_out:.0f} seconds ago "
+                    f"and not yet returned, borrowed at:\n{borrowed._stack}"
+                )
+
+    def _acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        conn = None
+        with self._cond:
+            expired = self._prune()
+            self._report_leaks()
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()[0]
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise MySQLPoolTimeoutException(f"no MySQL connection free after {self.timeout} seconds")
+                self._cond.wait(remaining)
+
+        # closing, pinging and connecting go over the network so are done outside the lock
+        for old in expired:
+            self._close(old)
+        try:
+            if conn is not None:
+                try:
+                    conn.ping(reconnect=False)
+                except _CONNECTION_ERRORS:
+                    logger.info("discarding dead MySQL connection and reconnecting")
+                    self._close(conn)
+                    conn = None
+            if conn is None:
+                conn = self.connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        pooled = PooledConnection(self, conn)
+        with self._cond:
+            self._borrowed.add(pooled)
+        return pooled
+
+    def _release(self, pooled: PooledConnection, conn: pymysql.connections.Connection, broken: bool):
+        if not broken and conn.open and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            # don't hand a half finished transaction to whoever borrows this next
+            try:
+                conn.rollback()
+            except _CONNECTION_ERRORS:
+                broken = True
+        with self._cond:
+            self._borrowed.discard(pooled)
+            if broken or not conn.open:
+                self._open -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close(conn)
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[PooledConnection]:
+        """
+        Borrows a connection for the duration of the with block. If the
+        connection fails part way through it is thrown away, so whoever borrows
+        next gets a new one.
+        """
+        pooled = self._acquire()
+        broken = False
+        try:
+            yield pooled
+        except _CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            pooled.close(broken=broken)
+
+    def close(self):
+        """
+        Closes every idle connection in the pool.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+
+def _connect_netsoc() -> pymysql.connections.Connection:
+    return pymysql.connect(**config.MYSQL_DETAILS)
+
+
+def _connect_admin(client_flag: int = 0) -> pymysql.connections.Connection:
+    return pymysql.connect(
+        host=config.MYSQL_DETAILS["host"],
+        user=config.MYSQL_DETAILS["user"],
+        password=config.MYSQL_DETAILS["password"],
+        cursorclass=pymysql.cursors.DictCursor,
+        client_flag=client_flag,
+        read_timeout=3,
+        write_timeout=3,
+        connect_timeout=3,
+    )
+
+
+def _connect_provision() -> pymysql.connections.Connection:
+    return _connect_admin(client_flag=CLIENT.MULTI_STATEMENTS)
+
+
+def _make_pool(connect: typing.Callable[[], pymysql.connections.Connection]) -> ConnectionPool:
+    return ConnectionPool(
+        connect,
+        min_size=config.MYSQL_POOL_MIN_SIZE,
+        max_size=config.MYSQL_POOL_MAX_SIZE,
+        timeout=config.MYSQL_POOL_TIMEOUT,
+        idle_timeout=config.MYSQL_POOL_IDLE_TIMEOUT,
+        leak_timeout=config.MYSQL_POOL_LEAK_TIMEOUT,
+    )
+
+
+_pools = {
+    "netsoc": _make_pool(_connect_netsoc),
+    "admin": _make_pool(_connect_admin),
+    "provision": _make_pool(_connect_provision),
+}
+
+
+def get_pool(name: str) -> ConnectionPool:
+    if name not in _pools:
+        raise ValueError(f"unknown MySQL pool '{name}'")
+    return _pools[name]
+
+
+def connection(name: str = "netsoc") -> typing.ContextManager[PooledConnection]:
+    """
+    connection borrows a connection from one of the named pools for the duration
+    of a with block, e.g.
+
+        with mysql_pool.connection() as conn:
+            with conn.cursor() as c:
+                ...
+
+    :param name which pool to borrow from, "netsoc", "admin" or "provision"
+    """
+    return get_pool(name).connection()
+
+
+def borrow(name: str = "netsoc") -> PooledConnection:
+    """
+    borrow takes a connection from one of the named pools for callers which need
+    to hold on to it beyond a single with block. It must be handed back by
+    calling its close() method.
+    """
+    return get_pool(name)._acquire()
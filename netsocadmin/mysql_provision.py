@@ -0,0 +1,143 @@
+"""
+This file contains the statements which create, change and remove MySQL accounts
+and their databases.
+
+Each operation is sent to the server as one batch of statements over a
+connection which allows multiple statements per query, so setting up an account
+costs a single round trip rather than one per statement. MySQL commits account
+and database statements implicitly so a batch can't be rolled back; instead the
+server stops at the first statement which fails, and create_user drops whatever
+it managed to create.
+"""
+# stdlib
+import typing
+
+# lib
+import pymysql
+import structlog as logging
+
+# local
+import mysql_pool
+
+logger = logging.getLogger("netsocadmin.mysql_provision")
+
+# MySQL error returned when CREATE/ALTER/DROP USER hits an account which does or
+# doesn't exist
+ER_CANNOT_USER = 1396
+
+# privileges members get on their own databases
+USER_PRIVILEGES = (
+    "SELECT, INSERT, UPDATE, DELETE, CREATE, DROP, REFERENCES, "
+    "INDEX, ALTER, EXECUTE, CREATE ROUTINE, ALTER ROUTINE"
+)
+
+Statement = typing.Tuple[str, typing.Sequence[object]]
+
+
+class AccountException(Exception):
+    pass
+
+
+def _identifier(name: str) -> str:
+    """
+    Quotes a database name with backticks. Any "%" is doubled as the statement
+    still goes through pymysql's parameter formatting.
+    """
+    return "`" + name.replace("`", "``").replace("%", "%%") + "`"
+
+
+def _accounts(username: str, hosts: typing.Sequence[str], password: str = None) -> Statement:
+    """
+    Returns the list of accounts for an account statement along with its
+    parameters, i.e. "%s@%s, %s@%s", or "%s@%s IDENTIFIED BY %s, ..." if a
+    password is given.
+    """
+    if password is None:
+        return ", ".join(["%s@%s"] * len(hosts)), [value for host in hosts for value in (username, host)]
+    sql = ", ".join(["%s@%s IDENTIFIED BY %s"] * len(hosts))
+    return sql, [value for host in hosts for value in (username, host, password)]
+
+
+def _is_cannot_user(e: Exception) -> bool:
+    return isinstance(e, pymysql.err.MySQLError) and bool(e.args) and e.args[0] == ER_CANNOT_USER
+
+
+def execute_batch(statements: typing.Sequence[Statement]):
+    """
+    execute_batch sends every statement to the server in a single query and
+    reads back all of their results.
+
+    :param statements (sql, parameters) pairs, parameters being escaped the same
+        way cursor.execute escapes them
+    :raises pymysql.err.MySQLError for the first statement which fails, the ones
+        after it are not run
+    """
+    with mysql_pool.connection("provision") as con, con.cursor() as cur:
+        cur.execute(";\n".join(cur.mogrify(sql, tuple(args)) for sql, args in statements))
+        while cur.nextset():
+            pass
+
+
+def create_user(username: str, password: str, hosts: typing.Sequence[str], database_pattern: str):
+    """
+    create_user creates a MySQL account for every host in hosts and grants it
+    USER_PRIVILEGES on the databases matching database_pattern.
+
+    :raises AccountException if the account already exists
+    """
+    accounts, names = _accounts(username, hosts)
+    identified, identified_args = _accounts(username, hosts, password)
+    try:
+        execute_batch([
+            (f"CREATE USER {identified}", identified_args),
+            (f"GRANT {USER_PRIVILEGES} ON {_identifier(database_pattern)}.* TO {accounts}", names),
+        ])
+    except Exception as e:
+        if _is_cannot_user(e):
+            raise AccountException(f"username {username} already exists") from e
+        # the accounts may have been created before the grant failed
+        try:
+            execute_batch([(f"DROP USER IF EXISTS {accounts}", names)])
+        except Exception as cleanup_error:
+            logger.error(f"failed to clean up MySQL user {username}: {cleanup_error}")
+        raise
+
+
+def update_password(username: str, password: str, hosts: typing.Sequence[str]):
+    """
+    update_password sets the password of the account for every host in hosts.
+
+    :raises AccountException if any of the accounts don't exist
+    """
+    identified, args = _accounts(username, hosts, password)
+    try:
+        execute_batch([(f"ALTER USER {identified}", args)])
+    except Exception as e:
+        if _is_cannot_user(e):
+            raise AccountException(f"username {username} doesn't exist") from e
+        raise
+
+
+def delete_user(username: str, hosts: typing.Sequence[str]):
+    """
+    delete_user removes the account for every host in hosts. Accounts which don't
+    exist are ignored.
+    """
+    accounts, names = _accounts(username, hosts)
+    execute_batch([(f"DROP USER IF EXISTS {accounts}", names)])
+
+
+def create_database_user(name: str, password: str):
+    """
+    create_database_user (re)creates a database and an account of the same name
+    which has all privileges on it. Any existing account or database of that
+    name is dropped first.
+    """
+    database = _identifier(name)
+    execute_batch([
+        ("DROP USER IF EXISTS %s@'%%'", [name]),
+        (f"DROP DATABASE IF EXISTS {database}", []),
+        (f"CREATE DATABASE {database}", []),
+        ("CREATE USER %s@'%%' IDENTIFIED BY %s", [name, password]),
+        (f"GRANT ALL PRIVILEGES ON {database}.* TO %s@'%%'", [name]),
+    ])
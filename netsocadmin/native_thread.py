@@ -0,0 +1,39 @@
+"""
+This file runs blocking, CPU-bound work, e.g. decompressing an archive, on a real
+OS thread.
+
+Under gunicorn's gevent worker threading is monkey-patched, so the threads
+started with threading or concurrent.futures, the jobs pool's included, are
+greenlets sharing the worker's one OS thread. Anything which doesn't do
+cooperative I/O holds up every request on the worker until it finishes. call()
+hands the function to the gevent hub's pool of native threads instead and waits
+for it cooperatively. zlib and file I/O release the GIL, and otherwise the
+interpreter switches threads every few milliseconds, so the event loop keeps
+serving requests alongside it. Without gevent threads are real already, so
+call() just runs the function.
+"""
+# stdlib
+import typing
+
+try:
+    import gevent
+    from gevent import monkey
+except ImportError:
+    gevent = None
+
+T = typing.TypeVar("T")
+
+
+def _patched() -> bool:
+    return gevent is not None and monkey.is_module_patched("threading")
+
+
+def call(function: typing.Callable[..., T], *args) -> T:
+    """
+    call runs function(*args) on a native thread, waiting for it without
+    blocking other greenlets, and returns what it returns or raises what it
+    raises. Calls made from a native thread already run straight away.
+    """
+    if not _patched():
+        return function(*args)
+    return gevent.get_hub().threadpool.apply(function, args)
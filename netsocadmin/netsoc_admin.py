@@ -17,7 +17,12 @@ from sentry_sdk.integrations.flask import FlaskIntegration
 import config
 import logger as nsa_logger
 import login_tools
+import mail_queue
 import routes
+import static_assets
+import token_store
+import username_index
+import wordpress_cache
 
 # init sentry
 if not config.FLASK_CONFIG['debug']:
@@ -39,6 +44,18 @@ nsa_logger.configure()
 
 logger = logging.getLogger("netsocadmin")
 
+# load the taken usernames in the background for the signup form
+username_index.start()
+# delete expired signup and password reset tokens in the background
+token_store.start_sweeper()
+# send queued emails in the background so requests never wait on SendGrid
+mail_queue.start_worker()
+# keep the cached WordPress release that installs are extracted from up to date
+wordpress_cache.start_refresher()
+# fingerprint and precompress the static files, and give templates their URLs
+static_assets.load()
+app.add_template_global(static_assets.asset_url)
+
 
 @app.route('/')
 def index():
@@ -103,11 +120,6 @@ def after_request(response: flask.Response):
     return response
 
 
-@app.route('/robots.txt')
-def robots():
-    return flask.send_file('static/robots.txt')
-
-
 @app.errorhandler(404)
 def not_found(e):
     logger.warn(e)
@@ -130,6 +142,10 @@ def internal_error(e: Exception):
     ), 500
 
 
+# ------------------------------Static File Routes-------------------------------#
+app.add_url_rule('/robots.txt', view_func=routes.Robots.as_view('robots'))
+app.add_url_rule('/assets/<path:path>', view_func=routes.StaticAsset.as_view('asset'))
+
 # ------------------------------Server Signup Routes------------------------------#
 app.add_url_rule('/completeregistration', view_func=routes.CompleteSignup.as_view('completeregistration'))
 app.add_url_rule('/sendconfirmation', view_func=routes.Confirmation.as_view('sendconfirmation'))
@@ -137,6 +153,7 @@ app.add_url_rule('/forgot', view_func=routes.Forgot.as_view('forgot'))
 app.add_url_rule('/resetpassword', view_func=routes.ResetPassword.as_view('resetpassword'))
 app.add_url_rule('/signup', view_func=routes.Signup.as_view('signup'))
 app.add_url_rule('/username', view_func=routes.Username.as_view('username'))
+app.add_url_rule('/mail/<string:mail_id>', view_func=routes.MailStatus.as_view('mail_status'))
 app.add_url_rule('/exception', view_func=routes.ExceptionView.as_view('exception'))
 
 # -------------------------------Login/Logout Routes-----------------------------#
@@ -155,12 +172,24 @@ app.add_url_rule(
     '/backup/<string:username>/<string:timeframe>/<string:backup_date>',
     view_func=routes.Backup.as_view('backup'),
 )
+app.add_url_rule(
+    '/backup/<string:username>/<string:timeframe>/<string:backup_date>/browse',
+    view_func=routes.BackupBrowse.as_view('backupbrowse'),
+)
+app.add_url_rule(
+    '/backup/<string:username>/<string:timeframe>/<string:backup_date>/restore',
+    view_func=routes.BackupRestore.as_view('backuprestore'),
+)
 app.add_url_rule('/change-shell', view_func=routes.ChangeShell.as_view('change_shell'))
 app.add_url_rule('/createdb', view_func=routes.CreateDB.as_view('createdb'))
 app.add_url_rule('/deletedb', view_func=routes.DeleteDB.as_view('deletedb'))
 app.add_url_rule('/changedbpw', view_func=routes.ChangeMySQLPassword.as_view('changedbpw'))
 app.add_url_rule('/changeaccountpw', view_func=routes.ChangeAccountPassword.as_view('changeaccountpw'))
 app.add_url_rule('/wordpressinstall', view_func=routes.WordpressInstall.as_view('wordpressinstall'))
+app.add_url_rule(
+    '/wordpressinstall/<string:job_id>',
+    view_func=routes.WordpressInstallStatus.as_view('wordpressinstallstatus'),
+)
 app.add_url_rule('/tools', view_func=routes.ToolIndex.as_view('tools'))
 app.add_url_rule('/tools/wordpress', view_func=routes.WordpressView.as_view('wordpress'))
 app.add_url_rule('/tools/mysql', view_func=routes.MySQLView.as_view('mysql'))
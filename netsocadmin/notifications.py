@@ -0,0 +1,103 @@
+"""
+This file sends help and sudo requests on to the SysAdmins over every channel
+in config.NOTIFICATION_CHANNELS at once, so the user waits for the slowest
+channel rather than all of them one after another.
+
+A channel is a function taking a Notification and returning True if it was
+delivered. New channels only need adding to CHANNELS and the config, the routes
+don't need to know about them. Channels which haven't finished within
+config.NOTIFICATION_DEADLINE seconds are treated as failed.
+"""
+# stdlib
+import concurrent.futures
+import threading
+import typing
+
+# lib
+import structlog as logging
+
+# local
+import config
+import help_post
+
+logger = logging.getLogger("netsocadmin.notifications")
+
+HELP = "help"
+SUDO = "sudo"
+
+
+class Notification(typing.NamedTuple):
+    kind: str
+    username: str
+    email: str
+    subject: str
+    message: str
+
+
+Channel = typing.Callable[[Notification], bool]
+
+
+def _email(notification: Notification) -> bool:
+    if notification.kind == SUDO:
+        response = help_post.send_sudo_request_email(notification.username, notification.email)
+    else:
+        response = help_post.send_help_email(
+            notification.username, notification.email, notification.subject, notification.message,
+        )
+    if not str(response.status_code).startswith("20"):
+        logger.error(f"non 20x status code for {notification.kind} email: {response.status_code} - {response.body}")
+        return False
+    return True
+
+
+def _discord(notification: Notification) -> bool:
+    return help_post.send_help_webhook(
+        notification.username, notification.email, notification.subject, notification.message,
+    )
+
+
+CHANNELS: typing.Dict[str, Channel] = {
+    "email": _email,
+    "discord": _discord,
+}
+
+_executor: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                config.NOTIFICATION_WORKERS, thread_name_prefix="notification",
+            )
+        return _executor
+
+
+def notify(notification: Notification) -> typing.Dict[str, bool]:
+    """
+    notify sends notification over every channel in config.NOTIFICATION_CHANNELS
+    in parallel, waiting at most config.NOTIFICATION_DEADLINE seconds for them.
+
+    :returns whether each channel, by name, delivered the notification. A
+        channel which raised or missed the deadline counts as not delivered.
+    """
+    executor = _get_executor()
+    futures = {
+        executor.submit(CHANNELS[name], notification): name
+        for name in config.NOTIFICATION_CHANNELS
+    }
+    done, _ = concurrent.futures.wait(futures, timeout=config.NOTIFICATION_DEADLINE)
+    results = {}
+    for future, name in futures.items():
+        if future not in done:
+            logger.error(f"{name} {notification.kind} notification missed the deadline")
+            results[name] = False
+            continue
+        try:
+            results[name] = bool(future.result())
+        except Exception as e:
+            logger.error(f"failed to send {name} {notification.kind} notification: {e}")
+            results[name] = False
+    return results
@@ -3,24 +3,24 @@ This file contains functions which are used during
 registration by the main netsoc admin file.
 """
 # stdlib
-import crypt
 import hashlib
 import random
-import sqlite3
 import string
 import typing
 
 # lib
 import ldap3
 import paramiko
-import pymysql
 
 # local
 import config
-import db
-import mail_helper
-
-ldap_server = ldap3.Server(config.LDAP_HOST, get_info=ldap3.ALL)
+import hashing
+import ldap_tools
+import mail_queue
+import mysql_pool
+import token_store
+import uid_allocator
+import username_index
 
 
 def update_password(user: str, password: str):
@@ -33,24 +33,16 @@ def update_password(user: str, password: str):
     :returns boolean true if the password changed succesfully, false otherwise.
     """
 
-    with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
-        success = conn.search(
-            search_base="dc=netsoc,dc=co",
-            search_filter=f"(&(objectClass=account)(uid={user}))",
-            attributes=["uid", "gidNumber", "userPassword"],
-        )
-        if not success:
+    crypt_password = hashing.hash_password(password)
+    with ldap_tools.connection() as conn:
+        try:
+            return ldap_tools.modify_user(
+                conn,
+                user,
+                {"userPassword": [(ldap3.MODIFY_REPLACE, [f"{crypt_password}"])]},
+            )
+        except ldap_tools.UserNotFoundException:
             return False
-        entry = conn.entries[0]
-
-        crypt_password = "{crypt}" + crypt.crypt(password,  crypt.mksalt(crypt.METHOD_SHA512))
-        if entry["gidNumber"] == 420:
-            conn.modify(f"cn={user},cn=admins,dc=netsoc,dc=co",
-                        {"userPassword": [(ldap3.MODIFY_REPLACE, [f"{crypt_password}"])]})
-        else:
-            conn.modify(f"cn={user},cn=member,dc=netsoc,dc=co",
-                        {"userPassword": [(ldap3.MODIFY_REPLACE, [f"{crypt_password}"])]})
-        return True
 
 
 def send_forgot_email(email: str, server_url: str) -> bool:
@@ -60,12 +52,11 @@ def send_forgot_email(email: str, server_url: str) -> bool:
 
     :param email the email address which the user registered with
     :param server_url the address of the flask application
-    :returns boolean true if the email was sent succesfully, false otherwise.
+    :returns the queued email, or a stand-in response with the token in debug mode
     """
 
-    conn = pymysql.connect(**config.MYSQL_DETAILS)
     user = ""
-    with conn.cursor() as c:
+    with mysql_pool.connection() as conn, conn.cursor() as c:
         sql = "SELECT uid FROM users WHERE email=%s;"
         c.execute(sql, (email,))
         user = c.fetchone()[0]
@@ -87,7 +78,7 @@ Yours,
 The UCC Netsoc SysAdmin Team
 """
     if not config.FLASK_CONFIG['debug']:
-        response = mail_helper.send_mail(
+        response = mail_queue.enqueue(
             "username.reminder@netsoc.co",
             email,
             "Account Details",
@@ -104,7 +95,7 @@ def send_confirmation_email(email: str, server_url: str) -> bool:
 
     :param email the email address which the user registered with
     :param server_url the address of the flask application
-    :returns boolean true if the email was sent succesfully, false otherwise.
+    :returns the queued email, or a stand-in response with the token in debug mode
     """
     uri = generate_uri(email)
     message_body = f"""
@@ -119,7 +110,7 @@ Yours,
 The UCC Netsoc SysAdmin Team
 """
     if not config.FLASK_CONFIG['debug']:
-        response = mail_helper.send_mail(
+        response = mail_queue.enqueue(
             "server.registration@netsoc.co",
             email,
             "Account Registration",
@@ -138,7 +129,7 @@ def send_details_email(email: str, user: str, password: str, mysql_pass: str) ->
     :param email the email address which this email is being sent
     :param user the username which you log into the servers with
     :param password the password which you log into the servers with
-    :returns True if the email has been sent succesfully, False otherwise
+    :returns True if the email has been queued to be sent, False otherwise
     """
 
     message_body = f"""
@@ -175,7 +166,7 @@ P.S. We are always changing and improving our services, with new features and se
 Follow us on social media or join our discord at https://discord.gg/qPUmuYw to keep up to date with our latest updates!
     """
     if not config.FLASK_CONFIG['debug']:
-        response = mail_helper.send_mail(
+        response = mail_queue.enqueue(
             "server.registration@netsoc.co",
             email,
             "Account Registration",
@@ -195,24 +186,12 @@ def generate_uri(email: str) -> str:
     :param email the email used to sign up with
     :returns the generated uri string or None of there was a failure
     """
-    try:
-        chars = string.ascii_uppercase + string.digits
-        size = 10
-        id_ = "".join(random.choice(chars) for _ in range(size))
-        uri = hashlib.sha256(id_.encode()).hexdigest()
-
-        conn = sqlite3.connect(config.TOKEN_DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT INTO uris VALUES (?, ?)", (email, uri))
-        conn.commit()
-    except sqlite3.OperationalError:
-        c.execute(db.RESET)
-        c.execute(db.CREATE)
-        c.execute("INSERT INTO uris VALUES (?, ?)", (email, uri))
-        conn.commit()
-    finally:
-        if conn:
-            conn.close()
+    chars = string.ascii_uppercase + string.digits
+    size = 10
+    id_ = "".join(random.choice(chars) for _ in range(size))
+    uri = hashlib.sha256(id_.encode()).hexdigest()
+
+    token_store.add(email, uri)
     return uri
 
 
@@ -225,13 +204,7 @@ def good_token(email: str, uri: str) -> bool:
     :returns True if the token is valid (i.e. sent by us to this email),
         False otherwise (including if a DB error occured)
     """
-    with sqlite3.connect(config.TOKEN_DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM uris WHERE uri=?", (uri,))
-        row = c.fetchone()
-        if not row or row[0] != email:
-            return False
-    return True
+    return token_store.email_for(uri) == email
 
 
 def remove_token(email: str):
@@ -240,10 +213,7 @@ def remove_token(email: str):
 
     :param email the email address corresponding to the token being removed
     """
-    with sqlite3.connect(config.TOKEN_DB_NAME) as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM uris WHERE email=?", (email,))
-        conn.commit()
+    token_store.remove(email)
 
 
 class LDAPException(Exception):
@@ -269,28 +239,29 @@ def add_ldap_user(user: str) -> typing.Dict[str, object]:
         "gid": config.LDAP_USER_GROUP_ID,
         "home_dir": f"/home/users/{user}",
     }
-    with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
+    with ldap_tools.connection() as conn:
         success = conn.search(
-            search_base="cn=member,dc=netsoc,dc=co",
-            search_filter="(objectClass=account)",
-            attributes=["uidNumber", "uid"],
+            search_base="dc=netsoc,dc=co",
+            search_filter=f"(&(objectClass=account)(uid={ldap3.utils.conv.escape_filter_chars(user)}))",
+            attributes=ldap3.NO_ATTRIBUTES,
+            size_limit=1,
         )
         if not success and conn.last_error is not None:
             raise LDAPException(f"error adding ldap user: {conn.last_error}")
+        if len(conn.entries) > 0:
+            raise UserExistsInLDAPException(f"{user} exists in LDAP")
 
-        last = 0
-        for account in conn.entries:
-            if account["uid"] == user:
-                raise UserExistsInLDAPException(f"{user} exists in LDAP")
-            last = account["uidNumber"]
-        next_uid = int(str(last)) + 1
+        try:
+            next_uid = uid_allocator.allocate(conn)
+        except uid_allocator.UIDAllocationException as e:
+            raise LDAPException(f"error adding ldap user: {e}") from e
         info["uid_num"] = next_uid
 
         # creates initial password for user. They will be asked to change
         # this when they first log in.
         password = "".join(random.choice(string.ascii_letters + string.digits) for _ in range(12))
 
-        crypt_password = "{crypt}" + crypt.crypt(password,  crypt.mksalt(crypt.METHOD_SHA512))
+        crypt_password = hashing.hash_password(password)
         info["password"] = password
         info["crypt_password"] = crypt_password
 
@@ -320,6 +291,7 @@ def add_ldap_user(user: str) -> typing.Dict[str, object]:
         )
         if not success:
             raise LDAPException(f"error adding ldap user: {conn.last_error}")
+    username_index.add(user)
     return info
 
 
@@ -331,7 +303,9 @@ def remove_ldap_user(user: str) -> bool:
     :returns True if successful
     """
 
-    with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
+    ldap_tools.forget_dn(user)
+    username_index.discard(user)
+    with ldap_tools.connection() as conn:
         return conn.delete(f"cn={user},cn=member,dc=netsoc,dc=co")
 
 
@@ -356,7 +330,7 @@ def send_reset_email(email: str, user: str, password: str) -> bool:
     :param email the email address which this email is being sent
     :param user the username which you log into the servers with
     :param password the password which you log into the servers with
-    :returns True if the email has been sent succesfully, False otherwise
+    :returns True if the email has been queued to be sent, False otherwise
     """
 
     message_body = f"""
@@ -380,7 +354,7 @@ Yours,
 The UCC Netsoc SysAdmin Team
     """
     if not config.FLASK_CONFIG['debug']:
-        response = mail_helper.send_mail(
+        response = mail_queue.enqueue(
             "password.reset@netsoc.co",
             email,
             "Password Reset",
@@ -395,16 +369,18 @@ class MySQLException(Exception):
     pass
 
 
-def add_netsoc_database(info: typing.Dict[str, str]) -> pymysql.Connection:
+def add_netsoc_database(info: typing.Dict[str, str]) -> mysql_pool.PooledConnection:
     """
     Adds a user's details to the Netsoc MySQL database.
 
     :param info a dictionary containing all the information
         collected during signup to go in the database.
-    :returns Connection object to rollback the transaction if needed
+    :returns Connection object to commit or rollback the transaction, which
+        must be closed afterwards to hand it back to the pool
     """
+    conn = None
     try:
-        conn = pymysql.connect(**config.MYSQL_DETAILS)
+        conn = mysql_pool.borrow()
         conn.begin()
         with conn.cursor() as c:
             sql = \
@@ -421,6 +397,8 @@ def add_netsoc_database(info: typing.Dict[str, str]) -> pymysql.Connection:
             c.execute(sql, row)
         return conn
     except Exception as e:
+        if conn is not None:
+            conn.close()
         raise MySQLException(e)
 
 
@@ -432,9 +410,8 @@ def has_account(email: str) -> bool:
     :returns True if their already as an account with that email,
         False otherwise.
     """
-    conn = pymysql.connect(**config.MYSQL_DETAILS)
-    with conn.cursor() as c:
-        sql = "SELECT * FROM users WHERE email=%s;"
+    with mysql_pool.connection() as conn, conn.cursor() as c:
+        sql = "SELECT 1 FROM users WHERE email=%s LIMIT 1;"
         c.execute(sql, (email,))
         if c.fetchone():
             return True
@@ -450,7 +427,7 @@ def is_in_ldap(username: str) -> bool:
     """
     if username in config.USERNAME_BLACKLIST:
         return True
-    with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
+    with ldap_tools.connection() as conn:
         username = ldap3.utils.conv.escape_filter_chars(username)
         return conn.search(
             search_base="dc=netsoc,dc=co",
@@ -1,15 +1,17 @@
 """Imports from all the files in the directory and makes the imports available to other parts of the system"""
+from .assets import Robots, StaticAsset
 from .exception import ExceptionView
 from .login import Login, Logout
+from .mail import MailStatus
 from .signup import CompleteSignup, ResetPassword, Forgot, Confirmation, Signup, Username
-from .tools.backups import Backup, BackupsView
+from .tools.backups import Backup, BackupBrowse, BackupRestore, BackupsView
 from .tools.help import Help, HelpView
 from .tools.index import ToolIndex
 from .tools.mysql import ChangeMySQLPassword, CreateDB, DeleteDB, MySQLView
 from .tools.account import ChangeAccountPassword, AccountView
 from .tools.shells import ChangeShell, ShellsView
 from .tools.sudo import CompleteSudo, Sudo
-from .tools.wordpress import WordpressInstall, WordpressView
+from .tools.wordpress import WordpressInstall, WordpressInstallStatus, WordpressView
 from .tutorials import Tutorials
 from .view import TemplateView
 
@@ -27,6 +29,7 @@ __all__ = [
     "Confirmation",
     "Signup",
     "Username",
+    "MailStatus",
 
     # Sudo
     "CompleteSudo",
@@ -35,6 +38,8 @@ __all__ = [
     # Tools
     "ToolIndex",
     "Backup",
+    "BackupBrowse",
+    "BackupRestore",
     "BackupsView",
     "ChangeShell",
     "ShellsView",
@@ -47,7 +52,11 @@ __all__ = [
     "Help",
     "HelpView",
     "WordpressInstall",
+    "WordpressInstallStatus",
     "WordpressView",
     # Tutorials
     "Tutorials",
+    # Static files
+    "Robots",
+    "StaticAsset",
 ]
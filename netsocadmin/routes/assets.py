@@ -0,0 +1,78 @@
+# lib
+import flask
+import structlog as logging
+from flask.views import View
+
+# local
+import config
+import static_assets
+
+__all__ = [
+    "Robots",
+    "StaticAsset",
+]
+
+# a year, as long as browsers will cache for anyway
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def send_asset(asset: static_assets.Asset) -> flask.Response:
+    """
+    Sends the best precompressed copy of a built asset the client accepts.
+    """
+    path, encoding = static_assets.choose(asset, flask.request.accept_encodings)
+    response = flask.send_file(path, mimetype=asset.mimetype, conditional=True)
+    # newer versions of flask default to no-cache and name the file, which would be the .gz for compressed copies
+    if response.cache_control.no_cache:
+        # older werkzeug raises a KeyError clearing a directive that isn't set
+        response.cache_control.no_cache = None
+    response.headers.pop("Content-Disposition", None)
+    if encoding is not None:
+        response.content_encoding = encoding
+    if asset.encodings:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+class StaticAsset(View):
+    """
+    Route: /assets/<path>
+        Serves a fingerprinted static file built by static_assets. The URL changes whenever the file does, so it is
+        sent with headers telling browsers to cache it forever without revalidating.
+    """
+    # Logger instance
+    logger = logging.getLogger("netsocadmin.staticasset")
+    # Specify which method(s) are allowed to be used to access the route
+    methods = ["GET"]
+
+    def dispatch_request(self, path: str) -> flask.Response:
+        asset = static_assets.find(path)
+        if asset is None:
+            return flask.abort(404)
+        response = send_asset(asset)
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        # set as a bare directive, older werkzeug has no cache_control.immutable
+        response.cache_control["immutable"] = None
+        return response
+
+
+class Robots(View):
+    """
+    Route: /robots.txt
+        Serves robots.txt, which has to be at a fixed URL so is only cached for config.STATIC_UNVERSIONED_MAX_AGE.
+    """
+    # Logger instance
+    logger = logging.getLogger("netsocadmin.robots")
+    # Specify which method(s) are allowed to be used to access the route
+    methods = ["GET"]
+
+    def dispatch_request(self) -> flask.Response:
+        asset = static_assets.get("robots.txt")
+        if asset is None:
+            response = flask.send_from_directory(config.STATIC_FOLDER, "robots.txt")
+        else:
+            response = send_asset(asset)
+        response.cache_control.public = True
+        response.cache_control.max_age = config.STATIC_UNVERSIONED_MAX_AGE
+        return response
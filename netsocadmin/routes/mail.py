@@ -0,0 +1,30 @@
+# lib
+import flask
+import structlog as logging
+from flask.views import View
+
+# local
+import mail_queue
+
+__all__ = [
+    'MailStatus',
+]
+
+
+class MailStatus(View):
+    """
+    Route: /mail/<mail_id>
+        Returns how a queued email is getting on as JSON, i.e. {"status": "sent"},
+        so pages can check whether the email they promised has gone out. The id is
+        random and unguessable, and nothing but the status is given away.
+    """
+    # Logger instance
+    logger = logging.getLogger("netsocadmin.mailstatus")
+    # Specify which method(s) are allowed to be used to access the route
+    methods = ["GET"]
+
+    def dispatch_request(self, mail_id: str) -> flask.Response:
+        status = mail_queue.status(mail_id)
+        if status is None:
+            return flask.abort(404)
+        return flask.jsonify(status=status)
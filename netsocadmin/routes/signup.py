@@ -11,6 +11,7 @@ from flask.views import View
 import config
 import mysql
 import register_tools
+import username_index
 
 __all__ = [
     'CompleteSignup',
@@ -418,9 +419,9 @@ class Username(View):
             self.logger.info(f"bad token {token} used for email {email}")
             return flask.abort(403)
 
-        # check db for username
+        # check the in-memory index for username, CompleteSignup checks LDAP for real
         requested_username = flask.request.headers["uid"]
-        if register_tools.is_in_ldap(requested_username):
+        if username_index.is_taken(requested_username):
             self.logger.info(f"username {requested_username} is in use")
             return "Not available"
         self.logger.info(f"username {requested_username} available")
@@ -1,18 +1,83 @@
 # stdlib
 import os
+import posixpath
 import re
+import typing
+import unicodedata
+import urllib.parse
 
 # lib
 import flask
 import structlog as logging
+from werkzeug.wsgi import wrap_file
 
 # local
+import backup_browser
 import backup_tools
 import config
+import jobs
+import login_tools
 
 from .index import ProtectedToolView
 
 
+def _backup_path(logger, username: str, timeframe: str, backup_date: str) -> str:
+    """
+    Validates the parameters of the backup routes and returns the path of the backup they refer to, aborting with a
+    400 if they're malformed or a 403 if the backup belongs to someone else and the user isn't an admin.
+    """
+    if not re.match(config.VALID_USERNAME, username) \
+        or not re.fullmatch(r"[0-9]{4}-[0-9]{2}-[0-9]{2}", backup_date) \
+            or timeframe not in backup_tools.TIMEFRAMES:
+        flask.abort(400)
+    if username != flask.session["username"] and not login_tools.is_admin():
+        logger.warning(f"{flask.session['username']} tried to access a backup of {username}")
+        flask.abort(403)
+    return os.path.join(config.BACKUPS_DIR, username, timeframe, f"{backup_date}.tgz")
+
+
+def _indexed(logger, path: str) -> typing.Optional[flask.Response]:
+    """
+    Returns None if the backup at path has been indexed, otherwise the response telling the client where indexing it
+    has got to: a 202 while it's being indexed, starting that if need be, or a 500 if indexing it failed. A backup
+    which failed to index isn't tried again unless it has changed since, so a corrupt one isn't read over and over.
+    """
+    try:
+        if backup_browser.is_indexed(path):
+            return None
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return flask.abort(404)
+    job = jobs.latest("backup-index", path)
+    if job is None or job.state == jobs.SUCCEEDED or (job.state == jobs.FAILED and job.finished_at < mtime):
+        job = jobs.submit("backup-index", path, lambda progress: backup_browser.build_index(path))
+        logger.info(f"backup index job {job.id} is {job.state} for {path}")
+    # the owner is the backup's path on this server
+    body = {key: value for key, value in job._asdict().items() if key != "owner"}
+    if job.state == jobs.FAILED:
+        logger.error(f"backup index job {job.id} failed for {path}: {job.error}")
+        return flask.make_response(flask.jsonify(body), 500)
+    response = flask.jsonify(body)
+    response.status_code = 202
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def _attachment(response: flask.Response, name: str):
+    """
+    Marks response as a download called name, which comes from inside a backup so may contain quotes or non-ASCII
+    characters. Like flask.send_file, this gives an ASCII fallback for old browsers along with the full name encoded
+    as filename*, since header values must be latin-1.
+    """
+    fallback = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").strip() or "download"
+    response.headers.set(
+        "Content-Disposition",
+        "attachment",
+        filename=fallback,
+        **{"filename*": f"UTF-8''{urllib.parse.quote(name, safe='')}"},
+    )
+
+
 class BackupsView(ProtectedToolView):
     template_file = "backups.html"
 
@@ -21,16 +86,20 @@ class BackupsView(ProtectedToolView):
     active = "backups"
 
     def dispatch_request(self):
+        catalogue = backup_tools.catalogue(flask.session["username"])
         return self.render(
-            monthly_backups=backup_tools.list_backups(flask.session["username"], "monthly"),
-            weekly_backups=backup_tools.list_backups(flask.session["username"], "weekly"),
+            monthly_backups=catalogue.monthly,
+            weekly_backups=catalogue.weekly,
         )
 
 
 class Backup(ProtectedToolView):
     """
     Route: /backup/{username}/{timeframe}/{backup_date}
-        This route returns the requested backup.
+        This route returns the requested backup. Users can only download their own backups, unless they are an admin.
+        Downloads can be resumed with Range requests, and have a strong ETag made from the backup's size and mtime so
+        they can be revalidated. With config.BACKUP_SENDFILE set the file itself is sent by the reverse proxy rather
+        than by this worker.
 
     :param username: The server username of the user needing their backup.
     :param timeframe: The timeframe of the requested backup.
@@ -41,12 +110,93 @@ class Backup(ProtectedToolView):
     # Logger instance
     logger = logging.getLogger("netsocadmin.backup")
 
-    def dispatch_request(self, username: str, timeframe: str, backup_date: str) -> str:
-        # Validate the parameters
-        if not re.match(config.VALID_USERNAME, username) \
-            or not re.match(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}", backup_date) \
-                or timeframe not in ["weekly", "monthly"]:
-            return flask.abort(400)
-        # Retrieve the backup and send it to the user
-        backups_base_dir = os.path.join(config.BACKUPS_DIR, username, timeframe)
-        return flask.send_from_directory(backups_base_dir, f"{backup_date}.tgz")
+    def dispatch_request(self, username: str, timeframe: str, backup_date: str) -> flask.Response:
+        path = _backup_path(self.logger, username, timeframe, backup_date)
+        filename = os.path.basename(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return flask.abort(404)
+
+        if config.BACKUP_SENDFILE == "x-accel-redirect":
+            response = flask.Response(mimetype="application/gzip")
+            response.headers["X-Accel-Redirect"] = f"{config.BACKUP_ACCEL_PREFIX}/{username}/{timeframe}/{filename}"
+        elif config.BACKUP_SENDFILE == "x-sendfile":
+            response = flask.Response(mimetype="application/gzip")
+            response.headers["X-Sendfile"] = path
+        else:
+            fh = open(path, "rb")
+            response = flask.Response(
+                wrap_file(flask.request.environ, fh),
+                mimetype="application/gzip",
+                direct_passthrough=True,
+            )
+            response.set_etag(f"{st.st_size:x}-{st.st_mtime_ns:x}")
+            response.last_modified = st.st_mtime
+            # answers If-None-Match with a 304 and Range with a 206 of just the requested bytes
+            response.make_conditional(flask.request, accept_ranges=True, complete_length=st.st_size)
+            if response.status_code == 304:
+                fh.close()
+        response.headers["Content-Disposition"] = f"attachment; filename={username}-{timeframe}-{filename}"
+        return response
+
+
+class BackupBrowse(ProtectedToolView):
+    """
+    Route: /backup/{username}/{timeframe}/{backup_date}/browse?path={path}
+        Lists the directory at path inside a backup as JSON, so users can find the files they want to restore without
+        downloading the whole backup. The first time a backup is browsed it has to be indexed, which is done as a job:
+        until it's finished this returns the job with a 202, and the client should ask again.
+
+    :param path: the directory to list, relative to the top of the backup. Defaults to the top.
+    """
+    # Logger instance
+    logger = logging.getLogger("netsocadmin.backupbrowse")
+
+    def dispatch_request(self, username: str, timeframe: str, backup_date: str) -> flask.Response:
+        path = _backup_path(self.logger, username, timeframe, backup_date)
+        pending = _indexed(self.logger, path)
+        if pending is not None:
+            return pending
+        directory = backup_browser.member(path, flask.request.args.get("path", ""))
+        if directory is None or directory.type != backup_browser.DIRECTORY:
+            return flask.abort(404)
+        return flask.jsonify({
+            "path": directory.path,
+            "entries": [
+                {"name": entry.name, "type": entry.type, "size": entry.size, "mtime": entry.mtime}
+                for entry in backup_browser.list_directory(path, directory.path)
+            ],
+        })
+
+
+class BackupRestore(ProtectedToolView):
+    """
+    Route: /backup/{username}/{timeframe}/{backup_date}/restore?path={path}
+        Downloads a single file out of a backup, or a directory as an uncompressed tar of just that directory. Like
+        browse, this returns a 202 with the indexing job if the backup hasn't been indexed yet.
+
+    :param path: the file or directory to download, relative to the top of the backup. Defaults to the top.
+    """
+    # Logger instance
+    logger = logging.getLogger("netsocadmin.backuprestore")
+
+    def dispatch_request(self, username: str, timeframe: str, backup_date: str) -> flask.Response:
+        path = _backup_path(self.logger, username, timeframe, backup_date)
+        pending = _indexed(self.logger, path)
+        if pending is not None:
+            return pending
+        found = backup_browser.member(path, flask.request.args.get("path", ""))
+        if found is None or found.type == backup_browser.SYMLINK:
+            return flask.abort(404)
+
+        name = posixpath.basename(found.path) or f"{username}-{timeframe}-{backup_date}"
+        if found.type == backup_browser.FILE:
+            response = flask.Response(backup_browser.read_file(path, found), mimetype="application/octet-stream")
+            response.content_length = found.size
+        else:
+            response = flask.Response(backup_browser.read_subtree(path, found), mimetype="application/x-tar")
+            name += ".tar"
+        self.logger.info(f"{flask.session['username']} restoring {found.path or '/'} from {path}")
+        _attachment(response, name)
+        return response
@@ -3,7 +3,7 @@ import flask
 import structlog as logging
 
 # local
-import help_post
+import notifications
 
 from .index import ProtectedToolView
 
@@ -40,37 +40,19 @@ class Help(HelpView):
             self.logger.info("not all fields specified")
             return self.render(help_error="Please specify all fields", help_active=True)
 
-        sent_email, sent_discord = True, True
-
-        # Send the email
-        try:
-            email_resp = help_post.send_help_email(flask.session["username"], email, subject, message)
-            if not str(email_resp.status_code).startswith("20"):
-                self.logger.error(f"non 20x status code for help email: {email_resp.status_code} - {email_resp.body}")
-            sent_email = str(email_resp.status_code).startswith("20")
-        except Exception as e:
-            self.logger.error(f"failed to send help email: {str(e.body)}")
-
-        # Try and send to Discord
-        try:
-            sent_discord = help_post.send_help_webhook(flask.session["username"], email, subject, message)
-        except Exception as e:
-            self.logger.error(f"failed to send help discord webhook: {str(e)}")
+        # send to every channel at once
+        results = notifications.notify(notifications.Notification(
+            notifications.HELP, flask.session["username"], email, subject, message,
+        ))
 
         # Check that at least one form of communication was sent
-        if not sent_email and not sent_discord:
+        if not any(results.values()):
             # If not, report an error to the user
             return self.render(
                 help_error="There was a problem :( Please email netsoc@uccsocieties.ie instead",
                 help_active=True,
             )
         # Otherwise when things are okay, report back stating so
-        message = ''
-        if sent_email:
-            message += "sent help email"
-        if sent_discord and sent_email:
-            message += " and "
-        if sent_discord:
-            message += "fired discord webhook"
+        message = "sent help request over " + " and ".join(name for name, sent in results.items() if sent)
         self.logger.info(message)
         return self.render(help_success=True, help_active=True)
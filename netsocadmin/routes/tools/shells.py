@@ -5,6 +5,7 @@ import structlog as logging
 
 # local
 import config
+import ldap_tools
 
 from .index import ProtectedToolView, ProtectedView
 
@@ -17,18 +18,8 @@ class ShellsView(ProtectedToolView):
     active = "shells"
 
     def dispatch_request(self, **data):
-        ldap_server = ldap3.Server(config.LDAP_HOST, get_info=ldap3.ALL)
-        with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
-            username = ldap3.utils.conv.escape_filter_chars(flask.session["username"])
-            success = conn.search(
-                search_base="dc=netsoc,dc=co",
-                search_filter=f"(&(objectClass=account)(uid={username}))",
-                attributes=["loginShell"],
-            )
-            if not success or len(conn.entries) != 1:
-                shell = "Bash"
-            else:
-                shell = conn.entries[0]["loginShell"].value
+        profile = ldap_tools.get_profile(flask.session["username"])
+        shell = profile.login_shell if profile is not None and profile.login_shell else config.SHELL_PATHS["bash"]
         inverse_shells = {v: k for k, v in config.SHELL_PATHS.items()}
         return self.render(
             login_shells=[(k, k.capitalize()) for k in config.SHELL_PATHS],
@@ -54,34 +45,20 @@ class ChangeShell(ProtectedView):
         if shell_path is None:
             return "Invalid shell received", 400
         # Attempt to update LDAP for the logged in user to update their loginShell
-        ldap_server = ldap3.Server(config.LDAP_HOST, get_info=ldap3.ALL)
-        with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
-            # Find the user
+        with ldap_tools.connection() as conn:
             username = flask.session["username"]
-            # Put member first since it's the most probable
-            groups = ["member", "admins", "committee"]
-            found = False
-            for group in groups:
-                success = conn.search(
-                    search_base=f"cn={group},dc=netsoc,dc=co",
-                    search_filter=f"(&(objectClass=account)(uid={username}))",
-                )
-                if success:
-                    found = True
-                    break
-            if not found:
-                self.logger.info(f"user {username} not found. Could not update shell")
-                return "Invalid user received. Please contact us for assistance", 500
-
-            # Modify the user now
             try:
-                success = conn.modify(
-                    dn=f"cn={username},cn={group},dc=netsoc,dc=co",
-                    changes={"loginShell": (ldap3.MODIFY_REPLACE, [shell_path])},
+                success = ldap_tools.modify_user(
+                    conn,
+                    username,
+                    {"loginShell": (ldap3.MODIFY_REPLACE, [shell_path])},
                 )
                 if not success:
                     self.logger.error(f"error changing shell for {username}: {conn.last_error}")
                     return "failed to set shell", 500
+            except ldap_tools.UserNotFoundException:
+                self.logger.info(f"user {username} not found. Could not update shell")
+                return "Invalid user received. Please contact us for assistance", 500
             except Exception as e:
                 self.logger.error(f"error changing shell for {username}: {e}")
                 return "failed to set shell", 500
@@ -3,7 +3,7 @@ import flask
 import structlog as logging
 
 # local
-import help_post
+import notifications
 
 from .index import ProtectedToolView
 
@@ -45,29 +45,17 @@ class CompleteSudo(Sudo):
         email = flask.request.form["email"]
         reason = flask.request.form["reason"]
         username = flask.session["username"]
-        email_failed = False
-        discord_failed = False
-
-        # Try to send the email
-        try:
-            email_resp = help_post.send_sudo_request_email(username, email)
-            if not str(email_resp.status_code).startswith("20"):
-                self.logger.error(f"non 20x status code for help email: {email_resp.status_code} - {email_resp.body}")
-            email_failed = not str(email_resp.status_code).startswith("20")
-        except Exception as e:
-            email_failed = True
-            self.logger.error(f"failed to send email: {e}")
-
-        # Try to send a message to the Discord
-        try:
-            subject = "Feynman Account Request"
-            msg = f"This user wants an account on Feynman pls.\nReason: {reason}"
-            discord_failed = help_post.send_help_webhook(username, email, subject, msg)
-        except Exception as e:
-            discord_failed = True
-            self.logger.error(f"failed to fire discord webhook: {e}")
-
-        if discord_failed and email_failed:
+
+        # send to every channel at once
+        results = notifications.notify(notifications.Notification(
+            notifications.SUDO,
+            username,
+            email,
+            "Feynman Account Request",
+            f"This user wants an account on Feynman pls.\nReason: {reason}",
+        ))
+
+        if not any(results.values()):
             caption = "There was a problem :("
             message = "Please email netsoc@uccsocieties.ie instead!"
         else:
@@ -7,6 +7,7 @@ import structlog as logging
 
 # local
 import config
+import jobs
 import wordpress_install
 
 from .index import ProtectedToolView
@@ -30,23 +31,39 @@ class WordpressInstall(ProtectedToolView):
     """
     Route: wordpressinstall
         This endpoint only allows a GET method.
-        If a user is authenticated and accessed this endpoint, then wordpress is installed to their public_html
-        directory.
-        This endpoint is pinged via an AJAX request on the clients' side.
+        If a user is authenticated and accessed this endpoint, then a job installing wordpress to their public_html
+        directory is started, or the one already running for them is returned if they have one.
+        This endpoint is pinged via an AJAX request on the clients' side, which then polls wordpressinstall/<job_id>.
     """
     # Logger instance
     logger = logging.getLogger("netsocadmin.wordpressinstall")
 
-    def dispatch_request(self) -> Tuple[str, int]:
+    def dispatch_request(self) -> Tuple[flask.Response, int]:
         username = flask.session["username"]
-        try:
-            wordpress_install.get_wordpress(
-                f"/home/users/{username}",
-                username,
-                config.FLASK_CONFIG["debug"]
-            )
-            self.logger.info(f"wordpress install successful for {username}")
-            return username, 200
-        except Exception as e:
-            self.logger.error(f"wordpress install failed for {username}: {e}")
-            return username, 500
+        user_dir = f"/home/users/{username}"
+        is_debug_mode = config.FLASK_CONFIG["debug"]
+        job = jobs.submit(
+            "wordpress",
+            username,
+            lambda progress: wordpress_install.get_wordpress(user_dir, username, is_debug_mode, progress.step),
+        )
+        self.logger.info(f"wordpress install job {job.id} is {job.state} for {username}")
+        return flask.jsonify(job._asdict()), 202
+
+
+class WordpressInstallStatus(ProtectedToolView):
+    """
+    Route: wordpressinstall/<job_id>
+        Returns the state of a wordpress install job, and how long each of its steps took, as JSON.
+        Users can only see their own jobs.
+    """
+    # Logger instance
+    logger = logging.getLogger("netsocadmin.wordpressinstallstatus")
+
+    def dispatch_request(self, job_id: str) -> flask.Response:
+        job = jobs.get(job_id)
+        if job is None or job.kind != "wordpress" or job.owner != flask.session["username"]:
+            return flask.abort(404)
+        if job.state == jobs.FAILED:
+            self.logger.error(f"wordpress install failed for {job.owner}: {job.error}")
+        return flask.jsonify(job._asdict())
@@ -2,9 +2,9 @@ function installWordpress() {
 
 	/*
 	Disables the install button so that it doesnt carry out the installation twice.
-	Reveals the progress bar. 
-	Sends a HTTP GET reqeust to the server, telling it to install wordpress to the user's directory
-	(Uses the /wordpressinstall API endpoint)
+	Reveals the progress bar.
+	Sends a HTTP GET reqeust to the server, telling it to start installing wordpress to the user's directory
+	(Uses the /wordpressinstall API endpoint), then polls the install job until it has finished.
 	*/
 
 	document.getElementById("wordpress-install-button").style.display = "none";
@@ -14,16 +14,50 @@ function installWordpress() {
 	var request = new XMLHttpRequest()
 	request.onreadystatechange = () => {
 		if(request.readyState !== 4) return;
-		document.getElementById("wordpress-progress").style.display = "none";
-		document.getElementById("wordpress-install-description").style.display = "none";
-		if(request.status === 200) {
-			document.getElementById("wordpress-setup-link").style.display = "block";
-			console.log("Wordpress install complete");
+		if(request.status === 202) {
+			pollWordpressInstall(JSON.parse(request.responseText).id);
 		} else {
-			document.getElementById("wordpress-setup-fail").style.display = "block";
+			finishWordpressInstall(false);
 		}
 	}
 	request.open("GET", "/wordpressinstall");
 	request.send();
 }
 
+function pollWordpressInstall(jobId) {
+
+	/*
+	Checks on the install job every second, showing which step it is on, until it succeeds or fails.
+	*/
+
+	var request = new XMLHttpRequest()
+	request.onreadystatechange = () => {
+		if(request.readyState !== 4) return;
+		if(request.status !== 200) {
+			finishWordpressInstall(false);
+			return;
+		}
+		var job = JSON.parse(request.responseText);
+		if(job.state === "succeeded" || job.state === "failed") {
+			finishWordpressInstall(job.state === "succeeded");
+			return;
+		}
+		if(job.step) {
+			document.getElementById("wordpress-install-description").innerHTML = "Installing WordPress (" + job.step + ")...";
+		}
+		setTimeout(() => pollWordpressInstall(jobId), 1000);
+	}
+	request.open("GET", "/wordpressinstall/" + encodeURIComponent(jobId));
+	request.send();
+}
+
+function finishWordpressInstall(succeeded) {
+	document.getElementById("wordpress-progress").style.display = "none";
+	document.getElementById("wordpress-install-description").style.display = "none";
+	if(succeeded) {
+		document.getElementById("wordpress-setup-link").style.display = "block";
+		console.log("Wordpress install complete");
+	} else {
+		document.getElementById("wordpress-setup-fail").style.display = "block";
+	}
+}
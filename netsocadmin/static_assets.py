@@ -0,0 +1,183 @@
+"""
+This file builds the files in config.STATIC_FOLDER into fingerprinted, precompressed
+copies in config.STATIC_BUILD_DIR, which are served from /assets with headers
+telling browsers to cache them forever.
+
+Each file is copied to a name with a hash of its contents in it, e.g.
+css/main.css becomes css/main.1f2e3d4c5b6a.css, so a changed file always gets a
+new URL and an old URL never needs revalidating. Text files are also written
+compressed alongside, as .gz and, if the brotli package is installed, .br, so
+nothing is compressed per request. A manifest maps each file's original name to
+its fingerprinted one, and templates get their URLs from asset_url().
+
+The build is run at startup, and only writes files which have changed since it
+last ran, so it takes a few milliseconds. It can also be run on its own with
+python static_assets.py, e.g. to have a reverse proxy serve config.STATIC_BUILD_DIR
+directly. In debug mode nothing is built, and asset_url() returns plain /static
+URLs so edits show up straight away.
+"""
+# stdlib
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import tempfile
+import typing
+
+# lib
+import structlog as logging
+from werkzeug.datastructures import Accept
+
+# local
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("netsocadmin.static_assets")
+
+MANIFEST = "manifest.json"
+# files worth compressing, anything else (e.g. PNGs) is already compressed
+COMPRESSIBLE = {".css", ".js", ".svg", ".txt", ".ico", ".html", ".json"}
+# preferred first
+ENCODINGS = ("br", "gzip")
+_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class Asset(typing.NamedTuple):
+    # the name in config.STATIC_FOLDER, e.g. css/main.css
+    name: str
+    # the fingerprinted name in config.STATIC_BUILD_DIR, e.g. css/main.1f2e3d4c5b6a.css
+    path: str
+    mimetype: str
+    # the precompressed copies written alongside it, preferred first
+    encodings: typing.List[str]
+
+
+# original name -> Asset, and fingerprinted name -> Asset
+_by_name: typing.Dict[str, Asset] = {}
+_by_path: typing.Dict[str, Asset] = {}
+
+
+def _write(path: str, data: bytes):
+    if os.path.exists(path):
+        # fingerprinted, so it can only already have these contents
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def _compress(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # gzip.compress only takes an mtime from 3.8, and without one the output changes every build
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as fh:
+        fh.write(data)
+    return buf.getvalue()
+
+
+def _build_file(name: str) -> Asset:
+    with open(os.path.join(config.STATIC_FOLDER, name), "rb") as fh:
+        data = fh.read()
+    root, ext = os.path.splitext(name)
+    path = f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    out = os.path.join(config.STATIC_BUILD_DIR, path)
+    _write(out, data)
+    encodings = []
+    if ext in COMPRESSIBLE:
+        for encoding in ENCODINGS:
+            if encoding == "br" and brotli is None:
+                continue
+            compressed = _compress(encoding, data)
+            # not worth the Content-Encoding if it barely helps
+            if len(compressed) < len(data) * 0.9:
+                _write(out + _SUFFIXES[encoding], compressed)
+                encodings.append(encoding)
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Asset(name, path, mimetype, encodings)
+
+
+def build() -> typing.Dict[str, Asset]:
+    """
+    build writes a fingerprinted and, where it helps, precompressed copy of
+    every file in config.STATIC_FOLDER to config.STATIC_BUILD_DIR along with the
+    manifest, and returns the manifest. Files which are already built are left
+    alone, so it is cheap to run again and safe to run from several processes.
+    """
+    assets = {}
+    for dirpath, _, filenames in os.walk(config.STATIC_FOLDER):
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(dirpath, filename), config.STATIC_FOLDER).replace(os.sep, "/")
+            assets[name] = _build_file(name)
+    os.makedirs(config.STATIC_BUILD_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=config.STATIC_BUILD_DIR, suffix=".json")
+    with os.fdopen(fd, "w") as fh:
+        json.dump({name: asset._asdict() for name, asset in sorted(assets.items())}, fh, indent=2)
+    os.replace(tmp, os.path.join(config.STATIC_BUILD_DIR, MANIFEST))
+    logger.info(f"built {len(assets)} static assets into {config.STATIC_BUILD_DIR}")
+    return assets
+
+
+def load():
+    """
+    load builds the assets and starts serving them. It does nothing in debug mode.
+    """
+    global _by_name, _by_path
+    if config.FLASK_CONFIG["debug"]:
+        return
+    assets = build()
+    _by_name = assets
+    _by_path = {asset.path: asset for asset in assets.values()}
+
+
+def asset_url(name: str) -> str:
+    """
+    asset_url returns the URL to use for the file at name in
+    config.STATIC_FOLDER: its fingerprinted /assets URL if it has been built,
+    or its plain /static URL if not.
+    """
+    asset = _by_name.get(name)
+    if asset is None:
+        return f"/static/{name}"
+    return f"/assets/{asset.path}"
+
+
+def get(name: str) -> typing.Optional[Asset]:
+    """
+    get returns the built asset for a file in config.STATIC_FOLDER, or None.
+    """
+    return _by_name.get(name)
+
+
+def find(path: str) -> typing.Optional[Asset]:
+    """
+    find returns the built asset with the fingerprinted name path, or None.
+    """
+    return _by_path.get(path)
+
+
+def choose(asset: Asset, accept_encodings: Accept) -> typing.Tuple[str, typing.Optional[str]]:
+    """
+    choose returns the file to send for asset, and its Content-Encoding, picking
+    the best precompressed copy the client accepts.
+
+    :param accept_encodings the request's parsed Accept-Encoding header
+    """
+    path = os.path.join(config.STATIC_BUILD_DIR, asset.path)
+    for encoding in asset.encodings:
+        if accept_encodings[encoding] > 0:
+            return path + _SUFFIXES[encoding], encoding
+    return path, None
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,371 @@
+"""
+This file contains the store for the tokens emailed to people signing up or
+resetting their password, which they must present to prove they own the email
+address.
+
+Tokens are kept by one of two backends, chosen with config.TOKEN_BACKEND:
+"sqlite" keeps them in the local database config.TOKEN_DB_NAME, while "mysql"
+keeps them in a table in the netsoc admin MySQL database so that every worker
+and replica of the app sees the same tokens. Both look tokens up through a
+unique index on uri and remove them through an index on email, so they stay
+fast however many tokens build up.
+
+Tokens expire config.TOKEN_TTL seconds after being sent, and a background
+sweeper deletes expired ones a batch at a time so it never holds the write lock
+for long. The SQLite backend then hands the freed pages back to the filesystem
+with incremental vacuums.
+"""
+# stdlib
+import abc
+import sqlite3
+import threading
+import time
+import typing
+
+# lib
+import structlog as logging
+
+# local
+import config
+import local_db
+import mysql_pool
+
+logger = logging.getLogger("netsocadmin.token_store")
+
+
+def _create_uris(conn: sqlite3.Connection):
+    """
+    Creates the indexed uris table. Databases from before migrations existed
+    have an unindexed uris(email TEXT, uri INT) table, whose tokens are copied
+    over rather than thrown away.
+    """
+    legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'uris'").fetchone()
+    conn.execute("CREATE TABLE uris_new(email TEXT, uri TEXT UNIQUE)")
+    if legacy:
+        conn.execute("INSERT OR IGNORE INTO uris_new(email, uri) SELECT email, CAST(uri AS TEXT) FROM uris")
+        conn.execute("DROP TABLE uris")
+    conn.execute("ALTER TABLE uris_new RENAME TO uris")
+    conn.execute("CREATE INDEX uris_email ON uris(email)")
+
+
+def _add_expiry(conn: sqlite3.Connection):
+    """
+    Adds creation and expiry times to tokens, and an index for the sweeper to
+    find expired ones with.
+    """
+    now = int(time.time())
+    conn.execute("ALTER TABLE uris ADD COLUMN created_at INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE uris ADD COLUMN expires_at INTEGER NOT NULL DEFAULT 0")
+    # tokens sent before expiry existed get a full lifetime from now
+    conn.execute("UPDATE uris SET created_at = ?, expires_at = ?", (now, now + config.TOKEN_TTL))
+    conn.execute("CREATE INDEX uris_expires_at ON uris(expires_at)")
+
+
+# never reorder or remove these, only add to the end
+MIGRATIONS = [
+    _create_uris,
+    _add_expiry,
+]
+
+_ADD = "INSERT OR REPLACE INTO uris(email, uri, created_at, expires_at) VALUES (?, ?, ?, ?)"
+_LOOKUP = "SELECT email FROM uris WHERE uri = ? AND expires_at > ?"
+_REMOVE = "DELETE FROM uris WHERE email = ?"
+_ROWS = "SELECT email, uri, created_at, expires_at FROM uris ORDER BY created_at DESC LIMIT ?"
+_SWEEP = "DELETE FROM uris WHERE rowid IN (SELECT rowid FROM uris WHERE expires_at <= ? LIMIT ?)"
+
+# auto_vacuum mode which lets free pages be handed back with incremental_vacuum
+_AUTO_VACUUM_INCREMENTAL = 2
+
+MYSQL_TABLE = "signup_tokens"
+
+_MYSQL_CREATE = f"""
+CREATE TABLE IF NOT EXISTS {MYSQL_TABLE} (
+    uri VARCHAR(64) NOT NULL PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    created_at BIGINT NOT NULL,
+    expires_at BIGINT NOT NULL,
+    INDEX {MYSQL_TABLE}_email (email),
+    INDEX {MYSQL_TABLE}_expires_at (expires_at)
+)
+"""
+_MYSQL_ADD = f"REPLACE INTO {MYSQL_TABLE}(email, uri, created_at, expires_at) VALUES (%s, %s, %s, %s)"
+_MYSQL_LOOKUP = f"SELECT email FROM {MYSQL_TABLE} WHERE uri = %s AND expires_at > %s"
+_MYSQL_REMOVE = f"DELETE FROM {MYSQL_TABLE} WHERE email = %s"
+_MYSQL_ROWS = f"SELECT email, uri, created_at, expires_at FROM {MYSQL_TABLE} ORDER BY created_at DESC LIMIT %s"
+_MYSQL_SWEEP = f"DELETE FROM {MYSQL_TABLE} WHERE expires_at <= %s ORDER BY expires_at LIMIT %s"
+
+Row = typing.Tuple[str, str, int, int]
+
+_sweeper: typing.Optional[threading.Thread] = None
+_sweeper_lock = threading.Lock()
+
+
+class TokenBackend(abc.ABC):
+    """
+    TokenBackend is where tokens are kept. Times are passed in rather than read
+    from the clock so that every backend expires tokens the same way. A backend
+    must implement every abstract method, or it can't be created.
+    """
+
+    @abc.abstractmethod
+    def add(self, email: str, uri: str, created_at: int, expires_at: int):
+        """
+        Stores a token, replacing any other token with the same uri.
+        """
+
+    @abc.abstractmethod
+    def email_for(self, uri: str, now: int) -> typing.Optional[str]:
+        """
+        Returns the email a token was sent to if it expires after now.
+        """
+
+    @abc.abstractmethod
+    def remove(self, email: str):
+        """
+        Deletes every token sent to email.
+        """
+
+    @abc.abstractmethod
+    def rows(self, limit: int) -> typing.List[Row]:
+        """
+        Returns the limit most recently sent (email, uri, created_at, expires_at) tokens.
+        """
+
+    @abc.abstractmethod
+    def clear(self):
+        """
+        Deletes every token.
+        """
+
+    @abc.abstractmethod
+    def delete_expired(self, now: int, limit: int) -> int:
+        """
+        Deletes at most limit tokens which expired at or before now, returning
+        how many were deleted.
+        """
+
+    def prepare_sweeps(self):
+        """
+        Called once by the sweeper before it starts.
+        """
+
+    def compact(self):
+        """
+        Called after each sweep to hand back the space freed by it.
+        """
+
+
+class SQLiteTokenBackend(TokenBackend):
+    """
+    SQLiteTokenBackend keeps tokens in the local SQLite database
+    config.TOKEN_DB_NAME, so they are only seen by processes on the same machine.
+    """
+
+    def _connection(self) -> sqlite3.Connection:
+        return local_db.connection(config.TOKEN_DB_NAME, MIGRATIONS)
+
+    def add(self, email: str, uri: str, created_at: int, expires_at: int):
+        self._connection().execute(_ADD, (email, uri, created_at, expires_at))
+
+    def email_for(self, uri: str, now: int) -> typing.Optional[str]:
+        row = self._connection().execute(_LOOKUP, (uri, now)).fetchone()
+        return row[0] if row else None
+
+    def remove(self, email: str):
+        self._connection().execute(_REMOVE, (email,))
+
+    def rows(self, limit: int) -> typing.List[Row]:
+        return self._connection().execute(_ROWS, (limit,)).fetchall()
+
+    def clear(self):
+        self._connection().execute("DELETE FROM uris")
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        return self._connection().execute(_SWEEP, (now, limit)).rowcount
+
+    def prepare_sweeps(self):
+        """
+        Databases created before the sweeper existed don't allow incremental
+        vacuums. Switching them over needs one full VACUUM, so every expired
+        token is deleted first, leaving only the few live ones to be copied.
+        """
+        conn = self._connection()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != _AUTO_VACUUM_INCREMENTAL:
+            now = int(time.time())
+            while self.delete_expired(now, config.TOKEN_SWEEP_BATCH) == config.TOKEN_SWEEP_BATCH:
+                # give anyone waiting on the write lock a turn
+                time.sleep(0)
+            conn.execute(f"PRAGMA auto_vacuum = {_AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+
+    def compact(self):
+        self._connection().execute(f"PRAGMA incremental_vacuum({config.TOKEN_VACUUM_PAGES})").fetchall()
+
+
+class MySQLTokenBackend(TokenBackend):
+    """
+    MySQLTokenBackend keeps tokens in the netsoc admin MySQL database
+    (config.MYSQL_DETAILS), so every worker and replica of the app sees the
+    same tokens. The table is created the first time it is used in a process.
+    """
+
+    def __init__(self):
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    def _create_table(self):
+        with self._create_lock:
+            if self._created:
+                return
+            with mysql_pool.connection() as conn, conn.cursor() as c:
+                c.execute(_MYSQL_CREATE)
+            self._created = True
+
+    def _execute(self, sql: str, args: typing.Sequence[object]) -> typing.Tuple[int, typing.List[tuple]]:
+        """
+        Runs a single statement and commits it, returning the number of rows it
+        affected and the rows it returned.
+        """
+        if not self._created:
+            self._create_table()
+        with mysql_pool.connection() as conn, conn.cursor() as c:
+            count = c.execute(sql, tuple(args))
+            fetched = list(c.fetchall())
+            conn.commit()
+        return count, fetched
+
+    def add(self, email: str, uri: str, created_at: int, expires_at: int):
+        self._execute(_MYSQL_ADD, (email, uri, created_at, expires_at))
+
+    def email_for(self, uri: str, now: int) -> typing.Optional[str]:
+        _, fetched = self._execute(_MYSQL_LOOKUP, (uri, now))
+        return fetched[0][0] if fetched else None
+
+    def remove(self, email: str):
+        self._execute(_MYSQL_REMOVE, (email,))
+
+    def rows(self, limit: int) -> typing.List[Row]:
+        return [tuple(row) for row in self._execute(_MYSQL_ROWS, (limit,))[1]]
+
+    def clear(self):
+        self._execute(f"DELETE FROM {MYSQL_TABLE}", ())
+
+    def delete_expired(self, now: int, limit: int) -> int:
+        return self._execute(_MYSQL_SWEEP, (now, limit))[0]
+
+
+BACKENDS = {
+    "sqlite": SQLiteTokenBackend,
+    "mysql": MySQLTokenBackend,
+}
+
+_backends: typing.Dict[str, TokenBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def backend() -> TokenBackend:
+    """
+    backend returns the store chosen by config.TOKEN_BACKEND, either "sqlite"
+    or "mysql".
+    """
+    name = config.TOKEN_BACKEND
+    if name not in _backends:
+        if name not in BACKENDS:
+            raise ValueError(f"unknown token backend '{name}'")
+        with _backends_lock:
+            if name not in _backends:
+                _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def add(email: str, uri: str):
+    """
+    add stores a token which has been sent to email. It expires
+    config.TOKEN_TTL seconds from now.
+    """
+    now = int(time.time())
+    backend().add(email, uri, now, now + config.TOKEN_TTL)
+
+
+def email_for(uri: str) -> typing.Optional[str]:
+    """
+    email_for returns the email address a token was sent to, or None if there
+    is no such token or it has expired.
+    """
+    return backend().email_for(uri, int(time.time()))
+
+
+def remove(email: str):
+    """
+    remove deletes every token which was sent to email.
+    """
+    backend().remove(email)
+
+
+def rows(limit: int = 100) -> typing.List[Row]:
+    """
+    rows returns the most recently sent (email, uri, created_at, expires_at)
+    tokens in the store.
+
+    :param limit the maximum number of tokens to return
+    """
+    return backend().rows(limit)
+
+
+def clear():
+    """
+    clear deletes every token in the store.
+    """
+    backend().clear()
+
+
+def sweep(now: int = None) -> int:
+    """
+    sweep deletes expired tokens, config.TOKEN_SWEEP_BATCH at a time so that
+    signups can write in between batches, then lets the backend reclaim the
+    space they took up.
+
+    :param now the time to treat as the present, defaults to the current time
+    :returns how many tokens were deleted
+    """
+    if now is None:
+        now = int(time.time())
+    store = backend()
+    deleted = 0
+    while True:
+        count = store.delete_expired(now, config.TOKEN_SWEEP_BATCH)
+        deleted += count
+        if count < config.TOKEN_SWEEP_BATCH:
+            break
+        # give anyone waiting on the write lock a turn
+        time.sleep(0)
+    store.compact()
+    return deleted
+
+
+def _sweep_forever():
+    try:
+        backend().prepare_sweeps()
+    except Exception as e:
+        logger.error(f"failed to prepare token store for sweeping: {e}")
+    while True:
+        try:
+            deleted = sweep()
+            if deleted:
+                logger.info(f"swept {deleted} expired tokens")
+        except Exception as e:
+            logger.error(f"failed to sweep expired tokens: {e}")
+        time.sleep(config.TOKEN_SWEEP_INTERVAL)
+
+
+def start_sweeper():
+    """
+    start_sweeper starts deleting expired tokens from a background thread every
+    config.TOKEN_SWEEP_INTERVAL seconds. It is safe to call more than once.
+    """
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is not None:
+            return
+        _sweeper = threading.Thread(target=_sweep_forever, name="token-sweeper", daemon=True)
+        _sweeper.start()
@@ -0,0 +1,74 @@
+"""
+This file renders the markdown tutorials in config.TUTORIAL_FOLDER to HTML.
+
+Each tutorial is rendered once per process and kept along with the mtime of the
+file it came from, so serving the tutorials page normally just returns the list
+that was already rendered. The folder is checked for new, changed or removed
+tutorials at most every config.TUTORIAL_RELOAD_INTERVAL seconds (on every
+request in debug mode), which costs a stat per tutorial, and only the ones whose
+mtime has changed are rendered again. Tutorials are in order of file name, which
+is why they are numbered.
+"""
+# stdlib
+import os
+import threading
+import time
+import typing
+
+# lib
+import markdown
+import markupsafe
+import structlog as logging
+
+# local
+import config
+
+logger = logging.getLogger("netsocadmin.tutorial_renderer")
+
+_lock = threading.Lock()
+# path -> (mtime_ns, rendered html)
+_rendered: typing.Dict[str, typing.Tuple[int, markupsafe.Markup]] = {}
+_tutorials: typing.List[markupsafe.Markup] = []
+# time.monotonic() when the folder was last checked, None if it never has been
+_checked_at: typing.Optional[float] = None
+
+
+def _render(path: str) -> markupsafe.Markup:
+    with open(path) as fh:
+        return markupsafe.Markup(markdown.markdown(fh.read()))
+
+
+def _reload():
+    global _tutorials
+    paths = set()
+    with os.scandir(config.TUTORIAL_FOLDER) as it:
+        files = sorted((entry for entry in it if entry.name.endswith(".md")), key=lambda entry: entry.name)
+    for entry in files:
+        mtime = entry.stat().st_mtime_ns
+        paths.add(entry.path)
+        cached = _rendered.get(entry.path)
+        if cached is None or cached[0] != mtime:
+            _rendered[entry.path] = (mtime, _render(entry.path))
+            logger.info(f"rendered tutorial {entry.name}")
+    for path in set(_rendered) - paths:
+        del _rendered[path]
+    _tutorials = [_rendered[entry.path][1] for entry in files]
+
+
+def tutorials() -> typing.List[markupsafe.Markup]:
+    """
+    tutorials returns every tutorial rendered to HTML, in order of file name,
+    rendering any which are new or have changed since they were last rendered
+    if the folder is due to be checked.
+    """
+    global _checked_at
+    now = time.monotonic()
+    if not config.FLASK_CONFIG["debug"] and _checked_at is not None \
+            and now - _checked_at < config.TUTORIAL_RELOAD_INTERVAL:
+        return _tutorials
+    with _lock:
+        # another thread may have checked while this one waited for the lock
+        if _checked_at is None or _checked_at < now or config.FLASK_CONFIG["debug"]:
+            _reload()
+            _checked_at = time.monotonic()
+        return _tutorials
@@ -0,0 +1,131 @@
+"""
+This file hands out uidNumbers for new accounts.
+
+The next free uidNumber is kept on a counter entry in LDAP
+(config.LDAP_UID_COUNTER_DN). Taking a number is a single modify which deletes
+the value we read and adds the next one; LDAP applies both or neither, so if
+another signup bumped the counter first our delete fails and we just try again.
+Allocation therefore costs the same however many members there are, and two
+signups can never be given the same number.
+"""
+# stdlib
+import typing
+
+# lib
+import ldap3
+import ldap3.utils.dn
+import structlog as logging
+
+# local
+import config
+
+logger = logging.getLogger("netsocadmin.uid_allocator")
+
+# LDAP result code returned when a value we tried to delete isn't there
+NO_SUCH_ATTRIBUTE = 16
+# LDAP result code returned when adding an entry which already exists
+ENTRY_ALREADY_EXISTS = 68
+
+MAX_ATTEMPTS = 20
+
+
+class UIDAllocationException(Exception):
+    pass
+
+
+def _read_counter(conn: ldap3.Connection) -> typing.Optional[int]:
+    """
+    Returns the value on the counter entry, or None if the entry doesn't exist yet.
+    """
+    conn.search(
+        search_base=config.LDAP_UID_COUNTER_DN,
+        search_filter="(objectClass=*)",
+        search_scope=ldap3.BASE,
+        attributes=["uidNumber"],
+    )
+    if len(conn.entries) != 1:
+        return None
+    return int(conn.entries[0]["uidNumber"].value)
+
+
+def _highest_member_uid(conn: ldap3.Connection) -> int:
+    """
+    Scans every member for the highest uidNumber in use. This is only done once,
+    to seed the counter entry the first time it is needed.
+    """
+    highest = 0
+    for entry in conn.extend.standard.paged_search(
+        search_base="cn=member,dc=netsoc,dc=co",
+        search_filter="(objectClass=account)",
+        attributes=["uidNumber"],
+        paged_size=500,
+        generator=True,
+    ):
+        if entry.get("type") != "searchResEntry":
+            continue
+        uid_number = entry["raw_attributes"].get("uidNumber")
+        if uid_number:
+            highest = max(highest, int(uid_number[0]))
+    return highest
+
+
+def _create_counter(conn: ldap3.Connection):
+    next_uid = _highest_member_uid(conn) + 1
+    logger.info(f"creating uidNumber counter at {config.LDAP_UID_COUNTER_DN} starting from {next_uid}")
+    # the entry has to carry its own RDN, e.g. cn: uidNext, and device needs a cn anyway
+    rdn_attribute, rdn_value, _ = ldap3.utils.dn.parse_dn(config.LDAP_UID_COUNTER_DN)[0]
+    success = conn.add(
+        config.LDAP_UID_COUNTER_DN,
+        ["top", "device", "extensibleObject"],
+        {rdn_attribute: rdn_value, "uidNumber": next_uid},
+    )
+    # somebody else creating it at the same time is fine, we'll read theirs
+    if not success and conn.result["result"] != ENTRY_ALREADY_EXISTS:
+        raise UIDAllocationException(f"couldn't create uidNumber counter: {conn.last_error}")
+
+
+def is_uid_number_taken(conn: ldap3.Connection, uid_number: int) -> bool:
+    """
+    Tells us whether any account already has the given uidNumber. This is a single
+    equality search so it stays cheap no matter how many accounts there are.
+    """
+    conn.search(
+        search_base="dc=netsoc,dc=co",
+        search_filter=f"(&(objectClass=posixAccount)(uidNumber={int(uid_number)}))",
+        attributes=ldap3.NO_ATTRIBUTES,
+        size_limit=1,
+    )
+    return len(conn.entries) > 0
+
+
+def allocate(conn: ldap3.Connection) -> int:
+    """
+    allocate takes the next free uidNumber off the counter entry, creating the
+    entry first if it doesn't exist yet.
+
+    :param conn a bound admin LDAP connection
+    :returns the newly allocated uidNumber
+    :raises UIDAllocationException if no number could be allocated
+    """
+    for _ in range(MAX_ATTEMPTS):
+        current = _read_counter(conn)
+        if current is None:
+            _create_counter(conn)
+            continue
+
+        swapped = conn.modify(
+            config.LDAP_UID_COUNTER_DN,
+            {"uidNumber": [(ldap3.MODIFY_DELETE, [current]), (ldap3.MODIFY_ADD, [current + 1])]},
+        )
+        if not swapped:
+            if conn.result["result"] == NO_SUCH_ATTRIBUTE:
+                # another signup took this number first
+                continue
+            raise UIDAllocationException(f"couldn't update uidNumber counter: {conn.last_error}")
+
+        # the number is ours now, but make sure nobody added an account with it by hand
+        if is_uid_number_taken(conn, current):
+            logger.warning(f"uidNumber {current} from the counter is already in use, skipping it")
+            continue
+        return current
+    raise UIDAllocationException(f"couldn't allocate a uidNumber after {MAX_ATTEMPTS} attempts")
@@ -0,0 +1,138 @@
+"""
+This file keeps an in-memory index of every username which is taken, so the
+signup form can check availability on each keystroke without going to LDAP.
+
+The index is loaded with one paged search when the app starts, then kept up to
+date in the background by only fetching accounts created since the last refresh,
+with a full reload every so often to pick up deleted accounts. It is only a
+hint for the form: CompleteSignup still asks LDAP before creating an account.
+"""
+# stdlib
+import threading
+import time
+import typing
+
+# lib
+import ldap3
+import structlog as logging
+
+# local
+import config
+import ldap_tools
+
+logger = logging.getLogger("netsocadmin.username_index")
+
+_taken: typing.Set[str] = set()
+_lock = threading.Lock()
+# createTimestamp (LDAP generalized time) of the newest account seen so far
+_newest: typing.Optional[str] = None
+# time.monotonic() of the last full load, None until the index is warm
+_loaded_at: typing.Optional[float] = None
+_refresher: typing.Optional[threading.Thread] = None
+
+
+def _search(search_filter: str) -> typing.Tuple[typing.Set[str], typing.Optional[str]]:
+    """
+    Returns the usernames matching search_filter, and the newest createTimestamp
+    among them.
+    """
+    usernames, newest = set(), None
+    with ldap_tools.connection() as conn:
+        for entry in conn.extend.standard.paged_search(
+            search_base="dc=netsoc,dc=co",
+            search_filter=search_filter,
+            attributes=["uid", "createTimestamp"],
+            paged_size=1000,
+            generator=True,
+        ):
+            if entry.get("type") != "searchResEntry":
+                continue
+            raw = entry["raw_attributes"]
+            usernames.update(uid.decode() for uid in raw.get("uid", []))
+            for created in raw.get("createTimestamp", []):
+                created = created.decode()
+                if newest is None or created > newest:
+                    newest = created
+    return usernames, newest
+
+
+def refresh(full: bool = False):
+    """
+    refresh brings the index up to date. Unless full is True, or the index isn't
+    warm yet, only accounts created since the last refresh are fetched.
+    """
+    global _taken, _newest, _loaded_at
+    if full or _loaded_at is None or _newest is None:
+        usernames, newest = _search("(objectClass=account)")
+        with _lock:
+            _taken = usernames
+            _newest = newest
+            _loaded_at = time.monotonic()
+        logger.info(f"loaded {len(usernames)} usernames into the username index")
+        return
+
+    # >= rather than > as timestamps only have second precision
+    usernames, newest = _search(f"(&(objectClass=account)(createTimestamp>={_newest}))")
+    with _lock:
+        _taken.update(usernames)
+        if newest is not None and newest > _newest:
+            _newest = newest
+
+
+def _refresh_forever():
+    while True:
+        try:
+            full = _loaded_at is None or time.monotonic() - _loaded_at > config.USERNAME_INDEX_FULL_REFRESH
+            refresh(full=full)
+        except Exception as e:
+            logger.error(f"failed to refresh username index: {e}")
+        time.sleep(config.USERNAME_INDEX_REFRESH)
+
+
+def start():
+    """
+    start warms the index and keeps it refreshed from a background thread. It is
+    safe to call more than once.
+    """
+    global _refresher
+    with _lock:
+        if _refresher is not None:
+            return
+        _refresher = threading.Thread(target=_refresh_forever, name="username-index", daemon=True)
+        _refresher.start()
+
+
+def add(username: str):
+    """
+    add marks a username as taken straight away, e.g. when an account has just
+    been created.
+    """
+    with _lock:
+        _taken.add(username)
+
+
+def discard(username: str):
+    with _lock:
+        _taken.discard(username)
+
+
+def is_taken(username: str) -> bool:
+    """
+    is_taken tells us whether a username looks to be in use. Until the index is
+    warm this falls back to asking LDAP directly.
+
+    :param username the username being queried about
+    :returns True if the username is taken or blacklisted, False otherwise
+    """
+    if username in config.USERNAME_BLACKLIST:
+        return True
+    if _loaded_at is not None:
+        return username in _taken
+    with ldap_tools.connection() as conn:
+        conn.search(
+            search_base="dc=netsoc,dc=co",
+            search_filter=f"(&(objectClass=account)(uid={ldap3.utils.conv.escape_filter_chars(username)}))",
+            attributes=ldap3.NO_ATTRIBUTES,
+            size_limit=1,
+        )
+        return len(conn.entries) > 0
@@ -0,0 +1,163 @@
+"""
+This file keeps one copy of the current WordPress release on local disk, which
+every WordPress install is extracted from, rather than each install downloading
+its own.
+
+The release is kept at config.WORDPRESS_CACHE_DIR/wordpress.tar.gz along with a
+small JSON file recording its checksum and the headers needed to ask
+wordpress.org whether it has changed. A background thread asks every
+config.WORDPRESS_CACHE_REFRESH seconds with a conditional request, so checking
+costs next to nothing when there is no new release. A new release is only
+swapped in once its SHA-1 matches the checksum wordpress.org publishes
+alongside it, and the swap is a rename so an install never extracts from half a
+file.
+
+With config.WORDPRESS_OFFLINE set nothing is ever downloaded, and installs use
+whatever tarball is already in the cache directory, e.g. one put there when the
+image was built.
+"""
+# stdlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import typing
+
+# lib
+import structlog as logging
+
+# local
+import config
+import http_client
+
+logger = logging.getLogger("netsocadmin.wordpress_cache")
+
+TARBALL = "wordpress.tar.gz"
+METADATA = "wordpress.json"
+
+_lock = threading.Lock()
+_refresher: typing.Optional[threading.Thread] = None
+
+
+class WordpressCacheException(Exception):
+    pass
+
+
+def tarball_path() -> str:
+    return os.path.join(config.WORDPRESS_CACHE_DIR, TARBALL)
+
+
+def _metadata_path() -> str:
+    return os.path.join(config.WORDPRESS_CACHE_DIR, METADATA)
+
+
+def _read_metadata() -> typing.Dict[str, str]:
+    try:
+        with open(_metadata_path()) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_metadata(metadata: typing.Dict[str, str]):
+    fd, tmp = tempfile.mkstemp(dir=config.WORDPRESS_CACHE_DIR, suffix=".json")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(metadata, fh)
+    os.replace(tmp, _metadata_path())
+
+
+def _published_sha1() -> str:
+    response = http_client.get(config.WORDPRESS_RELEASE_URL + ".sha1")
+    response.raise_for_status()
+    return response.text.strip().split()[0].lower()
+
+
+def refresh() -> bool:
+    """
+    refresh downloads the current WordPress release into the cache if it has
+    changed since it was last downloaded.
+
+    :returns True if a new release was downloaded
+    :raises WordpressCacheException if the download doesn't match its published checksum
+    """
+    with _lock:
+        os.makedirs(config.WORDPRESS_CACHE_DIR, exist_ok=True)
+        metadata = _read_metadata() if os.path.isfile(tarball_path()) else {}
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+        with http_client.get(config.WORDPRESS_RELEASE_URL, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            fd, tmp = tempfile.mkstemp(dir=config.WORDPRESS_CACHE_DIR, suffix=".tar.gz")
+            try:
+                sha1 = hashlib.sha1()
+                with os.fdopen(fd, "wb") as fh:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        sha1.update(chunk)
+                        fh.write(chunk)
+                expected = _published_sha1()
+                if sha1.hexdigest() != expected:
+                    raise WordpressCacheException(
+                        f"downloaded WordPress has SHA-1 {sha1.hexdigest()} but {expected} was published"
+                    )
+                os.chmod(tmp, 0o644)
+                os.replace(tmp, tarball_path())
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        _write_metadata({
+            "sha1": expected,
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "fetched_at": str(int(time.time())),
+        })
+        logger.info(f"cached WordPress release {expected}")
+        return True
+
+
+def tarball() -> str:
+    """
+    tarball returns the path of the cached WordPress release, downloading it
+    first if there isn't one yet, unless config.WORDPRESS_OFFLINE is set.
+
+    :raises WordpressCacheException if there is no release cached and it can't be downloaded
+    """
+    path = tarball_path()
+    if os.path.isfile(path):
+        return path
+    if config.WORDPRESS_OFFLINE:
+        raise WordpressCacheException(f"WordPress is in offline mode and there is no tarball at {path}")
+    refresh()
+    return path
+
+
+def _refresh_forever():
+    while True:
+        try:
+            refresh()
+        except Exception as e:
+            logger.error(f"failed to refresh cached WordPress release: {e}")
+        time.sleep(config.WORDPRESS_CACHE_REFRESH)
+
+
+def start_refresher():
+    """
+    start_refresher keeps the cached release up to date from a background
+    thread, unless config.WORDPRESS_OFFLINE is set. It is safe to call more
+    than once.
+    """
+    global _refresher
+    if config.WORDPRESS_OFFLINE:
+        return
+    with _lock:
+        if _refresher is not None:
+            return
+        _refresher = threading.Thread(target=_refresh_forever, name="wordpress-cache", daemon=True)
+        _refresher.start()
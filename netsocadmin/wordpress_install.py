@@ -1,23 +1,41 @@
 # stdlib
+import contextlib
 import os
 import random
+import secrets
+import shutil
 import string
-import subprocess
+import tarfile
 from pathlib import Path
 
 # lib
-import ldap3
-import pymysql
-import requests
 import structlog as logging
-import wget
 from jinja2 import Environment, PackageLoader
 
 # local
 import config
+import http_client
+import ldap_tools
+import mysql_provision
+import native_thread
+import wordpress_cache
 
 logger = logging.getLogger(__name__)
 
+WORDPRESS_SALT_API = "https://api.wordpress.org/secret-key/1.1/salt/"
+# the keys and salts a wp-config.php defines
+SALT_NAMES = [
+    "AUTH_KEY", "SECURE_AUTH_KEY", "LOGGED_IN_KEY", "NONCE_KEY",
+    "AUTH_SALT", "SECURE_AUTH_SALT", "LOGGED_IN_SALT", "NONCE_SALT",
+]
+# the characters WordPress makes its keys from, less quotes and backslashes which would need escaping in PHP
+SALT_CHARS = string.ascii_letters + string.digits + "!@#$%^&*()-_ []{}<>~`+=,.;:/?|"
+
+_template = None
+
+_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | _NOFOLLOW
+
 """
 This section contains all the functions that relate to file operations relating to a wordpress install.
 Most of the functions carry out methods similar to linux commands, or in some cases, actually carry out linux commands
@@ -26,55 +44,123 @@ Also contains the a random string generator helper function.
 """
 
 
-def extract_from_tar(path_to_file, target_dir):
+class UnsafeArchiveException(Exception):
+    pass
+
+
+def _member_parts(root, name):
     """
-    Extracts files from a tar compressed file, and places them into a target directory
+    Returns the path components of where a tar member called name belongs under the directory root, refusing any
+    which would end up outside it, e.g. "../../.bashrc" or "/etc/passwd". Symlinks are dealt with as the member is
+    opened, see extract_from_tar.
     """
-    logger.info(f"extracting file {path_to_file} from tar to {target_dir}")
-    split_command = ["tar", "-xzf", path_to_file, "-C", target_dir]
-    subprocess.call(split_command, stdout=subprocess.PIPE)
+    relative = os.path.normpath(name)
+    if os.path.isabs(relative) or relative == ".." or relative.startswith(".." + os.sep):
+        raise UnsafeArchiveException(f"refusing to extract {name!r} outside {root}")
+    return () if relative == "." else tuple(relative.split(os.sep))
 
 
-def download_to(url, path_to_dir):
+def _open_below(top, parts):
     """
-    Downloads a file from a given to a target directory.
-    Returns the file name if the downloaded file.
+    Opens the directory top/parts[0]/parts[1]/... one component at a time with O_NOFOLLOW, so a symlink anywhere along
+    the way is refused rather than followed, and returns its file descriptor.
     """
-    logger.info(f"downloading file from {url} to {path_to_dir}")
-    filename = wget.download(url, out=path_to_dir, bar=None)
-    return filename
+    fd = os.open(top, _DIR_FLAGS)
+    try:
+        for part in parts:
+            child = os.open(part, _DIR_FLAGS, dir_fd=fd)
+            os.close(fd)
+            fd = child
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _create_file(name, dir_fd, mode):
+    """
+    Creates the file name afresh in the directory open as dir_fd, removing whatever was there first, and returns a
+    file descriptor open for writing. Unlinking a symlink or hard link removes the link, never what it points at, and
+    O_EXCL|O_NOFOLLOW means anything put there in between makes this fail rather than be written through.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(name, dir_fd=dir_fd)
+    return os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _NOFOLLOW, mode, dir_fd=dir_fd)
 
 
-def delete_file(path_to_file):
+def extract_from_tar(path_to_file, target_dir, uid=None, gid=None):
     """
-    Deletes a file from a given file path.
+    Extracts files from a tar compressed file, and places them into a target directory.
+    The archive is streamed, writing each member as it is read, and if uid and gid are given everything extracted is
+    owned by them, so there is no need for a chown -R afterwards.
+    Only files and directories are extracted, links and devices are skipped, and setuid/setgid/sticky bits are dropped.
+
+    This runs as root inside a directory the user owns, and the user can rename or swap anything in it for a symlink
+    while the extraction is going on. So every directory is opened once with O_NOFOLLOW and everything below it is
+    created relative to that file descriptor, never by path, and files are always created afresh with O_EXCL rather
+    than written over. Directories stay owned by root until every member has been written, and are then chowned
+    through their file descriptors, so the user can't add anything to them until root is done with them.
     """
-    logger.info(f"deleting {path_to_file}")
-    os.remove(path_to_file)
+    logger.info(f"extracting file {path_to_file} from tar to {target_dir}")
+    # path components -> an open file descriptor of that directory
+    dirs = {}
+
+    def open_dir(parts, name):
+        fd = dirs.get(parts)
+        if fd is not None:
+            return fd
+        parent = open_dir(parts[:-1], name)
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(parts[-1], 0o755, dir_fd=parent)
+        try:
+            fd = os.open(parts[-1], _DIR_FLAGS, dir_fd=parent)
+        except OSError as e:
+            # ELOOP for a symlink, ENOTDIR for anything else in the way
+            raise UnsafeArchiveException(f"refusing to extract {name!r}, {'/'.join(parts)} isn't a directory") from e
+        dirs[parts] = fd
+        return fd
+
+    try:
+        try:
+            dirs[()] = os.open(target_dir, _DIR_FLAGS)
+        except OSError as e:
+            raise UnsafeArchiveException(f"refusing to extract into {target_dir}, it isn't a directory") from e
+        with tarfile.open(path_to_file, "r|gz", bufsize=1 << 20) as tar:
+            for member in tar:
+                parts = _member_parts(target_dir, member.name)
+                mode = member.mode & 0o777
+                if not parts:
+                    continue
+                if member.isdir():
+                    os.fchmod(open_dir(parts, member.name), mode | 0o700)
+                elif member.isfile():
+                    parent = open_dir(parts[:-1], member.name)
+                    try:
+                        fd = _create_file(parts[-1], parent, 0o600)
+                    except FileExistsError as e:
+                        raise UnsafeArchiveException(f"{member.name!r} was replaced while extracting it") from e
+                    with os.fdopen(fd, "wb") as fh:
+                        shutil.copyfileobj(tar.extractfile(member), fh, 1 << 16)
+                        os.fchmod(fh.fileno(), mode)
+                        if uid is not None:
+                            os.fchown(fh.fileno(), uid, gid)
+                else:
+                    logger.warning(f"skipping {member.name} in {path_to_file}, it isn't a file or directory")
+        if uid is not None:
+            for parts, fd in dirs.items():
+                if parts:
+                    os.fchown(fd, uid, gid)
+    finally:
+        for fd in dirs.values():
+            os.close(fd)
 
 
-def chown_dir_and_children(path_to_dir, username):
+def delete_file(path_to_file):
     """
-    Changes the owner of a given directory, and its children to the given username;
-    Also changes the group of the given directory, and its children to 'member'.
+    Deletes a file from a given file path.
     """
-    logger.info(
-        f"changing owner and group of directory {path_to_dir} and children",
-    )
-    ldap_server = ldap3.Server(config.LDAP_HOST, get_info=ldap3.ALL)
-    with ldap3.Connection(ldap_server, auto_bind=True, receive_timeout=5, **config.LDAP_AUTH) as conn:
-        username = ldap3.utils.conv.escape_filter_chars(username)
-        success = conn.search(
-            search_base="dc=netsoc,dc=co",
-            search_filter=f"(&(objectClass=account)(uid={username}))",
-            attributes=["uidNumber", "gidNumber"],
-        )
-        if not success or len(conn.entries) != 1:
-            raise Exception("user not found")
-        uidNumber = conn.entries[0]["uidNumber"].value
-        gidNumber = conn.entries[0]["gidNumber"].value
-        split_command = ["chown", "-R", f"{uidNumber}:{gidNumber}", path_to_dir]
-        subprocess.call(split_command, stdout=subprocess.PIPE)
+    logger.info(f"deleting {path_to_file}")
+    os.remove(path_to_file)
 
 
 def file_exists(path_to_file):
@@ -107,9 +193,6 @@ def create_wordpress_database(username, is_debug_mode):
     """
     logger.info(f"Creating wordpress database and user for {username}")
 
-    database_connection = pymysql.connect(**config.MYSQL_DETAILS)
-    cursor = database_connection.cursor(pymysql.cursors.DictCursor)
-
     db_user = 'wp_' + username
 
     if is_debug_mode:
@@ -119,35 +202,11 @@ def create_wordpress_database(username, is_debug_mode):
         db_user = db_user[:13]
         logger.info(f"Username too long, shortened to {db_user}")
 
-    def _drop_user_if_exists():
-        logger.info(f"Checking if {db_user} already exists in database")
-        query = f"""SELECT USER FROM mysql.user WHERE USER = '{db_user}';"""
-        cursor.execute(query)
-        database_connection.commit()
-        if len(cursor.fetchall()) > 0:
-            logger.info(f"{db_user} already exists in database, dropping user")
-            query = f"""DROP USER '{db_user}';"""
-            cursor.execute(query)
-            database_connection.commit()
-
-    _drop_user_if_exists()
-
     password = _gen_random_password()
 
-    cursor.execute(
-        f"""DROP DATABASE IF EXISTS {db_user};""")
-    cursor.execute(f"""CREATE DATABASE {db_user};""")
-
-    database_connection.commit()
-    logger.info("Created database")
-
-    cursor.execute(f"""CREATE USER '{db_user}' IDENTIFIED BY '{password}';""")
-    database_connection.commit()
-    logger.info("Created user")
-
-    cursor.execute(f"""GRANT ALL PRIVILEGES ON {db_user}.* TO '{db_user}'""")
-    database_connection.commit()
-    logger.info("Granting privileges to user")
+    # drops any existing user and database, then creates and grants them in one go
+    mysql_provision.create_database_user(db_user, password)
+    logger.info("Created database and user, granted privileges to user")
 
     new_db_conf = {
         "user":     db_user,
@@ -159,71 +218,121 @@ def create_wordpress_database(username, is_debug_mode):
     return new_db_conf
 
 
-def create_wordpress_conf(user_dir, db_conf):
+def _wordpress_conf_template():
+    """
+    Returns the compiled wp-config.php template, which is only read and compiled once per process.
+    """
+    global _template
+    if _template is None:
+        env = Environment(loader=PackageLoader('wordpress_install', 'templates'))
+        _template = env.get_template('wp-config.php.j2')
+    return _template
+
+
+def generate_wordpress_conf_keys():
+    """
+    Generates the keys and salts for a wp-config.php locally, in the same format as the wordpress secret key API, i.e.
+    a define() for each of SALT_NAMES with 64 random characters from the same alphabet WordPress uses.
+    """
+    return "\n".join(
+        f"define('{name}', {' ' * (16 - len(name))}'{''.join(secrets.choice(SALT_CHARS) for _ in range(64))}');"
+        for name in SALT_NAMES
+    )
+
+
+def get_wordpress_conf_keys():
+    """
+    Returns the keys and salts for a wp-config.php, generated locally unless config.WORDPRESS_SALT_SOURCE is "api",
+    in which case they are fetched from the wordpress secret key API, falling back to generating them if that fails.
+    """
+    if config.WORDPRESS_SALT_SOURCE == "api":
+        try:
+            logger.info("Fetching wordpress configuration")
+            response = http_client.get(WORDPRESS_SALT_API)
+            response.raise_for_status()
+            return response.text
+        except Exception as e:
+            logger.warning(f"failed to fetch wordpress keys, generating them instead: {e}")
+    return generate_wordpress_conf_keys()
+
+
+def create_wordpress_conf(user_dir, db_conf, uid=None, gid=None):
     """
     Used to generate a new wordpress configuration file from a jinja2 template.
-    Pulls the configuration keys from the wordpress API and injects them into the template.
+    Injects newly generated configuration keys into the template.
     Injects the database configuration returned from create_wordpress_database into database details of the template.
-    Writes the newly templated configuration file into the wordpress directory.
+    Writes the newly templated configuration file into the wordpress directory, owned by uid and gid if given.
+
+    This runs as root after the wordpress directory has been handed over to the user, so like extract_from_tar it
+    never follows a symlink the user has put in the way: the directory is opened a component at a time with O_NOFOLLOW
+    and wp-config.php is created afresh inside it.
     """
     logger.info("Generating wordpress configuration")
 
-    env = Environment(loader=PackageLoader(
-        'wordpress_install', 'templates'))
-    template = env.get_template('wp-config.php.j2')
-
-    def get_wordpress_conf_keys():
-        logger.info("Fetching wordpress configuration")
-        response = requests.get("https://api.wordpress.org/secret-key/1.1/salt/")
-        return response.text
-
-    wordpress_config = template.render(USER_DIR=user_dir,
-                                       DB_NAME=db_conf["db"],
-                                       DB_USER=db_conf["user"],
-                                       DB_PASSWORD=db_conf["password"],
-                                       DB_HOST=db_conf["host"],
-                                       KEYS=get_wordpress_conf_keys())
+    wordpress_config = _wordpress_conf_template().render(USER_DIR=user_dir,
+                                                         DB_NAME=db_conf["db"],
+                                                         DB_USER=db_conf["user"],
+                                                         DB_PASSWORD=db_conf["password"],
+                                                         DB_HOST=db_conf["host"],
+                                                         KEYS=get_wordpress_conf_keys())
     logger.info("Wordpress configuration rendered from template, writing to file")
 
-    with open(user_dir + "/public_html/wordpress/wp-config.php", "w") as fh:
+    wordpress_dir = _open_below(user_dir, ("public_html", "wordpress"))
+    try:
+        fd = _create_file("wp-config.php", wordpress_dir, 0o644)
+    finally:
+        os.close(wordpress_dir)
+    with os.fdopen(fd, "w") as fh:
+        if uid is not None:
+            os.fchown(fh.fileno(), uid, gid)
         fh.write(wordpress_config)
 
 
-def get_wordpress(user_dir, username, is_debug_mode):
+def get_wordpress(user_dir, username, is_debug_mode, step=None):
     """
     Abstracted method for general wordpress installation.
     Installs wordpress to the public_html directory of a user, given the user's directory and username.
     Compromises of two stages: download stage, and configurations stage.
     Download:
-            Downloads the latest wordpress version as a tar compressed file to the users home directory.
-            Extracts files from the tar compress and moves them to the ~/<username>/public_html/wordpress
-            Deletes the tar compressed wordpress install from the user's home directory.
+            Takes the latest wordpress version from the local cache, downloading it only if it isn't cached yet.
+            Extracts files from the tar compress into ~/<username>/public_html/wordpress, owned by the user and
+            'member' group, on a native thread so the rest of the worker carries on meanwhile.
     Configuration:
             Creates new database and user for wordpress.
             Generates a new wordpress cofiguration, and places it in the wordpress directory created in the download
-            phase.
-            Changes owner and group of wordpress directory and child files/directories to the username given, and
-            'member' relatively.
+            phase, owned by the user.
+    If given, step is called with the name of each step to get a context manager to run it in, e.g.
+    jobs.Progress.step to record how long each takes.
     """
 
     logger.info(f"Installing WordPress for {username}")
+    if step is None:
+        def step(name):
+            return contextlib.nullcontext()
+
+    profile = ldap_tools.get_profile(username)
+    if profile is None:
+        raise Exception("user not found")
 
     def download(user_dir):
         try:
-            wordpress_latest_url = "https://wordpress.org/latest.tar.gz"
-            filename = download_to(wordpress_latest_url, user_dir)
-            extract_from_tar(filename, user_dir + "/public_html")
-            delete_file(filename)
+            with step("download"):
+                filename = wordpress_cache.tarball()
+            with step("extract"):
+                # in-process gunzipping doesn't yield to gevent, so it gets a thread of its own
+                native_thread.call(
+                    extract_from_tar, filename, user_dir + "/public_html", profile.uid_number, profile.gid_number,
+                )
         except Exception as e:
             logger.warning("An issue has occured while trying to download wordpress\n" + str(e))
             raise Exception("An issue has occured while trying to download wordpress")
 
     def configure(user_dir, username):
         try:
-            new_db_conf = create_wordpress_database(username, is_debug_mode)
-            create_wordpress_conf(user_dir, new_db_conf)
-            chown_dir_and_children(
-                user_dir + "/public_html/wordpress", username)
+            with step("database"):
+                new_db_conf = create_wordpress_database(username, is_debug_mode)
+            with step("configure"):
+                create_wordpress_conf(user_dir, new_db_conf, profile.uid_number, profile.gid_number)
         except Exception as e:
             logger.warning(
                 "An issue has occured while trying to configure wordpress\n" + str(e))
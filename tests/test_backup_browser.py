@@ -0,0 +1,236 @@
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import flask
+
+import backup_browser
+import config
+import jobs
+import local_db
+from routes.tools.backups import BackupBrowse, BackupRestore
+
+
+def add_file(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o640
+    info.mtime = 1577836800
+    tar.addfile(info, io.BytesIO(data))
+
+
+class TestBackupBrowser(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old = config.BACKUPS_DIR, config.BACKUP_INDEX_DB_NAME, config.JOBS_DB_NAME
+        config.BACKUPS_DIR = self.tmp.name
+        config.BACKUP_INDEX_DB_NAME = os.path.join(self.tmp.name, "index.db")
+        config.JOBS_DB_NAME = os.path.join(self.tmp.name, "jobs.db")
+        os.makedirs(os.path.join(self.tmp.name, "alice", "weekly"))
+        self.archive = os.path.join(self.tmp.name, "alice", "weekly", "2020-01-01.tgz")
+        self.big = os.urandom(200000)
+        with tarfile.open(self.archive, "w:gz") as tar:
+            # no entries for home or alice themselves, as with tar -czf of a file list
+            add_file(tar, "./home/alice/notes.txt", b"hello")
+            add_file(tar, "./home/alice/public_html/index.html", b"<h1>hi</h1>")
+            add_file(tar, "./home/alice/public_html/big.bin", self.big)
+            add_file(tar, './home/alice/a"b.txt', b"quoted")
+            add_file(tar, "./home/alice/r\u00e9sum\u00e9.pdf", b"cv")
+            link = tarfile.TarInfo("./home/alice/latest")
+            link.type = tarfile.SYMTYPE
+            link.linkname = "notes.txt"
+            tar.addfile(link)
+
+        app = flask.Flask("test")
+        app.secret_key = "test"
+        base = "/backup/<string:username>/<string:timeframe>/<string:backup_date>"
+        app.add_url_rule(base + "/browse", view_func=BackupBrowse.as_view("backupbrowse"))
+        app.add_url_rule(base + "/restore", view_func=BackupRestore.as_view("backuprestore"))
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session[config.LOGGED_IN_KEY] = True
+            session["username"] = "alice"
+            session["admin"] = False
+
+    def tearDown(self):
+        jobs._get_executor().submit(lambda: None).result()
+        for path in (config.BACKUP_INDEX_DB_NAME, config.JOBS_DB_NAME):
+            local_db.close(path)
+            local_db.forget_migrations(path)
+        config.BACKUPS_DIR, config.BACKUP_INDEX_DB_NAME, config.JOBS_DB_NAME = self.old
+        self.tmp.cleanup()
+
+    def test_index_lists_implied_directories(self):
+        self.assertFalse(backup_browser.is_indexed(self.archive))
+        backup_browser.build_index(self.archive)
+        self.assertTrue(backup_browser.is_indexed(self.archive))
+
+        self.assertEqual([m.name for m in backup_browser.list_directory(self.archive, "")], ["home"])
+        entries = backup_browser.list_directory(self.archive, "home/alice/")
+        self.assertEqual([(m.name, m.type) for m in entries], [
+            ('a"b.txt', backup_browser.FILE),
+            ("latest", backup_browser.SYMLINK),
+            ("notes.txt", backup_browser.FILE),
+            ("public_html", backup_browser.DIRECTORY),
+            ("r\u00e9sum\u00e9.pdf", backup_browser.FILE),
+        ])
+        self.assertIsNone(backup_browser.member(self.archive, "home/bob"))
+
+    def test_index_is_rebuilt_when_the_archive_changes(self):
+        backup_browser.build_index(self.archive)
+        with tarfile.open(self.archive, "w:gz") as tar:
+            add_file(tar, "other.txt", b"x")
+        self.assertFalse(backup_browser.is_indexed(self.archive))
+        backup_browser.build_index(self.archive)
+        self.assertEqual([m.name for m in backup_browser.list_directory(self.archive, "")], ["other.txt"])
+
+    def test_indexes_of_removed_backups_are_pruned(self):
+        backup_browser.build_index(self.archive)
+        other = os.path.join(self.tmp.name, "alice", "weekly", "2020-01-08.tgz")
+        with tarfile.open(other, "w:gz") as tar:
+            add_file(tar, "other.txt", b"x")
+        os.unlink(self.archive)
+        backup_browser.build_index(other)
+        conn = local_db.connection(config.BACKUP_INDEX_DB_NAME)
+        self.assertEqual(conn.execute("SELECT path FROM archives").fetchall(), [(other,)])
+        self.assertEqual(conn.execute("SELECT count(*) FROM members").fetchone()[0], 1)
+
+    def test_index_is_written_in_batches(self):
+        read_members = backup_browser._read_members
+        seen = []
+
+        def checking(archive, parents):
+            for row in read_members(archive, parents):
+                # a half written index is never used
+                seen.append(backup_browser.is_indexed(archive))
+                yield row
+
+        with mock.patch.object(config, "BACKUP_INDEX_BATCH_SIZE", 2), \
+                mock.patch.object(backup_browser, "_read_members", side_effect=checking):
+            backup_browser.build_index(self.archive)
+        self.assertEqual(seen, [False] * 6)
+        self.assertTrue(backup_browser.is_indexed(self.archive))
+        self.assertEqual(len(backup_browser.list_directory(self.archive, "home/alice")), 5)
+        self.assertEqual(len(backup_browser.list_directory(self.archive, "home/alice/public_html")), 2)
+
+    def test_failed_index_leaves_nothing_behind(self):
+        with open(self.archive, "r+b") as fh:
+            fh.truncate(os.path.getsize(self.archive) // 2)
+        with mock.patch.object(config, "BACKUP_INDEX_BATCH_SIZE", 1), self.assertRaises(Exception):
+            backup_browser.build_index(self.archive)
+        conn = local_db.connection(config.BACKUP_INDEX_DB_NAME)
+        self.assertEqual(conn.execute("SELECT count(*) FROM archives").fetchone()[0], 0)
+        self.assertEqual(conn.execute("SELECT count(*) FROM members").fetchone()[0], 0)
+
+    def test_read_file(self):
+        backup_browser.build_index(self.archive)
+        found = backup_browser.member(self.archive, "home/alice/public_html/big.bin")
+        self.assertEqual(b"".join(backup_browser.read_file(self.archive, found)), self.big)
+
+    def test_read_subtree(self):
+        backup_browser.build_index(self.archive)
+        found = backup_browser.member(self.archive, "home/alice/public_html")
+        data = b"".join(backup_browser.read_subtree(self.archive, found))
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            self.assertEqual(
+                sorted(tar.getnames()),
+                ["public_html", "public_html/big.bin", "public_html/index.html"],
+            )
+            self.assertEqual(tar.extractfile("public_html/big.bin").read(), self.big)
+            self.assertEqual(tar.getmember("public_html/index.html").mode, 0o640)
+
+    def browse(self, path):
+        for _ in range(200):
+            response = self.client.get("/backup/alice/weekly/2020-01-01/browse", query_string={"path": path})
+            if response.status_code != 202:
+                return response
+            threading.Event().wait(0.01)
+        self.fail("backup was never indexed")
+
+    def test_routes(self):
+        first = self.client.get("/backup/alice/weekly/2020-01-01/browse")
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json["kind"], "backup-index")
+
+        listing = self.browse("home/alice/public_html")
+        self.assertEqual(listing.status_code, 200)
+        self.assertEqual(
+            listing.json["entries"][1],
+            {"name": "index.html", "type": "f", "size": 11, "mtime": 1577836800},
+        )
+        self.assertEqual(self.browse("home/alice/notes.txt").status_code, 404)
+
+        restored = self.client.get(
+            "/backup/alice/weekly/2020-01-01/restore", query_string={"path": "home/alice/notes.txt"},
+        )
+        self.assertEqual(restored.data, b"hello")
+        self.assertIn("filename=notes.txt", restored.headers["Content-Disposition"])
+
+        subtree = self.client.get("/backup/alice/weekly/2020-01-01/restore", query_string={"path": "home/alice"})
+        self.assertEqual(subtree.mimetype, "application/x-tar")
+        with tarfile.open(fileobj=io.BytesIO(subtree.data)) as tar:
+            self.assertEqual(tar.extractfile("alice/notes.txt").read(), b"hello")
+
+        self.assertEqual(self.client.get("/backup/bob/weekly/2020-01-01/browse").status_code, 403)
+        self.assertEqual(self.client.get("/backup/alice/weekly/2020-01-08/browse").status_code, 404)
+
+    def test_restored_filenames_are_escaped(self):
+        backup_browser.build_index(self.archive)
+        quoted = self.client.get("/backup/alice/weekly/2020-01-01/restore", query_string={"path": 'home/alice/a"b.txt'})
+        self.assertEqual(quoted.data, b"quoted")
+        self.assertEqual(
+            quoted.headers["Content-Disposition"],
+            'attachment; filename="a\\"b.txt"; filename*=UTF-8\'\'a%22b.txt',
+        )
+
+        accented = self.client.get(
+            "/backup/alice/weekly/2020-01-01/restore", query_string={"path": "home/alice/r\u00e9sum\u00e9.pdf"},
+        )
+        self.assertEqual(accented.data, b"cv")
+        disposition = accented.headers["Content-Disposition"]
+        disposition.encode("latin-1")
+        self.assertIn('filename=resume.pdf', disposition)
+        self.assertIn("filename*=UTF-8''r%C3%A9sum%C3%A9.pdf", disposition)
+
+    def test_failed_index_is_reported_not_retried(self):
+        with open(self.archive, "r+b") as fh:
+            fh.truncate(100)
+        first = self.client.get("/backup/alice/weekly/2020-01-01/browse")
+        # indexing a truncated archive can fail before the first response is even sent
+        self.assertIn(first.status_code, (202, 500))
+        self.assertNotIn("owner", first.json)
+        failed = self.browse("")
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(failed.json["id"], first.json["id"])
+        self.assertEqual(failed.json["state"], jobs.FAILED)
+        self.assertEqual(self.browse("").json["id"], first.json["id"])
+
+    def test_each_backup_has_its_own_index_job(self):
+        other = os.path.join(self.tmp.name, "alice", "monthly", "2020-01-01.tgz")
+        os.makedirs(os.path.dirname(other))
+        with tarfile.open(other, "w:gz") as tar:
+            add_file(tar, "monthly.txt", b"m")
+        release = threading.Event()
+        build_index = backup_browser.build_index
+
+        def slow(archive):
+            release.wait(5)
+            build_index(archive)
+
+        with mock.patch.object(backup_browser, "build_index", side_effect=slow):
+            weekly = self.client.get("/backup/alice/weekly/2020-01-01/browse")
+            monthly = self.client.get("/backup/alice/monthly/2020-01-01/browse")
+            release.set()
+        self.assertNotEqual(weekly.json["id"], monthly.json["id"])
+        for url in ("/backup/alice/weekly/2020-01-01/browse", "/backup/alice/monthly/2020-01-01/browse"):
+            for _ in range(200):
+                response = self.client.get(url)
+                if response.status_code != 202:
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(response.status_code, 200)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+import flask
+
+import config
+from routes.tools.backups import Backup
+
+
+class TestBackupDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old = config.BACKUPS_DIR, config.BACKUP_SENDFILE
+        config.BACKUPS_DIR = self.tmp.name
+        os.makedirs(os.path.join(self.tmp.name, "alice", "weekly"))
+        with open(os.path.join(self.tmp.name, "alice", "weekly", "2020-01-01.tgz"), "wb") as fh:
+            fh.write(bytes(range(256)) * 4)
+        app = flask.Flask("test")
+        app.secret_key = "test"
+        app.add_url_rule("/backup/<string:username>/<string:timeframe>/<string:backup_date>",
+                         view_func=Backup.as_view("backup"))
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session[config.LOGGED_IN_KEY] = True
+            session["username"] = "alice"
+            session["admin"] = False
+
+    def tearDown(self):
+        config.BACKUPS_DIR, config.BACKUP_SENDFILE = self.old
+        self.tmp.cleanup()
+
+    def test_range_and_etag(self):
+        full = self.client.get("/backup/alice/weekly/2020-01-01")
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(len(full.data), 1024)
+        etag = full.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertEqual(full.headers["Accept-Ranges"], "bytes")
+
+        partial = self.client.get("/backup/alice/weekly/2020-01-01", headers={"Range": "bytes=256-511"})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.data, bytes(range(256)))
+        self.assertEqual(partial.headers["Content-Range"], "bytes 256-511/1024")
+
+        cached = self.client.get("/backup/alice/weekly/2020-01-01", headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+
+    def test_x_accel_redirect(self):
+        config.BACKUP_SENDFILE = "x-accel-redirect"
+        response = self.client.get("/backup/alice/weekly/2020-01-01")
+        self.assertEqual(response.headers["X-Accel-Redirect"], "/protected-backups/alice/weekly/2020-01-01.tgz")
+        self.assertEqual(response.data, b"")
+
+    def test_other_users_backups_forbidden(self):
+        self.assertEqual(self.client.get("/backup/bob/weekly/2020-01-01").status_code, 403)
+        self.assertEqual(self.client.get("/backup/alice/weekly/2020-01-02").status_code, 404)
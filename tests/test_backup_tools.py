@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import backup_tools
+import config
+
+
+class TestCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old_dir, config.BACKUPS_DIR = config.BACKUPS_DIR, self.tmp.name
+        backup_tools.invalidate("alice")
+
+    def tearDown(self):
+        backup_tools.invalidate("alice")
+        config.BACKUPS_DIR = self.old_dir
+        self.tmp.cleanup()
+
+    def write(self, timeframe, name, size=10):
+        path = os.path.join(self.tmp.name, "alice", timeframe)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, name), "wb") as fh:
+            fh.write(b"x" * size)
+        # make sure the directory's mtime moves on even on coarse filesystems
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    def test_lists_newest_first(self):
+        self.write("weekly", "2020-01-01.tgz")
+        self.write("weekly", "2020-02-01.tgz", size=20)
+        self.write("weekly", "notes.txt")
+        self.write("monthly", "2019-12-01.tgz")
+        catalogue = backup_tools.catalogue("alice")
+        self.assertEqual([b.date for b in catalogue.weekly], ["2020-02-01", "2020-01-01"])
+        self.assertEqual(catalogue.weekly[0].size, 20)
+        self.assertEqual(backup_tools.list_backups("alice", "monthly"), ["2019-12-01"])
+
+    def test_unchanged_directories_are_not_listed_again(self):
+        self.write("weekly", "2020-01-01.tgz")
+        backup_tools.catalogue("alice")
+        with mock.patch("os.scandir", side_effect=AssertionError("listed again")):
+            self.assertEqual(len(backup_tools.catalogue("alice").weekly), 1)
+        self.write("weekly", "2020-01-08.tgz")
+        self.assertEqual(len(backup_tools.catalogue("alice").weekly), 2)
+
+    def test_missing_directories_are_created(self):
+        self.assertEqual(backup_tools.catalogue("alice"), backup_tools.Catalogue([], []))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp.name, "alice", "monthly")))
@@ -0,0 +1,36 @@
+import time
+import unittest
+
+import cache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_and_set(self):
+        c = cache.TTLCache(60)
+        c.set("alice", 1)
+        self.assertEqual(c.get("alice"), 1)
+        self.assertIsNone(c.get("bob"))
+
+    def test_entries_expire(self):
+        c = cache.TTLCache(0.01)
+        c.set("alice", 1)
+        time.sleep(0.02)
+        self.assertIsNone(c.get("alice"))
+
+    def test_invalidate(self):
+        c = cache.TTLCache(60)
+        c.set("alice", 1)
+        c.invalidate("alice")
+        self.assertIsNone(c.get("alice"))
+
+    def test_evicts_least_recently_used(self):
+        c = cache.TTLCache(60, maxsize=2)
+        c.set("alice", 1)
+        c.set("bob", 2)
+        c.get("alice")
+        c.set("carol", 3)
+        self.assertEqual(len(c), 2)
+        self.assertIsNone(c.get("bob"))
+        self.assertEqual(c.get("alice"), 1)
+        self.assertEqual(c.get("carol"), 3)
@@ -0,0 +1,46 @@
+import concurrent.futures
+import unittest
+from unittest import mock
+
+import config
+import hashing
+
+
+class TestHashing(unittest.TestCase):
+
+    def test_hash_and_verify(self):
+        hashed = hashing.hash_password("hunter2")
+        self.assertTrue(hashed.startswith("{crypt}$6$"))
+        self.assertTrue(hashing.verify_password("hunter2", hashed))
+        self.assertFalse(hashing.verify_password("hunter3", hashed))
+
+    def test_inline_matches_pool(self):
+        hashed = hashing.hash_password("hunter2")
+        workers, config.HASHING_WORKERS = config.HASHING_WORKERS, 0
+        try:
+            self.assertTrue(hashing.verify_password("hunter2", hashed.upper()[:7] + hashed[7:]))
+        finally:
+            config.HASHING_WORKERS = workers
+
+    def test_wedged_pool_falls_back_to_inline(self):
+        class Wedged:
+            def submit(self, *args):
+                # never resolves
+                return concurrent.futures.Future()
+
+            def shutdown(self, wait=True):
+                pass
+
+        hashed = hashing.hash_password("hunter2")
+        timeout, config.HASHING_TIMEOUT = config.HASHING_TIMEOUT, 0.01
+        try:
+            with mock.patch.object(hashing, "_executor", Wedged()):
+                self.assertTrue(hashing.verify_password("hunter2", hashed))
+                # the wedged pool is replaced
+                self.assertIsNone(hashing._executor)
+        finally:
+            config.HASHING_TIMEOUT = timeout
+
+    @classmethod
+    def tearDownClass(cls):
+        hashing._reset_executor()
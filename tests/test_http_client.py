@@ -0,0 +1,52 @@
+import http.server
+import threading
+import unittest
+
+import config
+import http_client
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.clients.append(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.server.clients = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def tearDown(self):
+        http_client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.assertEqual(http_client.get(self.url).text, "ok")
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+    def test_per_host_limit(self):
+        limit = http_client._limit(f"127.0.0.1:{self.server.server_port}")
+        for _ in range(config.HTTP_MAX_PER_HOST):
+            limit.acquire()
+        old, config.HTTP_LIMIT_TIMEOUT = config.HTTP_LIMIT_TIMEOUT, 0.01
+        try:
+            with self.assertRaises(http_client.HTTPLimitTimeoutException):
+                http_client.get(self.url)
+        finally:
+            config.HTTP_LIMIT_TIMEOUT = old
+            for _ in range(config.HTTP_MAX_PER_HOST):
+                limit.release()
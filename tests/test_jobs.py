@@ -0,0 +1,82 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import config
+import jobs
+import local_db
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old_path = config.JOBS_DB_NAME
+        config.JOBS_DB_NAME = os.path.join(self.tmp.name, "jobs.db")
+
+    def tearDown(self):
+        # wait for anything still running before removing its database
+        jobs._get_executor().submit(lambda: None).result()
+        local_db.close(config.JOBS_DB_NAME)
+        local_db.forget_migrations(config.JOBS_DB_NAME)
+        config.JOBS_DB_NAME = self.old_path
+        self.tmp.cleanup()
+
+    def wait(self, job_id):
+        for _ in range(200):
+            job = jobs.get(job_id)
+            if job.state in (jobs.SUCCEEDED, jobs.FAILED):
+                return job
+            threading.Event().wait(0.01)
+        self.fail("job never finished")
+
+    def test_steps_are_recorded(self):
+        def work(progress):
+            with progress.step("download"):
+                pass
+            with progress.step("extract"):
+                pass
+
+        job = self.wait(jobs.submit("wordpress", "alice", work).id)
+        self.assertEqual(job.state, jobs.SUCCEEDED)
+        self.assertEqual([step["name"] for step in job.steps], ["download", "extract"])
+
+    def test_failure_recorded(self):
+        def work(progress):
+            raise RuntimeError("no space left")
+
+        job = self.wait(jobs.submit("wordpress", "alice", work).id)
+        self.assertEqual(job.state, jobs.FAILED)
+        self.assertEqual(job.error, "no space left")
+
+    def test_duplicates_return_running_job(self):
+        release = threading.Event()
+        first = jobs.submit("wordpress", "alice", lambda progress: release.wait(5))
+        second = jobs.submit("wordpress", "alice", lambda progress: self.fail("ran twice"))
+        other = jobs.submit("wordpress", "bob", lambda progress: None)
+        release.set()
+        self.assertEqual(first.id, second.id)
+        self.assertNotEqual(first.id, other.id)
+        self.wait(first.id)
+        # once finished a new install can be started
+        self.assertNotEqual(jobs.submit("wordpress", "alice", lambda progress: None).id, first.id)
+
+    def test_failure_to_start_is_recorded(self):
+        with mock.patch.object(jobs, "_START", "UPDATE missing SET state = 'running'"):
+            job = self.wait(jobs.submit("wordpress", "alice", lambda progress: self.fail("ran")).id)
+        self.assertEqual(job.state, jobs.FAILED)
+        self.assertIn("missing", job.error)
+
+    def test_job_whose_result_was_lost_does_not_block_the_next(self):
+        with mock.patch.object(jobs, "_FINISH", "UPDATE missing SET state = ?"), \
+                mock.patch.object(jobs, "_FINISH_ATTEMPTS", 1), mock.patch("time.sleep"):
+            lost = jobs.submit("wordpress", "alice", lambda progress: None)
+            for _ in range(200):
+                if lost.id not in jobs._running:
+                    break
+                threading.Event().wait(0.01)
+        self.assertEqual(jobs.get(lost.id).state, jobs.RUNNING)
+        self.assertNotEqual(jobs.submit("wordpress", "alice", lambda progress: None).id, lost.id)
+        self.assertEqual(jobs.get(lost.id).state, jobs.FAILED)
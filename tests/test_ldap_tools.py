@@ -0,0 +1,52 @@
+import unittest
+
+import ldap3
+
+import ldap_tools
+
+
+class TestUserDNs(unittest.TestCase):
+
+    def setUp(self):
+        server = ldap3.Server("fake", get_info=ldap3.OFFLINE_SLAPD_2_4)
+        self.conn = ldap3.Connection(
+            server,
+            user="cn=admin,dc=netsoc,dc=co",
+            password="netsoc",
+            client_strategy=ldap3.MOCK_SYNC,
+        )
+        self.conn.strategy.add_entry("cn=admin,dc=netsoc,dc=co", {"userPassword": "netsoc", "sn": "admin"})
+        self.conn.strategy.add_entry("cn=alice,cn=admins,dc=netsoc,dc=co", {
+            "objectClass": ["account", "posixAccount"],
+            "cn": "alice",
+            "uid": "alice",
+            "uidNumber": 1000,
+            "gidNumber": 420,
+            "homeDirectory": "/home/users/alice",
+            "loginShell": "/bin/bash",
+        })
+        self.conn.bind()
+
+    def tearDown(self):
+        ldap_tools.forget_dn("alice")
+        self.conn.unbind()
+
+    def test_resolves_dn_in_any_ou(self):
+        self.assertEqual(ldap_tools.resolve_dn(self.conn, "alice"), "cn=alice,cn=admins,dc=netsoc,dc=co")
+        self.assertIsNone(ldap_tools.resolve_dn(self.conn, "nobody"))
+
+    def test_modify_user(self):
+        changes = {"loginShell": (ldap3.MODIFY_REPLACE, ["/usr/bin/zsh"])}
+        self.assertTrue(ldap_tools.modify_user(self.conn, "alice", changes))
+        self.conn.search("cn=alice,cn=admins,dc=netsoc,dc=co", "(objectClass=*)", attributes=["loginShell"])
+        self.assertEqual(self.conn.entries[0]["loginShell"].value, "/usr/bin/zsh")
+
+    def test_modify_user_re_resolves_stale_dn(self):
+        ldap_tools.remember_dn("alice", "cn=alice,cn=member,dc=netsoc,dc=co")
+        changes = {"loginShell": (ldap3.MODIFY_REPLACE, ["/usr/bin/fish"])}
+        self.assertTrue(ldap_tools.modify_user(self.conn, "alice", changes))
+        self.assertEqual(ldap_tools.resolve_dn(self.conn, "alice"), "cn=alice,cn=admins,dc=netsoc,dc=co")
+
+    def test_modify_unknown_user(self):
+        with self.assertRaises(ldap_tools.UserNotFoundException):
+            ldap_tools.modify_user(self.conn, "nobody", {"loginShell": (ldap3.MODIFY_REPLACE, ["/bin/bash"])})
@@ -0,0 +1,124 @@
+import concurrent.futures
+import http.server
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import config
+import local_db
+import mail_queue
+
+
+class SendGridSink(http.server.BaseHTTPRequestHandler):
+    """
+    Accepts mail the way SendGrid's API does, recording what it is sent, or fails
+    every request while the server's fail attribute is set.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.fail:
+            self.send_response(500)
+        else:
+            self.server.received.append(body)
+            self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMailQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sink = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SendGridSink)
+        self.sink.received = []
+        self.sink.fail = False
+        threading.Thread(target=self.sink.serve_forever, daemon=True).start()
+        self.old = config.MAIL_DB_NAME, config.SENDGRID_HOST
+        config.MAIL_DB_NAME = os.path.join(self.tmp.name, "mail.db")
+        config.SENDGRID_HOST = f"http://127.0.0.1:{self.sink.server_port}"
+        self.executor = concurrent.futures.ThreadPoolExecutor(2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.sink.shutdown()
+        self.sink.server_close()
+        local_db.close(config.MAIL_DB_NAME)
+        local_db.forget_migrations(config.MAIL_DB_NAME)
+        config.MAIL_DB_NAME, config.SENDGRID_HOST = self.old
+        self.tmp.cleanup()
+
+    def test_worker_sends_queued_mail(self):
+        queued = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "hi", ["c@example.com"])
+        self.assertEqual(queued.status_code, 202)
+        self.assertEqual(mail_queue.status(queued.id), mail_queue.QUEUED)
+        self.assertEqual(mail_queue.process(self.executor), 1)
+        self.assertEqual(mail_queue.status(queued.id), mail_queue.SENT)
+        self.assertEqual(len(self.sink.received), 1)
+        self.assertEqual(self.sink.received[0]["subject"], "Hello")
+        self.assertEqual(self.sink.received[0]["personalizations"][0]["cc"], [{"email": "c@example.com"}])
+        self.assertEqual(mail_queue.process(self.executor), 0)
+
+    def test_duplicates_are_queued_once(self):
+        first = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "hi")
+        second = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "hi")
+        other = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "bye")
+        self.assertEqual(first.id, second.id)
+        self.assertNotEqual(first.id, other.id)
+        self.assertEqual(mail_queue.process(self.executor), 2)
+
+    def test_failures_back_off_then_give_up(self):
+        attempts, config.MAIL_MAX_ATTEMPTS = config.MAIL_MAX_ATTEMPTS, 2
+        self.sink.fail = True
+        try:
+            queued = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "hi")
+            self.assertEqual(mail_queue.process(self.executor), 1)
+            self.assertEqual(mail_queue.status(queued.id), mail_queue.QUEUED)
+            # not due again until the backoff has passed
+            self.assertEqual(mail_queue.process(self.executor), 0)
+            later = int(time.time()) + config.MAIL_RETRY_BACKOFF
+            self.assertEqual(mail_queue.process(self.executor, now=later), 1)
+            self.assertEqual(mail_queue.status(queued.id), mail_queue.FAILED)
+        finally:
+            config.MAIL_MAX_ATTEMPTS = attempts
+        self.assertEqual(self.sink.received, [])
+
+    def content(self, mail_id):
+        return local_db.connection(config.MAIL_DB_NAME).execute(
+            "SELECT content FROM outbox WHERE id = ?", (mail_id,),
+        ).fetchone()[0]
+
+    def test_content_is_deleted_once_sent_or_given_up_on(self):
+        sent = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Password", "your password is hunter2")
+        self.assertEqual(self.content(sent.id), "your password is hunter2")
+        mail_queue.process(self.executor)
+        self.assertIsNone(self.content(sent.id))
+        # still deduplicated without its content
+        self.assertEqual(mail_queue.enqueue("a@netsoc.co", "b@example.com", "Password", "your password is hunter2").id,
+                         sent.id)
+
+        attempts, config.MAIL_MAX_ATTEMPTS = config.MAIL_MAX_ATTEMPTS, 1
+        self.sink.fail = True
+        try:
+            failed = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Password", "your password is hunter3")
+            mail_queue.process(self.executor)
+        finally:
+            config.MAIL_MAX_ATTEMPTS = attempts
+        self.assertEqual(mail_queue.status(failed.id), mail_queue.FAILED)
+        self.assertIsNone(self.content(failed.id))
+
+    def test_purge(self):
+        queued = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "hi")
+        mail_queue.process(self.executor)
+        waiting = mail_queue.enqueue("a@netsoc.co", "b@example.com", "Hello", "bye")
+        now = int(time.time())
+        self.assertEqual(mail_queue.purge(now), 0)
+        self.assertEqual(mail_queue.purge(now + config.MAIL_DEDUPE_WINDOW + config.MAIL_RETENTION), 1)
+        self.assertIsNone(mail_queue.status(queued.id))
+        self.assertEqual(mail_queue.status(waiting.id), mail_queue.QUEUED)
@@ -0,0 +1,12 @@
+import unittest
+
+import mysql
+
+
+class TestPrefixPattern(unittest.TestCase):
+
+    def test_plain_username(self):
+        self.assertEqual(mysql._prefix_pattern("alice"), "alice\\_%")
+
+    def test_wildcards_escaped(self):
+        self.assertEqual(mysql._prefix_pattern("my_user%"), "my\\_user\\%\\_%")
@@ -0,0 +1,96 @@
+import gc
+import unittest
+
+import pymysql
+
+import mysql_pool
+
+
+class FakeConnection:
+    """
+    Stands in for a pymysql connection so the pool can be tested without a
+    MySQL server.
+    """
+
+    def __init__(self):
+        self.open = True
+        self.alive = True
+        self.server_status = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        if not self.alive:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status = 0
+
+    def close(self):
+        self.open = False
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.made = []
+        self.pool = mysql_pool.ConnectionPool(
+            self.connect, min_size=1, max_size=2, timeout=0.05, idle_timeout=60, leak_timeout=60,
+        )
+
+    def connect(self):
+        conn = FakeConnection()
+        self.made.append(conn)
+        return conn
+
+    def test_connections_are_reused(self):
+        with self.pool.connection() as first:
+            first_conn = first._conn
+        with self.pool.connection() as second:
+            self.assertIs(second._conn, first_conn)
+        self.assertEqual(len(self.made), 1)
+
+    def test_close_returns_to_pool(self):
+        conn = self.pool._acquire()
+        conn.close()
+        self.assertTrue(self.made[0].open)
+        with self.assertRaises(pymysql.err.InterfaceError):
+            conn.cursor()
+
+    def test_dead_connection_replaced(self):
+        with self.pool.connection():
+            pass
+        self.made[0].alive = False
+        with self.pool.connection() as conn:
+            self.assertIs(conn._conn, self.made[1])
+        self.assertFalse(self.made[0].open)
+
+    def test_open_transaction_rolled_back(self):
+        with self.pool.connection() as conn:
+            conn._conn.server_status = pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        self.assertEqual(self.made[0].rollbacks, 1)
+
+    def test_timeout_when_exhausted(self):
+        with self.pool.connection(), self.pool.connection():
+            with self.assertRaises(mysql_pool.MySQLPoolTimeoutException):
+                self.pool._acquire()
+
+    def test_idle_connections_pruned(self):
+        self.pool.idle_timeout = 0
+        with self.pool.connection(), self.pool.connection():
+            pass
+        with self.pool.connection():
+            pass
+        # one of the two idle connections is kept as the minimum
+        self.assertEqual(sum(conn.open for conn in self.made), 1)
+
+    def test_dropped_connection_is_reclaimed(self):
+        pool = mysql_pool.ConnectionPool(
+            self.connect, min_size=1, max_size=1, timeout=0.05, idle_timeout=60, leak_timeout=60,
+        )
+        conn = pool._acquire()
+        del conn
+        gc.collect()
+        self.assertEqual(pool._open, 1)
+        with pool.connection() as again:
+            self.assertIs(again._conn, self.made[0])
@@ -0,0 +1,20 @@
+import unittest
+
+import mysql_provision
+
+
+class TestStatements(unittest.TestCase):
+
+    def test_accounts(self):
+        sql, args = mysql_provision._accounts("alice", ["%", "localhost"])
+        self.assertEqual(sql, "%s@%s, %s@%s")
+        self.assertEqual(args, ["alice", "%", "alice", "localhost"])
+
+    def test_accounts_with_password(self):
+        sql, args = mysql_provision._accounts("alice", ["%"], "hunter2")
+        self.assertEqual(sql, "%s@%s IDENTIFIED BY %s")
+        self.assertEqual(args, ["alice", "%", "hunter2"])
+
+    def test_identifier(self):
+        self.assertEqual(mysql_provision._identifier("alice\\_%"), "`alice\\_%%`")
+        self.assertEqual(mysql_provision._identifier("a`b"), "`a``b`")
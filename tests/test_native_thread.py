@@ -0,0 +1,19 @@
+import threading
+import unittest
+
+import native_thread
+
+
+class TestNativeThread(unittest.TestCase):
+
+    def test_runs_inline_without_gevent(self):
+        # the tests aren't monkey-patched, so real threads are already real
+        self.assertEqual(native_thread.call(lambda a, b: (a + b, threading.get_ident()), 1, 2),
+                         (3, threading.get_ident()))
+
+    def test_exceptions_are_raised(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            native_thread.call(fail)
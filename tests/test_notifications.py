@@ -0,0 +1,44 @@
+import time
+import unittest
+from unittest import mock
+
+import config
+import notifications
+
+
+def slow(result, seconds=0.2):
+    def channel(notification):
+        time.sleep(seconds)
+        return result
+    return channel
+
+
+def broken(notification):
+    raise RuntimeError("webhook down")
+
+
+class TestNotify(unittest.TestCase):
+
+    def setUp(self):
+        self.notification = notifications.Notification(notifications.HELP, "alice", "a@example.com", "hi", "help")
+        self.old = config.NOTIFICATION_CHANNELS, config.NOTIFICATION_DEADLINE
+
+    def tearDown(self):
+        config.NOTIFICATION_CHANNELS, config.NOTIFICATION_DEADLINE = self.old
+
+    def test_channels_run_in_parallel(self):
+        channels = {"a": slow(True), "b": slow(True), "c": broken}
+        config.NOTIFICATION_CHANNELS = list(channels)
+        with mock.patch.dict(notifications.CHANNELS, channels):
+            start = time.monotonic()
+            results = notifications.notify(self.notification)
+        self.assertLess(time.monotonic() - start, 0.35)
+        self.assertEqual(results, {"a": True, "b": True, "c": False})
+
+    def test_deadline(self):
+        channels = {"fast": slow(True, 0), "stuck": slow(True, 1)}
+        config.NOTIFICATION_CHANNELS = list(channels)
+        config.NOTIFICATION_DEADLINE = 0.1
+        with mock.patch.dict(notifications.CHANNELS, channels):
+            results = notifications.notify(self.notification)
+        self.assertEqual(results, {"fast": True, "stuck": False})
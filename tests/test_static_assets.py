@@ -0,0 +1,79 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+import flask
+
+import config
+import static_assets
+from routes.assets import Robots, StaticAsset
+
+
+class TestStaticAssets(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old = config.STATIC_FOLDER, config.STATIC_BUILD_DIR, config.FLASK_CONFIG["debug"]
+        config.STATIC_FOLDER = os.path.join(self.tmp.name, "static")
+        config.STATIC_BUILD_DIR = os.path.join(self.tmp.name, "build")
+        config.FLASK_CONFIG["debug"] = False
+        os.makedirs(os.path.join(config.STATIC_FOLDER, "css"))
+        self.css = b"body { color: red; }\n" * 100
+        with open(os.path.join(config.STATIC_FOLDER, "css", "main.css"), "wb") as fh:
+            fh.write(self.css)
+        with open(os.path.join(config.STATIC_FOLDER, "robots.txt"), "wb") as fh:
+            fh.write(b"User-agent: *\n")
+        with open(os.path.join(config.STATIC_FOLDER, "icon.png"), "wb") as fh:
+            fh.write(os.urandom(1000))
+        static_assets.load()
+
+        app = flask.Flask("test")
+        app.add_template_global(static_assets.asset_url)
+        app.add_url_rule("/robots.txt", view_func=Robots.as_view("robots"))
+        app.add_url_rule("/assets/<path:path>", view_func=StaticAsset.as_view("asset"))
+        self.app = app
+        self.client = app.test_client()
+
+    def tearDown(self):
+        config.STATIC_FOLDER, config.STATIC_BUILD_DIR, config.FLASK_CONFIG["debug"] = self.old
+        static_assets._by_name, static_assets._by_path = {}, {}
+        self.tmp.cleanup()
+
+    def test_fingerprinted_urls_change_with_contents(self):
+        url = static_assets.asset_url("css/main.css")
+        self.assertRegex(url, r"^/assets/css/main\.[0-9a-f]{12}\.css$")
+        with open(os.path.join(config.STATIC_FOLDER, "css", "main.css"), "ab") as fh:
+            fh.write(b"p {}\n")
+        static_assets.load()
+        self.assertNotEqual(static_assets.asset_url("css/main.css"), url)
+        self.assertEqual(static_assets.asset_url("missing.js"), "/static/missing.js")
+        self.assertEqual(static_assets.get("icon.png").encodings, [])
+
+    def test_precompressed_and_immutable(self):
+        url = static_assets.asset_url("css/main.css")
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.mimetype, "text/css")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(gzip.decompress(response.data), self.css)
+        self.assertIn("immutable", response.headers["Cache-Control"].split(", "))
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 60 * 60)
+        self.assertFalse(response.cache_control.no_cache)
+
+        plain = self.client.get(url, headers={"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.data, self.css)
+
+        self.assertEqual(self.client.get("/assets/css/main.css").status_code, 404)
+
+    def test_robots(self):
+        response = self.client.get("/robots.txt")
+        self.assertEqual(response.data, b"User-agent: *\n")
+        self.assertEqual(response.cache_control.max_age, config.STATIC_UNVERSIONED_MAX_AGE)
+
+    def test_template_helper(self):
+        with self.app.app_context():
+            html = flask.render_template_string("<link href=\"{{ asset_url('css/main.css') }}\">")
+        self.assertIn(static_assets.asset_url("css/main.css"), html)
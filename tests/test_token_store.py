@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import config
+import local_db
+import token_store
+
+
+class TestTokenStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old_path = config.TOKEN_DB_NAME
+        config.TOKEN_DB_NAME = os.path.join(self.tmp.name, "uri.db")
+
+    def tearDown(self):
+        local_db.close(config.TOKEN_DB_NAME)
+        local_db.forget_migrations(config.TOKEN_DB_NAME)
+        config.TOKEN_DB_NAME = self.old_path
+        self.tmp.cleanup()
+
+    def test_add_lookup_remove(self):
+        token_store.add("alice@example.com", "abc")
+        self.assertEqual(token_store.email_for("abc"), "alice@example.com")
+        self.assertIsNone(token_store.email_for("def"))
+        token_store.remove("alice@example.com")
+        self.assertIsNone(token_store.email_for("abc"))
+
+    def test_legacy_table_migrated(self):
+        with sqlite3.connect(config.TOKEN_DB_NAME) as conn:
+            conn.execute("CREATE TABLE uris(email TEXT, uri INT)")
+            conn.execute("INSERT INTO uris VALUES (?, ?)", ("bob@example.com", "f00d"))
+        self.assertEqual(token_store.email_for("f00d"), "bob@example.com")
+        conn = local_db.connection(config.TOKEN_DB_NAME)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], len(token_store.MIGRATIONS))
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        indexes = [row[1] for row in conn.execute("PRAGMA index_list(uris)")]
+        self.assertIn("uris_email", indexes)
+
+    def test_expired_token_rejected(self):
+        ttl, config.TOKEN_TTL = config.TOKEN_TTL, -1
+        try:
+            token_store.add("alice@example.com", "abc")
+        finally:
+            config.TOKEN_TTL = ttl
+        self.assertIsNone(token_store.email_for("abc"))
+
+    def test_sweep_in_batches(self):
+        batch, config.TOKEN_SWEEP_BATCH = config.TOKEN_SWEEP_BATCH, 2
+        try:
+            for i in range(5):
+                token_store.add(f"user{i}@example.com", f"uri{i}")
+            token_store.add("keep@example.com", "keep")
+            conn = local_db.connection(config.TOKEN_DB_NAME)
+            conn.execute("UPDATE uris SET expires_at = 0 WHERE uri != 'keep'")
+            self.assertEqual(token_store.sweep(), 5)
+        finally:
+            config.TOKEN_SWEEP_BATCH = batch
+        self.assertEqual([row[0] for row in token_store.rows()], ["keep@example.com"])
+        self.assertGreater(token_store.rows()[0][3], time.time())
+
+    def test_expired_tokens_deleted_before_switching_to_incremental_vacuum(self):
+        token_store.add("old@example.com", "old")
+        token_store.add("keep@example.com", "keep")
+        conn = local_db.connection(config.TOKEN_DB_NAME)
+        conn.execute("UPDATE uris SET expires_at = 0 WHERE uri = 'old'")
+        conn.execute("PRAGMA auto_vacuum = 0")
+        conn.execute("VACUUM")
+        statements = []
+        # python 3.7's sqlite3 needs a hashable callback, which list.append isn't
+        conn.set_trace_callback(lambda sql: statements.append(sql))
+        try:
+            token_store.backend().prepare_sweeps()
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertEqual([row[0] for row in token_store.rows()], ["keep@example.com"])
+        deletes = [i for i, sql in enumerate(statements) if sql.startswith("DELETE")]
+        self.assertLess(deletes[0], statements.index("VACUUM"))
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, args=()):
+        self.conn.statements.append((" ".join(sql.split()), args))
+        if sql.startswith("SELECT email FROM"):
+            uri, now = args
+            self.result = [(email,) for email, u, _, expires in self.conn.tokens if u == uri and expires > now]
+        elif sql.startswith("REPLACE"):
+            self.conn.tokens.append(args)
+        return len(self.result)
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    """
+    Stands in for a pooled MySQL connection, keeping tokens in a list.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.tokens = []
+        self.commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestMySQLTokenBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = FakeConnection()
+        self.old_backend, config.TOKEN_BACKEND = config.TOKEN_BACKEND, "mysql"
+        self.patch = mock.patch("mysql_pool.connection", return_value=self.conn)
+        self.patch.start()
+        token_store._backends.pop("mysql", None)
+
+    def tearDown(self):
+        self.patch.stop()
+        token_store._backends.pop("mysql", None)
+        config.TOKEN_BACKEND = self.old_backend
+
+    def test_add_and_lookup_share_expiry(self):
+        self.assertIsInstance(token_store.backend(), token_store.MySQLTokenBackend)
+        token_store.add("alice@example.com", "abc")
+        self.assertEqual(token_store.email_for("abc"), "alice@example.com")
+        email, uri, created_at, expires_at = self.conn.tokens[0]
+        self.assertEqual(expires_at - created_at, config.TOKEN_TTL)
+        # the table is only created once per process
+        creates = [sql for sql, _ in self.conn.statements if sql.startswith("CREATE TABLE")]
+        self.assertEqual(len(creates), 1)
+        self.assertEqual(self.conn.commits, 2)
+
+    def test_unknown_backend(self):
+        config.TOKEN_BACKEND = "redis"
+        with self.assertRaises(ValueError):
+            token_store.backend()
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class Incomplete(token_store.TokenBackend):
+            def add(self, email, uri, created_at, expires_at):
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
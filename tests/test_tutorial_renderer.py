@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import config
+import tutorial_renderer
+
+
+class TestTutorialRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old = config.TUTORIAL_FOLDER, config.FLASK_CONFIG["debug"]
+        config.TUTORIAL_FOLDER = self.tmp.name
+        config.FLASK_CONFIG["debug"] = False
+        tutorial_renderer._rendered.clear()
+        tutorial_renderer._checked_at = None
+
+    def tearDown(self):
+        config.TUTORIAL_FOLDER, config.FLASK_CONFIG["debug"] = self.old
+        tutorial_renderer._rendered.clear()
+        tutorial_renderer._checked_at = None
+        self.tmp.cleanup()
+
+    def write(self, name, text, mtime_ns):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as fh:
+            fh.write(text)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_ordered_by_name_and_only_changed_files_rerendered(self):
+        self.write("2-b.md", "# B", 10 ** 9)
+        self.write("1-a.md", "# A", 10 ** 9)
+        self.write("notes.txt", "ignored", 10 ** 9)
+        self.assertEqual(tutorial_renderer.tutorials(), ["<h1>A</h1>", "<h1>B</h1>"])
+
+        self.write("2-b.md", "# B2", 2 * 10 ** 9)
+        os.unlink(os.path.join(self.tmp.name, "1-a.md"))
+        tutorial_renderer._checked_at = None
+        with mock.patch.object(tutorial_renderer, "_render", wraps=tutorial_renderer._render) as render:
+            self.assertEqual(tutorial_renderer.tutorials(), ["<h1>B2</h1>"])
+        render.assert_called_once_with(os.path.join(self.tmp.name, "2-b.md"))
+
+    def test_folder_only_checked_every_interval(self):
+        self.write("1-a.md", "# A", 10 ** 9)
+        tutorial_renderer.tutorials()
+        self.write("2-b.md", "# B", 10 ** 9)
+        with mock.patch.object(tutorial_renderer, "_reload") as reload:
+            self.assertEqual(tutorial_renderer.tutorials(), ["<h1>A</h1>"])
+            reload.assert_not_called()
+            config.FLASK_CONFIG["debug"] = True
+            tutorial_renderer.tutorials()
+            reload.assert_called_once_with()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import ldap3
+
+import config
+import uid_allocator
+
+
+class TestUIDAllocator(unittest.TestCase):
+
+    def setUp(self):
+        server = ldap3.Server("fake", get_info=ldap3.OFFLINE_SLAPD_2_4)
+        self.conn = ldap3.Connection(
+            server,
+            user="cn=admin,dc=netsoc,dc=co",
+            password="netsoc",
+            client_strategy=ldap3.MOCK_SYNC,
+        )
+        self.conn.strategy.add_entry("cn=admin,dc=netsoc,dc=co", {"userPassword": "netsoc", "sn": "admin"})
+        for uid, uid_number in [("alice", 1000), ("bob", 1007)]:
+            self.add_account(uid, uid_number)
+        self.conn.bind()
+
+    def add_account(self, uid: str, uid_number: int, group: str = "member"):
+        self.conn.strategy.add_entry(f"cn={uid},cn={group},dc=netsoc,dc=co", {
+            "objectClass": ["account", "posixAccount"],
+            "cn": uid,
+            "uid": uid,
+            "uidNumber": uid_number,
+            "gidNumber": 422,
+            "homeDirectory": f"/home/users/{uid}",
+        })
+
+    def tearDown(self):
+        self.conn.unbind()
+
+    def test_seeds_counter_from_highest_member(self):
+        self.assertEqual(uid_allocator.allocate(self.conn), 1008)
+
+    def test_allocations_are_sequential(self):
+        first = uid_allocator.allocate(self.conn)
+        second = uid_allocator.allocate(self.conn)
+        self.assertEqual(second, first + 1)
+
+    def test_skips_numbers_already_in_use(self):
+        uid_allocator.allocate(self.conn)
+        self.add_account("carol", 1009, group="admins")
+        self.assertEqual(uid_allocator.allocate(self.conn), 1010)
+
+    def test_counter_entry_has_its_rdn(self):
+        # the mock directory fills in a missing RDN value itself, so check what was sent
+        with mock.patch.object(self.conn, "add", wraps=self.conn.add) as add:
+            uid_allocator.allocate(self.conn)
+        dn, object_class, attributes = add.call_args[0]
+        self.assertEqual(dn, config.LDAP_UID_COUNTER_DN)
+        self.assertIn("device", object_class)
+        self.assertEqual(attributes["cn"], "uidNext")
@@ -0,0 +1,29 @@
+import time
+import unittest
+
+import username_index
+
+
+class TestUsernameIndex(unittest.TestCase):
+
+    def setUp(self):
+        # pretend the index has been loaded so is_taken doesn't go to LDAP
+        username_index._taken = {"alice"}
+        username_index._loaded_at = time.monotonic()
+
+    def tearDown(self):
+        username_index._taken = set()
+        username_index._loaded_at = None
+
+    def test_is_taken(self):
+        self.assertTrue(username_index.is_taken("alice"))
+        self.assertFalse(username_index.is_taken("bob"))
+
+    def test_blacklisted_is_taken(self):
+        self.assertTrue(username_index.is_taken("test"))
+
+    def test_add_and_discard(self):
+        username_index.add("bob")
+        self.assertTrue(username_index.is_taken("bob"))
+        username_index.discard("alice")
+        self.assertFalse(username_index.is_taken("alice"))
@@ -0,0 +1,92 @@
+import hashlib
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+
+import config
+import http_client
+import wordpress_cache
+
+
+class ReleaseHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves a WordPress release and its checksum the way wordpress.org does,
+    answering conditional requests with 304.
+    """
+
+    def do_GET(self):
+        release, sha1 = self.server.release, self.server.sha1
+        etag = '"' + hashlib.sha1(release).hexdigest() + '"'
+        if self.path.endswith(".sha1"):
+            body = sha1.encode()
+        elif self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        else:
+            self.server.downloads += 1
+            body = release
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWordpressCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ReleaseHandler)
+        self.publish(b"wordpress 1")
+        self.server.downloads = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.old = config.WORDPRESS_CACHE_DIR, config.WORDPRESS_RELEASE_URL, config.WORDPRESS_OFFLINE
+        config.WORDPRESS_CACHE_DIR = self.tmp.name
+        config.WORDPRESS_RELEASE_URL = f"http://127.0.0.1:{self.server.server_port}/latest.tar.gz"
+
+    def tearDown(self):
+        http_client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        config.WORDPRESS_CACHE_DIR, config.WORDPRESS_RELEASE_URL, config.WORDPRESS_OFFLINE = self.old
+        self.tmp.cleanup()
+
+    def publish(self, release, sha1=None):
+        self.server.release = release
+        self.server.sha1 = sha1 or hashlib.sha1(release).hexdigest()
+
+    def cached(self):
+        with open(wordpress_cache.tarball_path(), "rb") as fh:
+            return fh.read()
+
+    def test_downloaded_once(self):
+        path = wordpress_cache.tarball()
+        self.assertEqual(wordpress_cache.tarball(), path)
+        self.assertFalse(wordpress_cache.refresh())
+        self.assertEqual(self.server.downloads, 1)
+        self.publish(b"wordpress 2")
+        self.assertTrue(wordpress_cache.refresh())
+        self.assertEqual(self.cached(), b"wordpress 2")
+
+    def test_bad_checksum_keeps_old_release(self):
+        wordpress_cache.tarball()
+        self.publish(b"tampered", sha1="0" * 40)
+        with self.assertRaises(wordpress_cache.WordpressCacheException):
+            wordpress_cache.refresh()
+        self.assertEqual(self.cached(), b"wordpress 1")
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), sorted([wordpress_cache.TARBALL, wordpress_cache.METADATA]))
+
+    def test_offline(self):
+        config.WORDPRESS_OFFLINE = True
+        with self.assertRaises(wordpress_cache.WordpressCacheException):
+            wordpress_cache.tarball()
+        with open(wordpress_cache.tarball_path(), "wb") as fh:
+            fh.write(b"seeded")
+        self.assertEqual(wordpress_cache.tarball(), wordpress_cache.tarball_path())
+        self.assertEqual(self.server.downloads, 0)
@@ -0,0 +1,150 @@
+import io
+import os
+import re
+import stat
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+import wordpress_install
+
+
+def add(tar, name, data=None, mode=0o644, kind=tarfile.REGTYPE, linkname=""):
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    info.mode = mode
+    info.linkname = linkname
+    if data is not None:
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    else:
+        tar.addfile(info)
+
+
+class TestExtractFromTar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.target = os.path.join(self.tmp.name, "public_html")
+        os.mkdir(self.target)
+        self.archive = os.path.join(self.tmp.name, "wordpress.tar.gz")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, *members):
+        with tarfile.open(self.archive, "w:gz") as tar:
+            for member in members:
+                add(tar, *member[:1], **member[1])
+
+    def test_extracts_files_and_modes(self):
+        self.build(
+            ("wordpress", {"kind": tarfile.DIRTYPE, "mode": 0o755}),
+            ("wordpress/index.php", {"data": b"<?php", "mode": 0o4755}),
+            ("wordpress/wp-admin/admin.php", {"data": b"admin"}),
+            ("wordpress/link", {"kind": tarfile.SYMTYPE, "linkname": "/etc/passwd"}),
+        )
+        wordpress_install.extract_from_tar(self.archive, self.target, os.getuid(), os.getgid())
+        index = os.path.join(self.target, "wordpress", "index.php")
+        with open(index, "rb") as fh:
+            self.assertEqual(fh.read(), b"<?php")
+        # setuid is dropped
+        self.assertEqual(stat.S_IMODE(os.stat(index).st_mode), 0o755)
+        self.assertTrue(os.path.isfile(os.path.join(self.target, "wordpress", "wp-admin", "admin.php")))
+        self.assertFalse(os.path.lexists(os.path.join(self.target, "wordpress", "link")))
+
+    def test_refuses_path_traversal(self):
+        for name in ["../evil.php", "/tmp/evil.php", "wordpress/../../evil.php"]:
+            self.build((name, {"data": b"evil"}))
+            with self.assertRaises(wordpress_install.UnsafeArchiveException):
+                wordpress_install.extract_from_tar(self.archive, self.target)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "evil.php")))
+
+    def test_refuses_to_follow_symlinks_out(self):
+        outside = os.path.join(self.tmp.name, "outside")
+        os.mkdir(outside)
+        os.symlink(outside, os.path.join(self.target, "wordpress"))
+        self.build(("wordpress/index.php", {"data": b"<?php"}))
+        with self.assertRaises(wordpress_install.UnsafeArchiveException):
+            wordpress_install.extract_from_tar(self.archive, self.target)
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_directory_swapped_for_symlink_part_way_through(self):
+        outside = os.path.join(self.tmp.name, "outside")
+        os.mkdir(outside)
+        content = os.path.join(self.target, "wordpress", "wp-content")
+        moved = os.path.join(self.target, "moved")
+        self.build(
+            ("wordpress", {"kind": tarfile.DIRTYPE, "mode": 0o755}),
+            ("wordpress/wp-content", {"kind": tarfile.DIRTYPE, "mode": 0o755}),
+            ("wordpress/wp-content/a.php", {"data": b"a"}),
+            ("wordpress/wp-content/b.php", {"data": b"b"}),
+            ("wordpress/wp-content/plugins/c.php", {"data": b"c"}),
+        )
+        owners = []
+        copy = wordpress_install.shutil.copyfileobj
+
+        def swap_after_first_file(src, dst, length):
+            copy(src, dst, length)
+            if not os.path.islink(content):
+                owners.append(os.stat(content).st_uid)
+                os.rename(content, moved)
+                os.symlink(outside, content)
+
+        uid = 12345 if os.getuid() == 0 else os.getuid()
+        with mock.patch.object(wordpress_install.shutil, "copyfileobj", side_effect=swap_after_first_file):
+            wordpress_install.extract_from_tar(self.archive, self.target, uid, os.getgid())
+        self.assertEqual(os.listdir(outside), [])
+        self.assertEqual(sorted(os.listdir(moved)), ["a.php", "b.php", "plugins"])
+        # directories are only handed over once everything has been written
+        self.assertEqual(owners, [os.getuid()])
+        self.assertEqual(os.stat(moved).st_uid, uid)
+        self.assertEqual(os.stat(os.path.join(moved, "plugins")).st_uid, uid)
+
+
+class TestWordpressConf(unittest.TestCase):
+
+    def test_generated_keys(self):
+        keys = wordpress_install.generate_wordpress_conf_keys().splitlines()
+        self.assertEqual(len(keys), len(wordpress_install.SALT_NAMES))
+        for name, line in zip(wordpress_install.SALT_NAMES, keys):
+            match = re.fullmatch(r"define\('(\w+)', +'([^'\\]{64})'\);", line)
+            self.assertIsNotNone(match, line)
+            self.assertEqual(match.group(1), name)
+        self.assertNotEqual(keys, wordpress_install.generate_wordpress_conf_keys().splitlines())
+
+    def test_conf_written_without_network(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "public_html", "wordpress"))
+            db_conf = {"db": "wp_alice", "user": "wp_alice", "password": "hunter2", "host": "db"}
+            with mock.patch("http_client.get", side_effect=AssertionError("no network")):
+                wordpress_install.create_wordpress_conf(tmp, db_conf)
+            with open(os.path.join(tmp, "public_html", "wordpress", "wp-config.php")) as fh:
+                conf = fh.read()
+        self.assertIn("define('DB_PASSWORD', 'hunter2');", conf)
+        self.assertIn("define('NONCE_SALT',", conf)
+        self.assertIs(wordpress_install._wordpress_conf_template(), wordpress_install._wordpress_conf_template())
+
+    def test_conf_does_not_follow_symlinks(self):
+        db_conf = {"db": "wp_alice", "user": "wp_alice", "password": "hunter2", "host": "db"}
+        with tempfile.TemporaryDirectory() as tmp:
+            wordpress = os.path.join(tmp, "public_html", "wordpress")
+            os.makedirs(wordpress)
+            shadow = os.path.join(tmp, "shadow")
+            with open(shadow, "w") as fh:
+                fh.write("root:*:")
+            os.symlink(shadow, os.path.join(wordpress, "wp-config.php"))
+            wordpress_install.create_wordpress_conf(tmp, db_conf)
+            with open(shadow) as fh:
+                self.assertEqual(fh.read(), "root:*:")
+            self.assertFalse(os.path.islink(os.path.join(wordpress, "wp-config.php")))
+
+            # nor a symlink in place of the wordpress directory
+            os.rename(wordpress, os.path.join(tmp, "elsewhere"))
+            outside = os.path.join(tmp, "outside")
+            os.mkdir(outside)
+            os.symlink(outside, wordpress)
+            with self.assertRaises(OSError):
+                wordpress_install.create_wordpress_conf(tmp, db_conf)
+            self.assertEqual(os.listdir(outside), [])